@@ -0,0 +1,116 @@
+"""
+Пакетная запись строк в таблицу через асинхронную очередь
+Строки копятся в памяти и пишутся одним многострочным INSERT
+по достижении размера пакета или по таймеру
+"""
+
+import asyncio
+from typing import List
+
+from sqlalchemy import Table, insert
+
+from database import async_engine
+
+
+class QueueFull(Exception):
+    """Очередь заполнена, а политика переполнения — reject"""
+
+
+class BatchWriter:
+    """Ограниченный буфер строк с фоновым сбросом пакетами"""
+
+    def __init__(
+        self,
+        table: Table,
+        batch_size: int = 500,
+        flush_interval: float = 1.0,
+        max_pending: int = 50000,
+        overflow: str = "drop",
+    ):
+        if overflow not in ("drop", "reject"):
+            raise ValueError(f"Unknown overflow policy: {overflow}")
+        self.table = table
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.overflow = overflow
+        self._rows: List[dict] = []
+        self._batch_ready = None
+        self._task = None
+        self._stopping = False
+        self.accepted = 0
+        self.dropped = 0
+        self.written = 0
+        self.batches = 0
+        self.failures = 0
+
+    def submit(self, rows: List[dict]) -> int:
+        """Поставить строки в очередь; вернуть количество принятых"""
+        free = self.max_pending - len(self._rows)
+        if len(rows) > free:
+            if self.overflow == "reject":
+                raise QueueFull()
+            self.dropped += len(rows) - max(free, 0)
+            rows = rows[:max(free, 0)]
+
+        self._rows.extend(rows)
+        self.accepted += len(rows)
+        if len(self._rows) >= self.batch_size and self._batch_ready is not None:
+            self._batch_ready.set()
+        return len(rows)
+
+    async def _write(self, rows: List[dict]):
+        try:
+            async with async_engine.begin() as conn:
+                await conn.execute(insert(self.table).values(rows))
+        except Exception:
+            self.failures += 1
+            self.dropped += len(rows)
+            raise
+        self.written += len(rows)
+        self.batches += 1
+
+    async def flush(self):
+        """Записать всё накопленное пакетами по batch_size"""
+        while self._rows:
+            rows = self._rows[:self.batch_size]
+            del self._rows[:self.batch_size]
+            await self._write(rows)
+
+    async def _run(self):
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._batch_ready.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._batch_ready.clear()
+            try:
+                await self.flush()
+            except Exception as exc:
+                print(f"⚠️ Batch insert into {self.table.name} failed: {exc}")
+
+    def start(self):
+        if self._task is None:
+            self._stopping = False
+            self._batch_ready = asyncio.Event()
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        """Остановить фоновую задачу и записать остаток очереди"""
+        if self._task is not None:
+            # Не отменяем задачу: отмена посреди INSERT потеряла бы пакет
+            self._stopping = True
+            self._batch_ready.set()
+            await self._task
+            self._task = None
+        await self.flush()
+
+    def stats(self) -> dict:
+        return {
+            "pending": len(self._rows),
+            "accepted": self.accepted,
+            "dropped": self.dropped,
+            "written": self.written,
+            "batches": self.batches,
+            "failures": self.failures,
+        }
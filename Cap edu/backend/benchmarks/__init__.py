@@ -0,0 +1,4 @@
+"""
+Нагрузочные бенчмарки QazKids
+Запуск из каталога backend: python -m benchmarks.<имя>
+"""
@@ -0,0 +1,78 @@
+"""
+Бенчмарк: приём аналитики по одному событию против пакетного /analytics/batch
+
+До: POST /analytics — INSERT + commit + refresh на каждое событие.
+После: POST /analytics/batch — события копятся в очереди и пишутся
+многострочными INSERT; время включает финальный сброс очереди.
+
+Запуск: python -m benchmarks.analytics_ingest [--events 5000] [--batch 100]
+"""
+
+import argparse
+import asyncio
+import time
+
+from benchmarks.common import use_temp_database
+
+use_temp_database("analytics_ingest")
+
+import httpx  # noqa: E402
+
+from database import SessionLocal, create_tables  # noqa: E402
+from models import User  # noqa: E402
+import fastapi_app  # noqa: E402
+
+
+def seed() -> str:
+    create_tables()
+    db = SessionLocal()
+    user = User(username="bench", email="bench@example.com", password_hash="x")
+    db.add(user)
+    db.commit()
+    token = fastapi_app.create_access_token(user.id)
+    db.close()
+    return token
+
+
+async def post_many(client, path: str, body, requests: int, concurrency: int, headers: dict):
+    remaining = iter(range(requests))
+
+    async def worker():
+        for _ in remaining:
+            response = await client.post(path, json=body, headers=headers)
+            response.raise_for_status()
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+
+
+async def main(events: int, batch: int, concurrency: int):
+    headers = {"Authorization": f"Bearer {seed()}"}
+    event = {"event_type": "game_start", "event_data": {"game_id": 1, "level": 3}}
+
+    async with httpx.AsyncClient(app=fastapi_app.app, base_url="http://bench") as client:
+        started = time.perf_counter()
+        await post_many(client, "/analytics", event, events, concurrency, headers)
+        single = time.perf_counter() - started
+
+        fastapi_app.analytics_writer.start()
+        started = time.perf_counter()
+        await post_many(
+            client, "/analytics/batch", {"events": [event] * batch}, events // batch, concurrency, headers
+        )
+        await fastapi_app.analytics_writer.stop()
+        batched = time.perf_counter() - started
+
+    print(f"{'mode':<20}{'events':>10}{'seconds':>10}{'events/sec':>14}")
+    print(f"{'single /analytics':<20}{events:>10}{single:>10.2f}{events / single:>14.0f}")
+    written = fastapi_app.analytics_writer.written
+    print(f"{'batch x' + str(batch):<20}{written:>10}{batched:>10.2f}{written / batched:>14.0f}")
+    print(f"queue: {fastapi_app.analytics_writer.stats()}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--events", type=int, default=5000)
+    parser.add_argument("--batch", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=10)
+    args = parser.parse_args()
+    asyncio.run(main(args.events, args.batch, args.concurrency))
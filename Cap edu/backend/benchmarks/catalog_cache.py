@@ -0,0 +1,63 @@
+"""
+Бенчмарк: каталожные endpoints с кэшем ответов и без него
+
+Запуск: python -m benchmarks.catalog_cache [--total 2000] [--concurrency 10]
+"""
+
+import argparse
+import asyncio
+from datetime import datetime
+
+from benchmarks.common import use_temp_database, run_load, print_table
+
+use_temp_database("catalog_cache")
+
+import httpx  # noqa: E402
+from sqlalchemy import insert  # noqa: E402
+
+from database import engine, create_tables  # noqa: E402
+from models import Game, Film, Content  # noqa: E402
+import fastapi_app  # noqa: E402
+
+PATHS = ("/games", "/games/1", "/films?limit=50", "/content?limit=50", "/content/article-1")
+
+
+def seed():
+    create_tables()
+    now = datetime.utcnow()
+    with engine.begin() as conn:
+        conn.execute(insert(Game), [
+            {"title": f"Game {i}", "category": "quiz", "difficulty": "easy", "description": "x" * 200}
+            for i in range(50)
+        ])
+        conn.execute(insert(Film), [
+            {"title": f"Film {i}", "category": "history", "video_url": f"https://example.com/{i}.mp4"}
+            for i in range(200)
+        ])
+        conn.execute(insert(Content), [
+            {"title": f"Article {i}", "slug": f"article-{i}", "body": "text " * 200,
+             "content_type": "article", "status": "published", "published_at": now}
+            for i in range(200)
+        ])
+
+
+async def main(total: int, concurrency: int):
+    seed()
+    results = {}
+    async with httpx.AsyncClient(app=fastapi_app.app, base_url="http://bench") as client:
+        for enabled in (False, True):
+            fastapi_app.catalog_cache.enabled = enabled
+            label = "cached" if enabled else "uncached"
+            for path in PATHS:
+                results[f"{label} {path}"] = await run_load(
+                    client, "GET", path, total=total, concurrency=concurrency
+                )
+    print_table(results)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--total", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=10)
+    args = parser.parse_args()
+    asyncio.run(main(args.total, args.concurrency))
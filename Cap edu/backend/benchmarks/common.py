@@ -0,0 +1,75 @@
+"""
+Общие утилиты для бенчмарков: временная БД и прогон нагрузки через httpx
+"""
+
+import asyncio
+import os
+import statistics
+import tempfile
+import time
+from typing import Dict, List, Optional
+
+
+def use_temp_database(name: str = "bench") -> str:
+    """Направить DATABASE_URL во временный SQLite файл (до импорта database)"""
+    if "DATABASE_URL" not in os.environ:
+        path = os.path.join(tempfile.mkdtemp(prefix="qazkids-"), f"{name}.db")
+        os.environ["DATABASE_URL"] = f"sqlite:///{path}"
+    return os.environ["DATABASE_URL"]
+
+
+def percentile(samples: List[float], pct: float) -> float:
+    """Перцентиль по отсортированной выборке (ближайший ранг)"""
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered))) - 1))
+    return ordered[index]
+
+
+def summarize(latencies: List[float], elapsed: float, errors: int = 0) -> Dict[str, float]:
+    """Сводка по прогону: запросы/сек и перцентили задержки в миллисекундах"""
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "rps": round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+        "mean_ms": round(statistics.fmean(latencies) * 1000, 2) if latencies else 0.0,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+    }
+
+
+async def run_load(
+    client,
+    method: str,
+    path: str,
+    total: int = 500,
+    concurrency: int = 20,
+    headers: Optional[dict] = None,
+    json_body=None,
+) -> Dict[str, float]:
+    """Выполнить total запросов с заданной конкурентностью и вернуть сводку"""
+    latencies: List[float] = []
+    errors = 0
+    remaining = iter(range(total))
+
+    async def worker():
+        nonlocal errors
+        for _ in remaining:
+            started = time.perf_counter()
+            response = await client.request(method, path, headers=headers, json=json_body)
+            latencies.append(time.perf_counter() - started)
+            if response.status_code >= 400:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return summarize(latencies, time.perf_counter() - started, errors)
+
+
+def print_table(rows: Dict[str, Dict[str, float]]):
+    """Напечатать результаты в виде простой таблицы"""
+    print(f"{'scenario':<28}{'rps':>10}{'p50 ms':>10}{'p99 ms':>10}{'errors':>8}")
+    for name, stats in rows.items():
+        print(f"{name:<28}{stats['rps']:>10}{stats['p50_ms']:>10}{stats['p99_ms']:>10}{stats['errors']:>8}")
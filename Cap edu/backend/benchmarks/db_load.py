@@ -0,0 +1,98 @@
+"""
+Бенчмарк: асинхронный слой БД против прежнего синхронного Session
+
+Сравнивает запросы/сек и p99 на /games, /progress и /locations.
+Синхронный вариант воспроизводит старые обработчики (async def + Session),
+которые блокируют event loop на каждом запросе к БД. При конкурентности
+выше размера пула синхронный вариант зависает: ожидание соединения
+блокирует тот самый loop, который должен вернуть соединение в пул.
+
+Запуск: python -m benchmarks.db_load [--total 1000] [--concurrency 10]
+"""
+
+import argparse
+import asyncio
+from typing import List, Optional
+
+from benchmarks.common import use_temp_database, run_load, print_table
+
+use_temp_database("db_load")
+
+import httpx  # noqa: E402
+from fastapi import FastAPI, Depends, Header, HTTPException  # noqa: E402
+from sqlalchemy.orm import Session  # noqa: E402
+
+from database import SessionLocal, get_db, create_tables  # noqa: E402
+from models import User, Game, Progress, Location  # noqa: E402
+from schemas import GameResponse, ProgressResponse, LocationResponse  # noqa: E402
+import fastapi_app  # noqa: E402
+
+
+def seed(locations: int = 2000) -> str:
+    """Создать пользователя, игры, прогресс и историю локаций; вернуть токен"""
+    create_tables()
+    db = SessionLocal()
+    user = User(username="bench", email="bench@example.com", password_hash="x", role="student")
+    db.add(user)
+    db.flush()
+    games = [Game(title=f"Game {i}", category="quiz", difficulty="easy", content="{}") for i in range(20)]
+    db.add_all(games)
+    db.flush()
+    db.add_all(Progress(user_id=user.id, game_id=g.id, score=50) for g in games)
+    db.add_all(
+        Location(user_id=user.id, latitude=43.2 + i * 1e-5, longitude=76.9, accuracy=10)
+        for i in range(locations)
+    )
+    db.commit()
+    token = fastapi_app.create_access_token(user.id)
+    db.close()
+    return token
+
+
+def build_sync_app() -> FastAPI:
+    """Приложение с прежними синхронными обработчиками тех же маршрутов"""
+    app = FastAPI()
+
+    def current_user(authorization: Optional[str] = Header(None), db: Session = Depends(get_db)) -> User:
+        user_id = fastapi_app.verify_token(authorization.replace("Bearer ", ""))
+        user = db.query(User).filter(User.id == user_id).first()
+        if user is None:
+            raise HTTPException(status_code=404, detail="User not found")
+        return user
+
+    @app.get("/games", response_model=List[GameResponse])
+    async def get_games(db: Session = Depends(get_db)):
+        return db.query(Game).all()
+
+    @app.get("/progress", response_model=List[ProgressResponse])
+    async def get_user_progress(user: User = Depends(current_user), db: Session = Depends(get_db)):
+        return db.query(Progress).filter(Progress.user_id == user.id).all()
+
+    @app.get("/locations", response_model=List[LocationResponse])
+    async def get_user_locations(user: User = Depends(current_user), db: Session = Depends(get_db)):
+        return db.query(Location).filter(Location.user_id == user.id).order_by(
+            Location.timestamp.desc()
+        ).limit(10).all()
+
+    return app
+
+
+async def main(total: int, concurrency: int):
+    token = seed()
+    headers = {"Authorization": f"Bearer {token}"}
+    results = {}
+    for label, app in (("sync", build_sync_app()), ("async", fastapi_app.app)):
+        async with httpx.AsyncClient(app=app, base_url="http://bench") as client:
+            for path in ("/games", "/progress", "/locations"):
+                results[f"{label} {path}"] = await run_load(
+                    client, "GET", path, total=total, concurrency=concurrency, headers=headers
+                )
+    print_table(results)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--total", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=10)
+    args = parser.parse_args()
+    asyncio.run(main(args.total, args.concurrency))
@@ -0,0 +1,112 @@
+"""
+Микробенчмарк: проверка GPS точек против 100k геозон
+
+Сравнивает сеточный индекс geofence.GeofenceIndex с линейным проходом по
+всем зонам. Зоны (круги и многоугольники 50-500 м) случайно разбросаны по
+городу и поделены между детьми; половина точек попадает рядом с зонами
+своего ребёнка, половина — в случайное место. Результаты индекса сверяются
+с линейным проходом на выборке точек.
+
+Запуск: python -m benchmarks.geofence_index [--fences 100000] [--children 10000] [--fixes 200000]
+"""
+
+import argparse
+import math
+import random
+import time
+
+from benchmarks.common import use_temp_database
+
+use_temp_database("geofence_index")
+
+from geo import METERS_PER_DEGREE  # noqa: E402
+from geofence import Fence, GeofenceIndex  # noqa: E402
+
+CENTER = (43.24, 76.95)  # Алматы
+SPREAD_DEG = 0.3
+
+
+def make_fences(count: int, children: int, rng: random.Random) -> list:
+    fences = []
+    for fence_id in range(1, count + 1):
+        user_id = rng.randrange(children)
+        latitude = CENTER[0] + rng.uniform(-SPREAD_DEG, SPREAD_DEG)
+        longitude = CENTER[1] + rng.uniform(-SPREAD_DEG, SPREAD_DEG)
+        size_m = rng.uniform(50, 500)
+        if rng.random() < 0.7:
+            fences.append(Fence(fence_id, user_id, f"zone {fence_id}", "circle", latitude, longitude, size_m))
+            continue
+        vertices = rng.randint(4, 8)
+        scale = size_m / METERS_PER_DEGREE
+        lon_scale = scale / math.cos(math.radians(latitude))
+        points = tuple(
+            (
+                latitude + scale * rng.uniform(0.5, 1.0) * math.sin(2 * math.pi * i / vertices),
+                longitude + lon_scale * rng.uniform(0.5, 1.0) * math.cos(2 * math.pi * i / vertices),
+            )
+            for i in range(vertices)
+        )
+        fences.append(Fence(fence_id, user_id, f"zone {fence_id}", "polygon", points=points))
+    return fences
+
+
+def make_fixes(fences: list, count: int, children: int, rng: random.Random) -> list:
+    fixes = []
+    for _ in range(count):
+        if rng.random() < 0.5:
+            fence = rng.choice(fences)
+            min_lat, min_lon, max_lat, max_lon = fence.bbox()
+            fixes.append((fence.user_id, rng.uniform(min_lat, max_lat), rng.uniform(min_lon, max_lon)))
+        else:
+            fixes.append((
+                rng.randrange(children),
+                CENTER[0] + rng.uniform(-SPREAD_DEG, SPREAD_DEG),
+                CENTER[1] + rng.uniform(-SPREAD_DEG, SPREAD_DEG),
+            ))
+    return fixes
+
+
+def linear_scan(fences: list, user_id: int, latitude: float, longitude: float) -> set:
+    return {fence.id for fence in fences if fence.user_id == user_id and fence.contains(latitude, longitude)}
+
+
+def main(fence_count: int, children: int, fix_count: int, linear_fixes: int, cell_deg: float, seed: int):
+    rng = random.Random(seed)
+    fences = make_fences(fence_count, children, rng)
+    fixes = make_fixes(fences, fix_count, children, rng)
+
+    started = time.perf_counter()
+    index = GeofenceIndex(cell_deg)
+    for fence in fences:
+        index.add(fence)
+    build = time.perf_counter() - started
+
+    started = time.perf_counter()
+    hits = sum(len(index.containing(user_id, latitude, longitude)) for user_id, latitude, longitude in fixes)
+    indexed = time.perf_counter() - started
+
+    sample = fixes[:linear_fixes]
+    started = time.perf_counter()
+    expected = [linear_scan(fences, *fix) for fix in sample]
+    linear = time.perf_counter() - started
+    mismatches = sum(index.containing(*fix) != result for fix, result in zip(sample, expected))
+
+    print(f"{fence_count} fences, {children} children, cell {cell_deg} deg, index built in {build:.2f} s")
+    print(f"{'mode':<10}{'fixes':>9}{'us/fix':>12}{'fixes/sec':>14}")
+    for mode, count, total in (("index", len(fixes), indexed), ("linear", len(sample), linear)):
+        print(f"{mode:<10}{count:>9}{total / count * 1e6:>12.2f}{count / total:>14.0f}")
+    print(f"fixes inside a zone: {hits} of {len(fixes)}, mismatches vs linear: {mismatches}")
+    if mismatches:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--fences", type=int, default=100000)
+    parser.add_argument("--children", type=int, default=10000)
+    parser.add_argument("--fixes", type=int, default=200000)
+    parser.add_argument("--linear-fixes", type=int, default=200, help="точек для линейного прохода (он медленный)")
+    parser.add_argument("--cell-deg", type=float, default=0.01)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    main(args.fences, args.children, args.fixes, args.linear_fixes, args.cell_deg, args.seed)
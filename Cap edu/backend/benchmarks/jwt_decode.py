@@ -0,0 +1,47 @@
+"""
+Микробенчмарк: стоимость проверки JWT с кэшем и без него
+
+Без кэша каждый вызов — полный jwt.decode с HMAC и разбором claims;
+с кэшем — sha256 от токена и поиск в LRU.
+
+Запуск: python -m benchmarks.jwt_decode [--iterations 100000] [--tokens 100]
+"""
+
+import argparse
+import timeit
+
+from benchmarks.common import use_temp_database
+
+use_temp_database("jwt_decode")
+
+import fastapi_app  # noqa: E402
+
+
+def main(iterations: int, tokens: int):
+    pool = [fastapi_app.create_access_token(user_id) for user_id in range(1, tokens + 1)]
+    cycle = iter(())
+
+    def next_token() -> str:
+        nonlocal cycle
+        try:
+            return next(cycle)
+        except StopIteration:
+            cycle = iter(pool)
+            return next(cycle)
+
+    uncached = timeit.timeit(lambda: fastapi_app.decode_token(next_token()), number=iterations)
+    fastapi_app.token_cache.clear()
+    cached = timeit.timeit(lambda: fastapi_app.verify_token(next_token()), number=iterations)
+
+    print(f"{'mode':<12}{'us/call':>10}{'calls/sec':>14}")
+    for mode, total in (("no cache", uncached), ("cache", cached)):
+        print(f"{mode:<12}{total / iterations * 1e6:>10.2f}{iterations / total:>14.0f}")
+    print(f"token cache: {fastapi_app.token_cache.stats()}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--iterations", type=int, default=100000)
+    parser.add_argument("--tokens", type=int, default=100)
+    args = parser.parse_args()
+    main(args.iterations, args.tokens)
@@ -0,0 +1,91 @@
+"""
+Бенчмарк: топ-10 и «моё место» по заранее собранным таблицам и запросом к БД
+
+Заполняет progress случайными результатами (--users пользователей по
+--games-per-user играм из --games), собирает таблицы Leaderboards.rebuild
+и сравнивает время ответа (топ + место случайного пользователя) из
+таблиц в памяти с расчётом по progress на лету (ORDER BY / GROUP BY),
+который используется, пока таблицы недоступны. Результаты обоих способов
+сверяются.
+
+Запуск: python -m benchmarks.leaderboard [--users 20000] [--games 50] [--games-per-user 10]
+"""
+
+import argparse
+import asyncio
+import random
+import time
+
+from benchmarks.common import use_temp_database
+
+use_temp_database("leaderboard")
+
+from sqlalchemy import insert  # noqa: E402
+
+from database import engine, create_tables, AsyncSessionLocal  # noqa: E402
+from leaderboard import Leaderboards  # noqa: E402
+from models import Game, Progress, User  # noqa: E402
+
+
+def seed(users: int, games: int, per_user: int, rng: random.Random):
+    create_tables()
+    with engine.begin() as conn:
+        conn.execute(insert(Game), [{"title": f"game {i}", "category": "quiz"} for i in range(games)])
+        conn.execute(insert(User), [
+            {"username": f"kid{i}", "email": f"kid{i}@example.com", "password_hash": "x", "age": rng.randint(3, 17)}
+            for i in range(users)
+        ])
+        conn.execute(insert(Progress), [
+            {"user_id": user_id, "game_id": game_id, "score": rng.randint(1, 100)}
+            for user_id in range(1, users + 1)
+            for game_id in rng.sample(range(1, games + 1), per_user)
+        ])
+
+
+async def timed(boards: Leaderboards, board: str, user_ids: list) -> tuple:
+    results = []
+    async with AsyncSessionLocal() as db:
+        started = time.perf_counter()
+        for user_id in user_ids:
+            results.append(await boards.board(db, board, user_id, 10))
+        elapsed = time.perf_counter() - started
+    return elapsed / len(user_ids), results
+
+
+async def main(users: int, games: int, per_user: int, queries: int, seed_value: int):
+    rng = random.Random(seed_value)
+    seed(users, games, per_user, rng)
+    boards = Leaderboards.from_env()
+
+    started = time.perf_counter()
+    await boards.rebuild()
+    print(f"{users} users, {users * per_user} progress rows, boards rebuilt in {time.perf_counter() - started:.2f} s")
+
+    user_ids = [rng.randint(1, users) for _ in range(queries)]
+    print(f"{'board':<12}{'boards ms':>12}{'db ms':>10}{'speedup':>10}")
+    mismatches = 0
+    for board in ("global", "game:1", f"age:{next(iter(boards.age_bands))}"):
+        precomputed, expected = await timed(boards, board, user_ids)
+        boards._ready = False
+        on_demand, actual = await timed(boards, board, user_ids)
+        boards._ready = True
+        mismatches += sum(
+            [(user_id, int(score)) for user_id, score in top_a] != [(user_id, int(score)) for user_id, score in top_b]
+            or (mine_a and (mine_a[0], int(mine_a[1]))) != (mine_b and (mine_b[0], int(mine_b[1])))
+            for (top_a, mine_a), (top_b, mine_b) in zip(expected, actual)
+        )
+        print(f"{board:<12}{precomputed * 1000:>12.3f}{on_demand * 1000:>10.2f}{on_demand / precomputed:>9.0f}x")
+    print(f"mismatches vs db: {mismatches}")
+    if mismatches:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--users", type=int, default=20000)
+    parser.add_argument("--games", type=int, default=50)
+    parser.add_argument("--games-per-user", type=int, default=10)
+    parser.add_argument("--queries", type=int, default=50, help="запросов топ + место на таблицу")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    asyncio.run(main(args.users, args.games, args.games_per_user, args.queries, args.seed))
@@ -0,0 +1,124 @@
+"""
+Бенчмарк: размер и время ответа GET /locations/track за сутки трекинга
+
+Синтетический день ребёнка: точка каждые --interval секунд, прогулки по
+городу чередуются со стоянками (дом, школа) с GPS дрожанием 3-8 м.
+Сравнивается полный список точек (как отдавала бы история в формате
+LocationResponse) с упрощённым треком при разных допусках, а также время
+Douglas-Peucker с NumPy и без него.
+
+Запуск: python -m benchmarks.track_compression [--interval 5] [--tolerances 0 5 10 25]
+"""
+
+import argparse
+import asyncio
+import math
+import random
+import time
+from datetime import datetime, timedelta
+
+from benchmarks.common import use_temp_database
+
+use_temp_database("track_compression")
+
+import httpx  # noqa: E402
+import orjson  # noqa: E402
+from sqlalchemy import insert, select  # noqa: E402
+
+import geo  # noqa: E402
+from database import engine, create_tables  # noqa: E402
+from models import Location, User  # noqa: E402
+import fastapi_app  # noqa: E402
+
+DAY = datetime(2025, 3, 3)
+
+
+def synthetic_day(interval: int, rng: random.Random) -> list:
+    """[(lat, lon, timestamp)]: стоянки 30-180 минут и переходы со скоростью пешехода/автобуса"""
+    fixes = []
+    latitude, longitude = 43.24, 76.95
+    moment = DAY
+    while moment < DAY + timedelta(days=1):
+        if rng.random() < 0.5:
+            for _ in range(rng.randint(30, 180) * 60 // interval):
+                jitter = rng.uniform(3, 8) / geo.METERS_PER_DEGREE
+                fixes.append((latitude + rng.gauss(0, jitter), longitude + rng.gauss(0, jitter), moment))
+                moment += timedelta(seconds=interval)
+        else:
+            heading = rng.uniform(0, 2 * math.pi)
+            speed = rng.choice((1.4, 8.0))  # м/с
+            for _ in range(rng.randint(10, 40) * 60 // interval):
+                heading += rng.gauss(0, 0.15)
+                step = speed * interval / geo.METERS_PER_DEGREE
+                latitude += step * math.cos(heading)
+                longitude += step * math.sin(heading) / math.cos(math.radians(latitude))
+                fixes.append((latitude, longitude, moment))
+                moment += timedelta(seconds=interval)
+    return [fix for fix in fixes if fix[2] < DAY + timedelta(days=1)]
+
+
+def seed(fixes: list) -> int:
+    create_tables()
+    with engine.begin() as conn:
+        user_id = conn.execute(insert(User).values(
+            username="track_bench", email="track_bench@example.com", password_hash="x", role="parent"
+        )).inserted_primary_key[0]
+        conn.execute(insert(Location), [
+            {"user_id": user_id, "latitude": lat, "longitude": lon, "accuracy": 5.0, "timestamp": moment}
+            for lat, lon, moment in fixes
+        ])
+    return user_id
+
+
+def raw_history_bytes(user_id: int) -> int:
+    """Все точки суток в формате LocationResponse"""
+    with engine.connect() as conn:
+        rows = conn.execute(select(Location).where(Location.user_id == user_id)).all()
+    return len(orjson.dumps([
+        {"latitude": row.latitude, "longitude": row.longitude, "accuracy": row.accuracy,
+         "id": row.id, "timestamp": row.timestamp}
+        for row in rows
+    ]))
+
+
+async def main(interval: int, tolerances: list, seed_value: int):
+    fixes = synthetic_day(interval, random.Random(seed_value))
+    user_id = seed(fixes)
+    raw = raw_history_bytes(user_id)
+    headers = {"Authorization": f"Bearer {fastapi_app.create_access_token(user_id)}"}
+    params = {"from": DAY.isoformat(), "to": (DAY + timedelta(days=1)).isoformat()}
+
+    print(f"{len(fixes)} fixes, raw history {raw / 1024:.0f} KiB")
+    print(f"{'tolerance m':<14}{'kept':>8}{'KiB':>10}{'ratio':>8}{'ms':>9}")
+    async with httpx.AsyncClient(app=fastapi_app.app, base_url="http://bench") as client:
+        for tolerance in tolerances:
+            started = time.perf_counter()
+            response = await client.get(
+                "/locations/track", params={**params, "tolerance_m": tolerance}, headers=headers
+            )
+            elapsed = time.perf_counter() - started
+            response.raise_for_status()
+            kept = sum(segment["kept"] for segment in response.json()["segments"])
+            size = len(response.content)
+            print(f"{tolerance:<14}{kept:>8}{size / 1024:>10.1f}{raw / size:>8.1f}{elapsed * 1000:>9.1f}")
+
+    latitudes = [fix[0] for fix in fixes]
+    longitudes = [fix[1] for fix in fixes]
+    numpy = geo.np
+    for label in ("numpy", "python"):
+        if label == "numpy" and numpy is None:
+            continue
+        geo.np = numpy if label == "numpy" else None
+        started = time.perf_counter()
+        geo.simplify_track(latitudes, longitudes, 10.0)
+        print(f"simplify_track ({label}): {(time.perf_counter() - started) * 1000:.1f} ms")
+    geo.np = numpy
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--interval", type=int, default=5, help="секунд между точками")
+    parser.add_argument("--tolerances", type=float, nargs="+", default=[0, 5, 10, 25])
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    asyncio.run(main(args.interval, args.tolerances, args.seed))
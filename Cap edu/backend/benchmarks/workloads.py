@@ -0,0 +1,385 @@
+"""
+Бенчмарк: смешанная нагрузка по сценариям с воспроизводимыми профилями
+
+Поднимает fastapi_app:app в процессе (со startup/shutdown) против базы,
+заполненной seed.py (временный SQLite или DATABASE_URL, например локальный
+PostgreSQL), и параллельно гоняет сценарии:
+
+    login_burst       — одновременные POST /auth/login
+    game_session      — игра: каталог, контент, прогресс и аналитика
+    parent_gps        — пакет GPS точек ребёнка и опрос родителем его позиций
+    catalog_browsing  — фильмы и статьи с курсорами и ревалидацией ETag
+
+По каждому endpoint записываются пропускная способность и p50/p95/p99.
+Результат сохраняется в JSON; --compare сравнивает с прошлым прогоном
+и завершается с кодом 1 при регрессии p95 больше --max-regression.
+
+Запуск:
+    python -m benchmarks.workloads --profile standard --output bench.json
+    python -m benchmarks.workloads --profile standard --compare bench.json
+    python -m benchmarks.workloads --url http://localhost:8000  # внешний сервер, та же БД
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+from collections import Counter, defaultdict
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from benchmarks.common import use_temp_database, summarize
+
+use_temp_database("workloads")
+# bcrypt на 12 раундах превратил бы login_burst в тест CPU; профиль может переопределить
+os.environ.setdefault("BCRYPT_ROUNDS", "8")
+
+import httpx  # noqa: E402
+from sqlalchemy import select  # noqa: E402
+from sqlalchemy.orm import aliased  # noqa: E402
+
+from database import engine  # noqa: E402
+from models import Base, User, Film, Content  # noqa: E402
+from migrations import upgrade  # noqa: E402
+import seed  # noqa: E402
+
+# сценарий -> (сессий, одновременных сессий)
+PROFILES = {
+    "smoke": {
+        "preset": "small",
+        "login_burst": (20, 20),
+        "game_session": (50, 5),
+        "parent_gps": (50, 5),
+        "catalog_browsing": (100, 10),
+    },
+    "standard": {
+        "preset": "small",
+        "login_burst": (100, 50),
+        "game_session": (500, 20),
+        "parent_gps": (500, 20),
+        "catalog_browsing": (1000, 30),
+    },
+    "heavy": {
+        "preset": "medium",
+        "login_burst": (300, 100),
+        "game_session": (2000, 50),
+        "parent_gps": (2000, 50),
+        "catalog_browsing": (4000, 80),
+    },
+}
+
+
+class Recorder:
+    """Задержки и коды ответов по endpoint (метод + шаблон пути)"""
+
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.statuses: Dict[str, Counter] = defaultdict(Counter)
+
+    async def call(self, client: httpx.AsyncClient, label: str, method: str, path: str, **kwargs) -> httpx.Response:
+        started = time.perf_counter()
+        response = await client.request(method, path, **kwargs)
+        self.latencies[label].append(time.perf_counter() - started)
+        self.statuses[label][response.status_code] += 1
+        return response
+
+    def report(self, elapsed: float) -> Dict[str, dict]:
+        report = {}
+        for label in sorted(self.latencies):
+            statuses = self.statuses[label]
+            errors = sum(count for code, count in statuses.items() if code >= 400)
+            report[label] = {
+                **summarize(self.latencies[label], elapsed, errors),
+                "statuses": {str(code): count for code, count in sorted(statuses.items())},
+            }
+        return report
+
+
+# === СЦЕНАРИИ ===
+async def login_burst(client, rec: Recorder, rng: random.Random, user: dict):
+    await rec.call(client, "POST /auth/login", "POST", "/auth/login",
+                   json={"email": user["email"], "password": seed.LOAD_PASSWORD})
+
+
+async def game_session(client, rec: Recorder, rng: random.Random, user: dict):
+    headers = user["headers"]
+    games = (await rec.call(client, "GET /games", "GET", "/games")).json()
+    game_id = rng.choice(games)["id"]
+    await rec.call(client, "GET /games/{id}", "GET", f"/games/{game_id}")
+    await rec.call(client, "GET /games/{id}/content", "GET", f"/games/{game_id}/content",
+                   headers={"Accept-Encoding": "gzip"})
+    await rec.call(client, "POST /analytics", "POST", "/analytics", headers=headers,
+                   json={"event_type": "game_start", "event_data": {"game_id": game_id}})
+    for level in range(1, 4):
+        await rec.call(client, "POST /progress", "POST", "/progress", headers=headers,
+                       json={"game_id": game_id, "score": rng.randint(20 * level, 100)})
+    events = [
+        {"event_type": "level_complete", "event_data": {"game_id": game_id, "level": level}}
+        for level in range(1, 6)
+    ]
+    await rec.call(client, "POST /analytics/batch", "POST", "/analytics/batch", headers=headers,
+                   json={"events": events})
+    await rec.call(client, "GET /progress", "GET", "/progress", headers=headers)
+
+
+async def parent_gps(client, rec: Recorder, rng: random.Random, parent: dict):
+    child = rng.choice(parent["children"])
+    lat, lon = rng.choice(seed.HOME_AREAS)
+    moment = time.time() - 600
+    fixes = []
+    for _ in range(20):
+        lat += rng.gauss(0, 0.0004)
+        lon += rng.gauss(0, 0.0005)
+        moment += 30
+        fixes.append([lat, lon, rng.uniform(3, 40), moment])
+    # Телефон ребёнка выгружает накопленные точки
+    await rec.call(client, "POST /locations/batch", "POST", "/locations/batch", headers=child["headers"],
+                   json={"fixes": fixes})
+    # Родитель открыл карту: позиции всех детей, затем опрос выбранного и его маршрут
+    headers = parent["headers"]
+    child_ids = [linked["id"] for linked in parent["children"]]
+    await rec.call(client, "GET /locations/latest/batch", "GET", "/locations/latest/batch", headers=headers,
+                   params={"child_id": child_ids})
+    for _ in range(3):
+        await rec.call(client, "GET /locations/latest", "GET", "/locations/latest", headers=headers,
+                       params={"child_id": child["id"]})
+    since = datetime.utcfromtimestamp(time.time() - 3600).isoformat()
+    await rec.call(client, "GET /locations/track", "GET", "/locations/track", headers=headers,
+                   params={"child_id": child["id"], "from": since})
+
+
+async def catalog_browsing(client, rec: Recorder, rng: random.Random, user: dict):
+    first = await rec.call(client, "GET /films", "GET", "/films?limit=20")
+    cursor = first.headers.get("X-Next-Cursor")
+    if cursor:
+        await rec.call(client, "GET /films", "GET", f"/films?limit=20&cursor={cursor}")
+    films = first.json()
+    if films:
+        await rec.call(client, "GET /films/{id}", "GET", f"/films/{rng.choice(films)['id']}")
+    articles = (await rec.call(client, "GET /content", "GET", "/content?limit=20")).json()
+    if articles:
+        await rec.call(client, "GET /content/{slug}", "GET", f"/content/{rng.choice(articles)['slug']}")
+    # Повторный заход с ETag из кэша браузера
+    games = await rec.call(client, "GET /games", "GET", "/games")
+    etag = games.headers.get("ETag")
+    if etag:
+        await rec.call(client, "GET /games (revalidate)", "GET", "/games", headers={"If-None-Match": etag})
+
+
+SCENARIOS = {
+    "login_burst": login_burst,
+    "game_session": game_session,
+    "parent_gps": parent_gps,
+    "catalog_browsing": catalog_browsing,
+}
+
+
+# === ПОДГОТОВКА ===
+def prepare_database(preset: str, seed_value: int):
+    with engine.begin() as conn:
+        Base.metadata.create_all(bind=conn)
+        upgrade(conn)
+        seed.seed_games(conn)
+        seed.seed_films(conn)
+        seed.seed_content(conn)
+    seed.seed_load(preset, seed_value)
+    # Каталог для пагинации фильмов и статей
+    with engine.begin() as conn:
+        films = [
+            {**film, "title": f"{film['title']} #{i}"}
+            for i in range(1, 26) for film in seed.FILMS
+        ]
+        seed.upsert_by_key(conn, Film.__table__, "title", films, insert_only=("views",))
+        articles = [
+            {**item, "slug": f"{item['slug']}-{i}", "published_at": datetime(2025, 1, 1)}
+            for i in range(1, 26) for item in seed.CONTENT
+        ]
+        seed.upsert_by_key(conn, Content.__table__, "slug", articles, insert_only=("published_at",))
+
+
+def load_users(limit: int) -> List[dict]:
+    from fastapi_app import create_access_token
+
+    with engine.connect() as conn:
+        rows = conn.execute(
+            select(User.id, User.email)
+            .where(User.username.like(f"{seed.LOAD_USER_PREFIX}%") & User.is_active.is_(True))
+            .order_by(User.id)
+            .limit(limit)
+        ).all()
+    # Токены выпускаются напрямую: логин проверяется только в login_burst
+    return [
+        {"id": row.id, "email": row.email, "headers": {"Authorization": f"Bearer {create_access_token(row.id)}"}}
+        for row in rows
+    ]
+
+
+def load_parents(limit: int) -> List[dict]:
+    """Активные родители с привязанными детьми (seed.link_children) для parent_gps"""
+    from fastapi_app import create_access_token
+
+    parent = aliased(User)
+    with engine.connect() as conn:
+        rows = conn.execute(
+            select(User.parent_id, User.id)
+            .join(parent, parent.id == User.parent_id)
+            .where(
+                User.username.like(f"{seed.LOAD_USER_PREFIX}%"),
+                User.is_active.is_(True),
+                parent.is_active.is_(True)
+            )
+            .order_by(User.parent_id, User.id)
+        ).all()
+    children = defaultdict(list)
+    for parent_id, child_id in rows:
+        children[parent_id].append(child_id)
+
+    def headers(user_id: int) -> dict:
+        return {"Authorization": f"Bearer {create_access_token(user_id)}"}
+
+    return [
+        {"id": parent_id, "headers": headers(parent_id),
+         "children": [{"id": child_id, "headers": headers(child_id)} for child_id in child_ids]}
+        for parent_id, child_ids in list(children.items())[:limit]
+    ]
+
+
+async def run_scenario(
+    name: str,
+    client,
+    rec: Recorder,
+    users: List[dict],
+    sessions: int,
+    concurrency: int,
+    seed_value: int
+) -> dict:
+    scenario = SCENARIOS[name]
+    remaining = iter(range(sessions))
+    failures = 0
+
+    async def worker():
+        nonlocal failures
+        for i in remaining:
+            rng = random.Random(f"{seed_value}:{name}:{i}")
+            try:
+                await scenario(client, rec, rng, users[i % len(users)])
+            except (httpx.HTTPError, ValueError, KeyError, IndexError):
+                failures += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    return {"sessions": sessions, "concurrency": concurrency, "failed_sessions": failures,
+            "seconds": round(elapsed, 2), "sessions_per_sec": round(sessions / elapsed, 1)}
+
+
+async def run(profile_name: str, seed_value: int, url: Optional[str]) -> dict:
+    profile = PROFILES[profile_name]
+    if url is None:
+        prepare_database(profile["preset"], seed_value)
+    users = load_users(max(profile[name][0] for name in SCENARIOS))
+    # parent_gps ходит от имени родителей, остальные сценарии — от любых пользователей
+    pools = {"parent_gps": load_parents(profile["parent_gps"][0])}
+    if not pools["parent_gps"]:
+        raise SystemExit("No parents with linked children: run python seed.py --preset small")
+
+    if url is None:
+        import fastapi_app
+
+        app = fastapi_app.app
+        await app.router.startup()
+        client = httpx.AsyncClient(app=app, base_url="http://bench", timeout=60)
+    else:
+        client = httpx.AsyncClient(base_url=url, timeout=60)
+
+    rec = Recorder()
+    try:
+        started = time.perf_counter()
+        scenarios = await asyncio.gather(*(
+            run_scenario(name, client, rec, pools.get(name, users), *profile[name], seed_value) for name in SCENARIOS
+        ))
+        elapsed = time.perf_counter() - started
+    finally:
+        await client.aclose()
+        if url is None:
+            await app.router.shutdown()
+
+    total = [latency for latencies in rec.latencies.values() for latency in latencies]
+    return {
+        "meta": {
+            "profile": profile_name,
+            "seed": seed_value,
+            "database": engine.dialect.name,
+            "target": url or "in-process",
+            "commit": _git_commit(),
+            "python": platform.python_version(),
+            "started_at": datetime.utcnow().isoformat(),
+        },
+        "total": summarize(total, elapsed, sum(stats["errors"] for stats in rec.report(elapsed).values())),
+        "scenarios": dict(zip(SCENARIOS, scenarios)),
+        "endpoints": rec.report(elapsed),
+    }
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+# === ВЫВОД ===
+def print_report(result: dict):
+    print(f"{'endpoint':<30}{'requests':>9}{'rps':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'errors':>8}")
+    for label, stats in result["endpoints"].items():
+        print(f"{label:<30}{stats['requests']:>9}{stats['rps']:>9}{stats['p50_ms']:>9}"
+              f"{stats['p95_ms']:>9}{stats['p99_ms']:>9}{stats['errors']:>8}")
+    total = result["total"]
+    print(f"{'TOTAL':<30}{total['requests']:>9}{total['rps']:>9}{total['p50_ms']:>9}"
+          f"{total['p95_ms']:>9}{total['p99_ms']:>9}{total['errors']:>8}")
+
+
+def compare(result: dict, baseline: dict, max_regression: float) -> int:
+    """Сравнить p95 и rps с прошлым прогоном; вернуть число регрессий"""
+    print(f"\nvs {baseline['meta'].get('commit')} ({baseline['meta'].get('profile')})")
+    print(f"{'endpoint':<30}{'p95 was':>10}{'p95 now':>10}{'change':>9}{'rps change':>12}")
+    regressions = 0
+    for label, stats in result["endpoints"].items():
+        before = baseline["endpoints"].get(label)
+        if not before or not before["p95_ms"]:
+            continue
+        change = (stats["p95_ms"] - before["p95_ms"]) / before["p95_ms"] * 100
+        rps_change = (stats["rps"] - before["rps"]) / before["rps"] * 100 if before["rps"] else 0.0
+        flag = ""
+        if change > max_regression:
+            regressions += 1
+            flag = "  REGRESSION"
+        print(f"{label:<30}{before['p95_ms']:>10}{stats['p95_ms']:>10}{change:>+8.1f}%{rps_change:>+11.1f}%{flag}")
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--profile", choices=list(PROFILES), default="standard")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--url", help="внешний сервер вместо приложения в процессе (БД уже заполнена)")
+    parser.add_argument("--output", help="записать результат в JSON")
+    parser.add_argument("--compare", help="JSON прошлого прогона для сравнения")
+    parser.add_argument("--max-regression", type=float, default=20.0, help="допустимый рост p95, %%")
+    args = parser.parse_args()
+
+    outcome = asyncio.run(run(args.profile, args.seed, args.url))
+    print_report(outcome)
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(outcome, file, indent=2, ensure_ascii=False)
+        print(f"\n✅ Results written to {args.output}")
+    if args.compare:
+        with open(args.compare) as file:
+            sys.exit(1 if compare(outcome, json.load(file), args.max_regression) else 0)
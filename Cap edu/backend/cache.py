@@ -0,0 +1,85 @@
+"""
+Кэширование в памяти процесса и опциональный Redis
+"""
+
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, Optional
+
+try:
+    import redis.asyncio as aioredis
+    from redis.exceptions import RedisError
+except ImportError:  # Redis не обязателен для локальной разработки
+    aioredis = None
+
+    class RedisError(Exception):
+        pass
+
+REDIS_URL = os.getenv("REDIS_URL")
+REDIS_RETRY_SECONDS = 30.0
+
+_redis = None
+_redis_down_until = 0.0
+
+
+class TTLCache:
+    """LRU кэш с ограничением размера и временем жизни записей"""
+
+    def __init__(self, maxsize: int = 10000, ttl: float = 60.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        entry = self._data.get(key)
+        if entry is None:
+            self.misses += 1
+            return default
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            del self._data[key]
+            self.misses += 1
+            return default
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None):
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        self._data[key] = (expires_at, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def pop(self, key: Hashable):
+        self._data.pop(key, None)
+
+    def clear(self):
+        self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> dict:
+        return {"size": len(self._data), "hits": self.hits, "misses": self.misses}
+
+
+def get_redis():
+    """Общий асинхронный клиент Redis или None, если Redis не настроен/недоступен"""
+    global _redis
+    if aioredis is None or not REDIS_URL:
+        return None
+    if time.monotonic() < _redis_down_until:
+        return None
+    if _redis is None:
+        _redis = aioredis.from_url(REDIS_URL, socket_timeout=0.2, socket_connect_timeout=0.2)
+    return _redis
+
+
+def mark_redis_down():
+    """Временно отключить Redis после ошибки, чтобы не платить таймаут на каждом запросе"""
+    global _redis_down_until
+    _redis_down_until = time.monotonic() + REDIS_RETRY_SECONDS
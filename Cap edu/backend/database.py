@@ -2,7 +2,9 @@
 
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
 from dotenv import load_dotenv
+import orjson
 import os
 
 load_dotenv()
@@ -13,27 +15,75 @@ DATABASE_URL = os.getenv(
     "sqlite:///./qazkids.db"  # SQLite по умолчанию для локальной разработки
 )
 
+
+def to_async_url(url: str) -> str:
+    """Преобразовать URL синхронного драйвера в URL асинхронного"""
+    if url.startswith("postgresql+asyncpg://") or url.startswith("sqlite+aiosqlite://"):
+        return url
+    if url.startswith("postgresql"):
+        # postgresql:// и postgresql+psycopg2:// -> asyncpg
+        return "postgresql+asyncpg://" + url.split("://", 1)[1]
+    if url.startswith("sqlite"):
+        return "sqlite+aiosqlite://" + url.split("://", 1)[1]
+    return url
+
+
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL", to_async_url(DATABASE_URL))
+
+
+def json_serializer(value) -> str:
+    """Сериализация JSON/JSONB колонок через orjson (быстрее стандартного json)"""
+    return orjson.dumps(value).decode()
+
+
+# Общие настройки JSON для синхронного и асинхронного движков
+JSON_OPTIONS = {"json_serializer": json_serializer, "json_deserializer": orjson.loads}
+
 # Если используется PostgreSQL
 if "postgresql" in DATABASE_URL:
     engine = create_engine(
         DATABASE_URL,
         pool_size=20,
         max_overflow=0,
-        pool_pre_ping=True
+        pool_pre_ping=True,
+        **JSON_OPTIONS
+    )
+    async_engine = create_async_engine(
+        ASYNC_DATABASE_URL,
+        pool_size=20,
+        max_overflow=0,
+        pool_pre_ping=True,
+        **JSON_OPTIONS
     )
 else:
     # SQLite для разработки
     engine = create_engine(
         DATABASE_URL,
         connect_args={"check_same_thread": False},
-        echo=False
+        echo=False,
+        **JSON_OPTIONS
+    )
+    async_engine = create_async_engine(
+        ASYNC_DATABASE_URL,
+        connect_args={"check_same_thread": False},
+        echo=False,
+        **JSON_OPTIONS
     )
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# expire_on_commit=False: после commit объекты остаются доступными
+# без ленивой подгрузки, которая невозможна в асинхронном контексте
+AsyncSessionLocal = async_sessionmaker(
+    async_engine,
+    class_=AsyncSession,
+    autoflush=False,
+    expire_on_commit=False
+)
+
 
 def get_db():
-    """Dependency для получения сессии БД"""
+    """Dependency для получения сессии БД (синхронная, для скриптов)"""
     db = SessionLocal()
     try:
         yield db
@@ -41,7 +91,20 @@ def get_db():
         db.close()
 
 
+async def get_async_db():
+    """Dependency для получения асинхронной сессии БД (для endpoints)"""
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
 def create_tables():
     """Создание всех таблиц"""
     from models import Base
     Base.metadata.create_all(bind=engine)
+
+
+async def create_tables_async():
+    """Создание всех таблиц через асинхронный движок"""
+    from models import Base
+    async with async_engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
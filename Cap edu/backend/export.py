@@ -0,0 +1,278 @@
+"""
+Выгрузка analytics, locations и progress в Parquet для офлайн отчётов
+Строки читаются серверным курсором порциями по EXPORT_CHUNK_SIZE, каждая
+порция сразу пишется в отдельный файл, поэтому память не зависит от
+размера таблицы. Файлы раскладываются по датам (Hive разметка):
+
+    <EXPORT_DIR>/analytics/date=2025-01-31/part-000000000123.parquet
+
+analytics и locations выгружаются инкрементально: последний выгруженный id
+сохраняется в <EXPORT_DIR>/_state.json после каждой порции, и следующий
+запуск продолжает с него. В PostgreSQL параллельные транзакции коммитят id
+не по порядку: меньший id, закоммиченный позже, был бы пропущен навсегда.
+Поэтому граница выгрузки — max(id) на старте, но только после того, как
+завершатся транзакции, открытые в этот момент (по pg_current_snapshot),
+и не дольше EXPORT_SAFETY_LAG секунд. В SQLite один писатель, ждать
+не нужно. progress обновляется на месте (upsert), поэтому выгружается
+целиком в снимок snapshot=<дата>.
+
+Запуск вручную: python export.py [--tables analytics locations] [--dir exports]
+"""
+
+import asyncio
+import os
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict, List, Optional
+
+import orjson
+from sqlalchemy import JSON, Boolean, DateTime, Float, Integer, Table, func, select, text
+from sqlalchemy.engine import Connection, Engine
+
+from models import Analytics, Location, Progress
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # pyarrow нужен только для выгрузки
+    pa = None
+
+EXPORT_DIR = os.getenv("EXPORT_DIR", "./exports")
+EXPORT_CHUNK_SIZE = int(os.getenv("EXPORT_CHUNK_SIZE", "50000"))
+# Дольше этого транзакции вставки (BatchWriter, обработчики запросов) не живут
+EXPORT_SAFETY_LAG = float(os.getenv("EXPORT_SAFETY_LAG", "60"))
+EXPORT_POLL_INTERVAL = 0.2
+STATE_FILE = "_state.json"
+NULL_PARTITION = "__HIVE_DEFAULT_PARTITION__"
+
+# имя выгрузки -> (модель, колонка времени для разметки по датам или None для снимка)
+EXPORTS = {
+    "analytics": (Analytics, "timestamp"),
+    "locations": (Location, "timestamp"),
+    "progress": (Progress, None),
+}
+
+
+class ExportUnavailable(Exception):
+    pass
+
+
+class ExportStopped(Exception):
+    pass
+
+
+def arrow_schema(table: Table) -> "pa.Schema":
+    fields = []
+    for column in table.columns:
+        if isinstance(column.type, Boolean):
+            arrow_type = pa.bool_()
+        elif isinstance(column.type, Integer):
+            arrow_type = pa.int64()
+        elif isinstance(column.type, Float):
+            arrow_type = pa.float64()
+        elif isinstance(column.type, DateTime):
+            arrow_type = pa.timestamp("us")
+        else:
+            # строки и JSON документы (как текст)
+            arrow_type = pa.string()
+        fields.append(pa.field(column.name, arrow_type))
+    return pa.schema(fields)
+
+
+def load_state(directory: str) -> Dict[str, dict]:
+    try:
+        with open(os.path.join(directory, STATE_FILE), "rb") as file:
+            return orjson.loads(file.read())
+    except FileNotFoundError:
+        return {}
+
+
+def save_state(directory: str, state: Dict[str, dict]):
+    path = os.path.join(directory, STATE_FILE)
+    with open(path + ".tmp", "wb") as file:
+        file.write(orjson.dumps(state, option=orjson.OPT_INDENT_2))
+    os.replace(path + ".tmp", path)
+
+
+def _oldest_running_xid(conn: Connection) -> int:
+    return int(conn.execute(text("SELECT pg_snapshot_xmin(pg_current_snapshot())::text")).scalar())
+
+
+def safe_upper_id(conn: Connection, table: Table, lag: float, stop: Optional[threading.Event] = None) -> int:
+    """
+    Граница выгрузки: id не больше неё уже закоммичены или откатились.
+    Меньшие id могут быть только у транзакций, начатых до чтения max(id),
+    поэтому ждём, пока xmin снимка не дойдёт до xmax снимка, снятого сразу
+    после чтения. Дольше lag транзакции вставки не живут — дальше не ждём
+    """
+    current = conn.scalar(select(func.max(table.c.id))) or 0
+    if conn.dialect.name == "sqlite" or lag <= 0:
+        return current
+    started_after = int(conn.execute(text("SELECT pg_snapshot_xmax(pg_current_snapshot())::text")).scalar())
+    deadline = time.monotonic() + lag
+    # READ COMMITTED: каждый запрос видит свежий снимок
+    while _oldest_running_xid(conn) < started_after and time.monotonic() < deadline:
+        if stop is not None and stop.is_set():
+            raise ExportStopped(table.name)
+        time.sleep(EXPORT_POLL_INTERVAL)
+    return current
+
+
+def _write_part(path: str, rows: List[tuple], schema: "pa.Schema", json_columns: List[int]):
+    columns = [list(values) for values in zip(*rows)]
+    for index in json_columns:
+        columns[index] = [None if value is None else orjson.dumps(value).decode() for value in columns[index]]
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # Запись во временный файл: читатели не увидят недописанный parquet
+    pq.write_table(pa.Table.from_arrays(columns, schema=schema), path + ".tmp", compression="zstd")
+    os.replace(path + ".tmp", path)
+
+
+def export_table(
+    engine: Engine,
+    name: str,
+    directory: str = EXPORT_DIR,
+    chunk_size: int = EXPORT_CHUNK_SIZE,
+    stop: Optional[threading.Event] = None,
+    safety_lag: float = EXPORT_SAFETY_LAG
+) -> dict:
+    """Выгрузить одну таблицу; вернуть число строк, файлов и последний id"""
+    if pa is None:
+        raise ExportUnavailable("pyarrow is not installed")
+    model, time_column = EXPORTS[name]
+    table = model.__table__
+    schema = arrow_schema(table)
+    json_columns = [i for i, column in enumerate(table.columns) if isinstance(column.type, JSON)]
+    state = load_state(directory)
+    incremental = time_column is not None
+    last_id = state.get(name, {}).get("last_id", 0) if incremental else 0
+
+    if incremental:
+        time_index = list(table.columns.keys()).index(time_column)
+        root = os.path.join(directory, name)
+    else:
+        root = os.path.join(directory, name, f"snapshot={datetime.utcnow():%Y-%m-%d}")
+
+    result = {"rows": 0, "files": 0, "last_id": last_id}
+    query = select(table).where(table.c.id > last_id).order_by(table.c.id)
+    with engine.connect() as conn:
+        if incremental:
+            upper_id = safe_upper_id(conn, table, safety_lag, stop)
+            query = query.where(table.c.id <= upper_id)
+        # stream_results: серверный курсор вместо загрузки всего результата
+        rows = conn.execution_options(stream_results=True, yield_per=chunk_size).execute(query)
+        for chunk in rows.partitions():
+            if stop is not None and stop.is_set():
+                raise ExportStopped(name)
+            part = f"part-{chunk[0].id:012d}.parquet"
+            if incremental:
+                by_date = defaultdict(list)
+                for row in chunk:
+                    moment = row[time_index]
+                    by_date[f"{moment:%Y-%m-%d}" if moment else NULL_PARTITION].append(tuple(row))
+                for date, date_rows in by_date.items():
+                    _write_part(os.path.join(root, f"date={date}", part), date_rows, schema, json_columns)
+                    result["files"] += 1
+            else:
+                _write_part(os.path.join(root, part), [tuple(row) for row in chunk], schema, json_columns)
+                result["files"] += 1
+            result["rows"] += len(chunk)
+            result["last_id"] = chunk[-1].id
+            if incremental:
+                # Имя файла зависит от первого id порции: после сбоя
+                # повторная выгрузка перезапишет те же файлы
+                _save_progress(directory, name, result["last_id"])
+    return result
+
+
+def _save_progress(directory: str, name: str, last_id: int):
+    state = load_state(directory)
+    state[name] = {"last_id": last_id, "exported_at": datetime.utcnow().isoformat()}
+    save_state(directory, state)
+
+
+def export_all(
+    engine: Engine,
+    names: Optional[List[str]] = None,
+    directory: str = EXPORT_DIR,
+    chunk_size: int = EXPORT_CHUNK_SIZE,
+    stop: Optional[threading.Event] = None
+) -> Dict[str, dict]:
+    os.makedirs(directory, exist_ok=True)
+    return {name: export_table(engine, name, directory, chunk_size, stop) for name in names or EXPORTS}
+
+
+class ExportRunner:
+    """Одна фоновая выгрузка за раз для admin endpoint"""
+
+    def __init__(self, directory: str = EXPORT_DIR, chunk_size: int = EXPORT_CHUNK_SIZE):
+        self.directory = directory
+        self.chunk_size = chunk_size
+        self._task = None
+        self._stop = threading.Event()
+        self.started_at: Optional[datetime] = None
+        self.finished_at: Optional[datetime] = None
+        self.error: Optional[str] = None
+        self.results: Dict[str, dict] = {}
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self, names: List[str]) -> bool:
+        """Запустить выгрузку; False, если предыдущая ещё идёт"""
+        if pa is None:
+            raise ExportUnavailable("pyarrow is not installed")
+        if self.running:
+            return False
+        self._stop.clear()
+        self.started_at, self.finished_at, self.error, self.results = datetime.utcnow(), None, None, {}
+        self._task = asyncio.get_running_loop().create_task(self._run(names))
+        return True
+
+    async def _run(self, names: List[str]):
+        from database import engine
+
+        loop = asyncio.get_running_loop()
+        try:
+            # Синхронный движок: серверные курсоры и запись файлов в отдельном потоке
+            self.results = await loop.run_in_executor(
+                None, export_all, engine, names, self.directory, self.chunk_size, self._stop
+            )
+        except Exception as exc:
+            self.error = f"{type(exc).__name__}: {exc}"
+        finally:
+            self.finished_at = datetime.utcnow()
+
+    async def stop(self):
+        # Поток нельзя отменить: просим остановиться после текущей порции
+        if self._task is not None:
+            self._stop.set()
+            await self._task
+            self._task = None
+
+    def status(self) -> dict:
+        return {
+            "running": self.running,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "error": self.error,
+            "results": self.results,
+            "watermarks": load_state(self.directory),
+        }
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from database import engine
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--tables", nargs="+", choices=list(EXPORTS), default=list(EXPORTS))
+    parser.add_argument("--dir", default=EXPORT_DIR)
+    parser.add_argument("--chunk-size", type=int, default=EXPORT_CHUNK_SIZE)
+    args = parser.parse_args()
+    for table_name, outcome in export_all(engine, args.tables, args.dir, args.chunk_size).items():
+        print(f"✅ {table_name}: {outcome['rows']} rows, {outcome['files']} files, last id {outcome['last_id']}")
@@ -3,25 +3,63 @@ QazKids - FastAPI Backend
 Полнофункциональное приложение с аутентификацией, БД, и всеми endpoints
 """
 
-from fastapi import FastAPI, Depends, HTTPException, status, Header
+from fastapi import (
+    FastAPI, Depends, HTTPException, status, Header, Request, Query, Response, WebSocket, WebSocketDisconnect
+)
 from fastapi.middleware.cors import CORSMiddleware
-from sqlalchemy.orm import Session
-from datetime import datetime, timedelta
-from typing import List, Optional
+from fastapi.responses import StreamingResponse, ORJSONResponse
+from starlette.background import BackgroundTask
+from starlette.concurrency import run_in_threadpool
+from sqlalchemy import select, func, event, inspect, insert, delete, or_
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from pydantic import ValidationError
+from sqlalchemy.ext.asyncio import AsyncSession
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional, Tuple
 import jwt
-from passlib.context import CryptContext
+import orjson
 from dotenv import load_dotenv
+import asyncio
 import os
-import json
-
-from database import get_db, engine
-from models import Base, User, Game, Film, Progress, Achievement, Location, Content, Analytics
+import hashlib
+import math
+import time
+import zlib
+
+from database import engine, async_engine, AsyncSessionLocal, get_async_db, create_tables_async
+from migrations import upgrade_async
+from cache import TTLCache
+from passwords import PasswordHasher, PasswordPoolSaturated
+from principals import Principal, PrincipalCache
+from view_counter import ViewCounter
+from batch_writer import BatchWriter, QueueFull
+from geo import thin_fixes, simplify_track, encode_polyline
+from location_stream import LocationHub, StreamFull
+from last_position import LastPositionStore
+from geofence import Fence, GeofenceEngine
+from stats import StatsReconciler
+from leaderboard import Leaderboards
+from retention import RetentionJob
+from export import EXPORTS, ExportRunner, ExportUnavailable
+import metrics
+from query_guard import QueryGuard, QueryGuardMiddleware, QueryBudgetExceeded, query_budget_exceeded_handler
+from response_cache import ResponseCache
+from pagination import Keyset, NEXT_CURSOR_HEADER
+from payloads import pack_content, iter_chunks, iter_decompressed
+from models import (
+    User, Game, Film, Progress, Achievement, Location, Geofence, GeofenceEvent,
+    Content, Analytics, StatsCounter, ANALYTICS_GAME_ID
+)
 from schemas import (
-    UserCreate, UserResponse, UserUpdate, Token,
+    UserCreate, UserLogin, UserResponse, UserUpdate, Token,
     GameCreate, GameResponse, FilmCreate, FilmResponse,
-    ProgressCreate, ProgressResponse, AchievementResponse,
-    LocationCreate, LocationResponse, ContentCreate, ContentResponse,
-    AnalyticsEvent, AnalyticsResponse
+    ProgressCreate, ProgressResponse, LeaderboardResponse, AchievementResponse,
+    LocationCreate, LocationResponse, LocationBatch, LocationBatchResponse, LastPosition,
+    GeofenceCreate, GeofenceResponse, GeofenceEventResponse,
+    ContentCreate, ContentResponse,
+    AnalyticsEvent, AnalyticsResponse, AnalyticsBatch, AnalyticsBatchResponse,
+    AnalyticsAdminResponse, ExportRequest, ExportStatus
 )
 
 load_dotenv()
@@ -30,11 +68,21 @@ load_dotenv()
 SECRET_KEY = os.getenv("SECRET_KEY", "your-super-secret-key-change-in-production")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_DAYS = 30
+TOKEN_CACHE_SIZE = int(os.getenv("TOKEN_CACHE_SIZE", "50000"))
+TOKEN_CACHE_TTL = float(os.getenv("TOKEN_CACHE_TTL", "3600"))
+LOCATION_MIN_DISTANCE_M = float(os.getenv("LOCATION_MIN_DISTANCE_M", "10"))
+LOCATION_MAX_ACCURACY_M = float(os.getenv("LOCATION_MAX_ACCURACY_M", "100"))
+LOCATION_BATCH_MAX_BYTES = 1024 * 1024
+MAX_WATCHED_CHILDREN = 20
+TRACK_SEGMENT_SIZE = int(os.getenv("TRACK_SEGMENT_SIZE", "5000"))
+TRACK_MAX_DAYS = int(os.getenv("TRACK_MAX_DAYS", "7"))
 
 app = FastAPI(
     title="QazKids API",
     description="API для платформы развития детей QazKids",
-    version="1.0.0"
+    version="1.0.0",
+    # orjson сериализует ответы в несколько раз быстрее стандартного json
+    default_response_class=ORJSONResponse
 )
 
 # === CORS ===
@@ -46,17 +94,98 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# === METRICS ===
+metrics.instrument_engine(engine, "sync")
+metrics.instrument_engine(async_engine.sync_engine, "async")
+app.add_middleware(metrics.MetricsMiddleware)
+
+# === QUERY GUARD (N+1 и медленные запросы, QUERY_GUARD=log|strict) ===
+query_guard = QueryGuard.from_env()
+query_guard.instrument(engine)
+query_guard.instrument(async_engine.sync_engine)
+app.add_middleware(QueryGuardMiddleware, guard=query_guard)
+app.add_exception_handler(QueryBudgetExceeded, query_budget_exceeded_handler)
+
+# === USER CACHE ===
+principal_cache = PrincipalCache.from_env()
+token_cache = TTLCache(maxsize=TOKEN_CACHE_SIZE, ttl=TOKEN_CACHE_TTL)
+# child_id -> parent_id (0 — родителя нет) для проверки доступа к GPS
+guardian_cache = TTLCache(maxsize=TOKEN_CACHE_SIZE, ttl=60.0)
+
+
+# === FILM VIEWS ===
+view_counter = ViewCounter.from_env()
+
+
+# === ANALYTICS INGESTION ===
+analytics_writer = BatchWriter(
+    Analytics.__table__,
+    batch_size=int(os.getenv("ANALYTICS_BATCH_SIZE", "500")),
+    flush_interval=float(os.getenv("ANALYTICS_FLUSH_INTERVAL", "1.0")),
+    max_pending=int(os.getenv("ANALYTICS_MAX_PENDING", "50000")),
+    overflow=os.getenv("ANALYTICS_OVERFLOW", "drop")
+)
+
+
+# === LOCATION STREAM ===
+location_hub = LocationHub.from_env()
+last_positions = LastPositionStore.from_env()
+geofences = GeofenceEngine.from_env()
+
+
+# === CATALOG CACHE ===
+catalog_cache = ResponseCache.from_env("catalog")
+
+
+# === STATS ===
+stats_reconciler = StatsReconciler.from_env()
+
+
+# === LEADERBOARDS ===
+leaderboards = Leaderboards.from_env()
+LEADERBOARD_MAX_LIMIT = 100
+
+
+# === RETENTION ===
+retention_job = RetentionJob.from_env()
+
+
+# === EXPORT ===
+export_runner = ExportRunner()
+
+
 # === PASSWORD HASHING ===
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+password_hasher = PasswordHasher.from_env()
+
+
+def password_pool_busy() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail="Сервер перегружен, повторите попытку позже",
+        headers={"Retry-After": "1"}
+    )
 
 
 # === UTILITY FUNCTIONS ===
-def hash_password(password: str) -> str:
-    return pwd_context.hash(password)
+def naive_utc(moment: datetime) -> datetime:
+    """Время с часовым поясом -> naive UTC, как timestamp хранится в БД"""
+    if moment.tzinfo is None:
+        return moment
+    return moment.astimezone(timezone.utc).replace(tzinfo=None)
 
 
-def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return pwd_context.verify(plain_password, hashed_password)
+async def hash_password(password: str) -> str:
+    try:
+        return await password_hasher.hash(password)
+    except PasswordPoolSaturated:
+        raise password_pool_busy()
+
+
+async def verify_password(plain_password: str, hashed_password: str) -> bool:
+    try:
+        return await password_hasher.verify(plain_password, hashed_password)
+    except PasswordPoolSaturated:
+        raise password_pool_busy()
 
 
 def create_access_token(user_id: int, expires_delta: Optional[timedelta] = None) -> str:
@@ -69,7 +198,8 @@ def create_access_token(user_id: int, expires_delta: Optional[timedelta] = None)
     return encoded_jwt
 
 
-def verify_token(token: str) -> int:
+def decode_token(token: str) -> Tuple[int, float]:
+    """Полная проверка подписи JWT; возвращает (user_id, exp)"""
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         user_id: int = payload.get("user_id")
@@ -78,7 +208,7 @@ def verify_token(token: str) -> int:
                 status_code=status.HTTP_401_UNAUTHORIZED,
                 detail="Invalid token"
             )
-        return user_id
+        return user_id, float(payload.get("exp", math.inf))
     except jwt.ExpiredSignatureError:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -91,7 +221,29 @@ def verify_token(token: str) -> int:
         )
 
 
-def get_current_user(authorization: Optional[str] = Header(None), db: Session = Depends(get_db)) -> User:
+def verify_token(token: str) -> int:
+    """Проверка токена с кэшем уже проверенных подписей"""
+    key = hashlib.sha256(token.encode()).digest()
+    cached = token_cache.get(key)
+    now = time.time()
+    
+    if cached is not None:
+        user_id, exp = cached
+        if exp > now:
+            return user_id
+        token_cache.pop(key)
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Token expired"
+        )
+    
+    user_id, exp = decode_token(token)
+    # Запись не должна пережить exp самого токена
+    token_cache.set(key, (user_id, exp), ttl=min(TOKEN_CACHE_TTL, exp - now))
+    return user_id
+
+
+def get_token_user_id(authorization: Optional[str]) -> int:
     if not authorization or not authorization.startswith("Bearer "):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -99,8 +251,16 @@ def get_current_user(authorization: Optional[str] = Header(None), db: Session =
         )
     
     token = authorization.replace("Bearer ", "")
-    user_id = verify_token(token)
-    user = db.query(User).filter(User.id == user_id).first()
+    return verify_token(token)
+
+
+async def get_current_user(
+    authorization: Optional[str] = Header(None),
+    db: AsyncSession = Depends(get_async_db)
+) -> User:
+    """Полная ORM модель пользователя (для профиля и изменений)"""
+    user_id = get_token_user_id(authorization)
+    user = await db.scalar(select(User).where(User.id == user_id))
     
     if user is None:
         raise HTTPException(
@@ -110,29 +270,119 @@ def get_current_user(authorization: Optional[str] = Header(None), db: Session =
     return user
 
 
+async def get_current_principal(
+    authorization: Optional[str] = Header(None),
+    db: AsyncSession = Depends(get_async_db)
+) -> Principal:
+    """Облегчённый пользователь из кэша; запрос к users только при промахе"""
+    user_id = get_token_user_id(authorization)
+    principal = await principal_cache.get(user_id)
+    if principal is not None:
+        return principal
+    
+    row = (await db.execute(
+        select(User.id, User.role, User.is_active).where(User.id == user_id)
+    )).first()
+    if row is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="User not found"
+        )
+    
+    principal = Principal(id=row.id, role=row.role, is_active=row.is_active)
+    await principal_cache.put(principal)
+    return principal
+
+
+@event.listens_for(User, "after_update")
+def invalidate_principal_on_change(mapper, connection, target):
+    """Сбросить кэш при смене роли или активности через ORM"""
+    state = inspect(target)
+    if state.attrs.role.history.has_changes() or state.attrs.is_active.history.has_changes():
+        principal_cache.invalidate_nowait(target.id)
+
+
 # === STARTUP ===
 @app.on_event("startup")
 async def startup():
     """Создание таблиц при запуске"""
-    Base.metadata.create_all(bind=engine)
+    await create_tables_async()
+    await upgrade_async()
+    view_counter.start()
+    analytics_writer.start()
+    stats_reconciler.start()
+    leaderboards.start()
+    retention_job.start()
+    location_hub.start()
+    await geofences.start()
     print("✅ Database tables created/checked")
 
 
+@app.on_event("shutdown")
+async def shutdown():
+    """Остановка фоновых пулов и запись отложенных счётчиков"""
+    await view_counter.stop()
+    await analytics_writer.stop()
+    await stats_reconciler.stop()
+    await leaderboards.stop()
+    await retention_job.stop()
+    await export_runner.stop()
+    await location_hub.stop()
+    await geofences.stop()
+    password_hasher.shutdown()
+
+
 # === HEALTH CHECK ===
+def component_stats() -> dict:
+    """stats() фоновых компонентов для /health и /metrics"""
+    return {
+        "password_hashing": password_hasher.stats(),
+        "principal_cache": principal_cache.stats(),
+        "token_cache": token_cache.stats(),
+        "film_views": view_counter.stats(),
+        "analytics_queue": analytics_writer.stats(),
+        "catalog_cache": catalog_cache.stats(),
+        "leaderboards": leaderboards.stats(),
+        "retention": retention_job.stats(),
+        "location_stream": location_hub.stats(),
+        "last_positions": last_positions.stats(),
+        "geofences": geofences.stats(),
+        "query_guard": query_guard.stats()
+    }
+
+
+metrics.register_stats(component_stats)
+
+
 @app.get("/health")
 async def health_check():
-    return {"status": "ok", "message": "QazKids API is running"}
+    return {
+        "status": "ok",
+        "message": "QazKids API is running",
+        **component_stats()
+    }
+
+
+@app.get("/metrics", include_in_schema=False)
+async def prometheus_metrics():
+    """Метрики в формате Prometheus"""
+    if not metrics.enabled:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="prometheus_client is not installed"
+        )
+    return Response(content=metrics.render(), media_type=metrics.CONTENT_TYPE_LATEST)
 
 
 # === AUTHENTICATION ENDPOINTS ===
 @app.post("/auth/register", response_model=Token)
-async def register(user_data: UserCreate, db: Session = Depends(get_db)):
+async def register(user_data: UserCreate, db: AsyncSession = Depends(get_async_db)):
     """Регистрация нового пользователя"""
     
     # Проверка существования пользователя
-    existing_user = db.query(User).filter(
+    existing_user = await db.scalar(select(User).where(
         (User.email == user_data.email) | (User.username == user_data.username)
-    ).first()
+    ))
     
     if existing_user:
         raise HTTPException(
@@ -144,15 +394,15 @@ async def register(user_data: UserCreate, db: Session = Depends(get_db)):
     user = User(
         username=user_data.username,
         email=user_data.email,
-        password_hash=hash_password(user_data.password),
+        password_hash=await hash_password(user_data.password),
         full_name=user_data.full_name,
         age=user_data.age,
         role=user_data.role
     )
     
     db.add(user)
-    db.commit()
-    db.refresh(user)
+    await db.commit()
+    await db.refresh(user)
     
     # Создание токена
     access_token = create_access_token(user.id)
@@ -165,12 +415,12 @@ async def register(user_data: UserCreate, db: Session = Depends(get_db)):
 
 
 @app.post("/auth/login", response_model=Token)
-async def login(user_credentials: UserLogin, db: Session = Depends(get_db)):
+async def login(user_credentials: UserLogin, db: AsyncSession = Depends(get_async_db)):
     """Логин пользователя"""
     
-    user = db.query(User).filter(User.email == user_credentials.email).first()
+    user = await db.scalar(select(User).where(User.email == user_credentials.email))
     
-    if not user or not verify_password(user_credentials.password, user.password_hash):
+    if not user or not await verify_password(user_credentials.password, user.password_hash):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Неверный email или пароль"
@@ -178,7 +428,7 @@ async def login(user_credentials: UserLogin, db: Session = Depends(get_db)):
     
     # Обновить время последней активности
     user.updated_at = datetime.utcnow()
-    db.commit()
+    await db.commit()
     
     access_token = create_access_token(user.id)
     
@@ -202,7 +452,7 @@ async def get_current_user_profile(
 async def update_user_profile(
     user_update: UserUpdate,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Обновить профиль пользователя"""
     
@@ -210,16 +460,24 @@ async def update_user_profile(
         current_user.full_name = user_update.full_name
     if user_update.age:
         current_user.age = user_update.age
+        leaderboards.forget_user(current_user.id)
+    if user_update.parent_id is not None and user_update.parent_id != current_user.parent_id:
+        parent_role = await db.scalar(select(User.role).where(User.id == user_update.parent_id))
+        if parent_role != "parent" or user_update.parent_id == current_user.id:
+            raise HTTPException(status_code=400, detail="parent_id must refer to a parent account")
+        current_user.parent_id = user_update.parent_id
+        guardian_cache.pop(current_user.id)
     
-    db.commit()
-    db.refresh(current_user)
+    await db.commit()
+    await principal_cache.invalidate(current_user.id)
+    await db.refresh(current_user)
     return current_user
 
 
 @app.get("/users/{user_id}", response_model=UserResponse)
-async def get_user(user_id: int, db: Session = Depends(get_db)):
+async def get_user(user_id: int, db: AsyncSession = Depends(get_async_db)):
     """Получить информацию о пользователе"""
-    user = db.query(User).filter(User.id == user_id).first()
+    user = await db.scalar(select(User).where(User.id == user_id))
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     return user
@@ -228,41 +486,85 @@ async def get_user(user_id: int, db: Session = Depends(get_db)):
 # === GAME ENDPOINTS ===
 @app.get("/games", response_model=List[GameResponse])
 async def get_games(
+    request: Request,
     category: Optional[str] = None,
     difficulty: Optional[str] = None,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Получить список игр"""
-    query = db.query(Game)
+    cached = await catalog_cache.lookup(request)
+    if cached is not None:
+        return cached
+    
+    query = select(Game)
     
     if category:
-        query = query.filter(Game.category == category)
+        query = query.where(Game.category == category)
     if difficulty:
-        query = query.filter(Game.difficulty == difficulty)
+        query = query.where(Game.difficulty == difficulty)
     
-    return query.all()
+    return await catalog_cache.store(request, List[GameResponse], (await db.scalars(query)).all())
 
 
 @app.get("/games/{game_id}", response_model=GameResponse)
-async def get_game(game_id: int, db: Session = Depends(get_db)):
+async def get_game(game_id: int, request: Request, db: AsyncSession = Depends(get_async_db)):
     """Получить информацию об игре"""
-    game = db.query(Game).filter(Game.id == game_id).first()
+    cached = await catalog_cache.lookup(request)
+    if cached is not None:
+        return cached
+    
+    game = await db.scalar(select(Game).where(Game.id == game_id))
     if not game:
         raise HTTPException(status_code=404, detail="Game not found")
-    return game
+    return await catalog_cache.store(request, GameResponse, game)
+
+
+@app.get("/games/{game_id}/content")
+async def get_game_content(game_id: int, request: Request, db: AsyncSession = Depends(get_async_db)):
+    """
+    Игровой контент (вопросы, уровни, карточки) отдельным потоком.
+    Отдаётся заранее сжатым gzip со strong ETag = sha256 контента;
+    у gzip и распакованного ответа разные теги (суффикс -gz)
+    """
+    row = (await db.execute(select(Game.id, Game.content_hash).where(Game.id == game_id))).first()
+    if not row:
+        raise HTTPException(status_code=404, detail="Game not found")
+    if not row.content_hash:
+        raise HTTPException(status_code=404, detail="Game content not found")
+    
+    gzipped = "gzip" in request.headers.get("accept-encoding", "").lower()
+    headers = {
+        "ETag": f'"{row.content_hash}-gz"' if gzipped else f'"{row.content_hash}"',
+        "Cache-Control": "public, max-age=300",
+        "Vary": "Accept-Encoding"
+    }
+    if_none_match = request.headers.get("if-none-match", "")
+    if headers["ETag"] in (tag.strip() for tag in if_none_match.split(",")):
+        return Response(status_code=304, headers=headers)
+    
+    # Сам payload читаем только когда он действительно нужен клиенту
+    content_gzip = await db.scalar(select(Game.content_gzip).where(Game.id == game_id))
+    if gzipped:
+        headers["Content-Encoding"] = "gzip"
+        headers["Content-Length"] = str(len(content_gzip))
+        return StreamingResponse(iter_chunks(content_gzip), media_type="application/json", headers=headers)
+    return StreamingResponse(iter_decompressed(content_gzip), media_type="application/json", headers=headers)
 
 
 @app.post("/games", response_model=GameResponse)
 async def create_game(
     game: GameCreate,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: Principal = Depends(get_current_principal),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Создать новую игру (только для админов)"""
     
     if current_user.role != "admin":
         raise HTTPException(status_code=403, detail="Only admins can create games")
     
+    # Сжатие мегабайтного контента не должно блокировать event loop
+    content_gzip, content_hash = await run_in_threadpool(pack_content, game.content)
+    
     db_game = Game(
         title=game.title,
         description=game.description,
@@ -270,52 +572,79 @@ async def create_game(
         difficulty=game.difficulty,
         duration_minutes=game.duration_minutes,
         image_url=game.image_url,
-        content=json.dumps(game.content),
+        content=game.content,
+        content_gzip=content_gzip,
+        content_hash=content_hash,
         max_score=game.max_score
     )
     
     db.add(db_game)
-    db.commit()
-    db.refresh(db_game)
+    await db.commit()
+    await db.refresh(db_game)
+    await catalog_cache.invalidate()
     return db_game
 
 
 # === FILM ENDPOINTS ===
+FILM_KEYSETS = {
+    "id": Keyset("film_id", Film.id),
+    "views": Keyset("film_views", Film.views, Film.id, descending=True, nulls_as={"views": 0}),
+}
+
+
 @app.get("/films", response_model=List[FilmResponse])
 async def get_films(
+    request: Request,
     category: Optional[str] = None,
     skip: int = 0,
-    limit: int = 10,
-    db: Session = Depends(get_db)
+    limit: int = Query(10, ge=1, le=100),
+    cursor: Optional[str] = None,
+    sort: str = Query("id", pattern="^(id|views)$"),
+    db: AsyncSession = Depends(get_async_db)
 ):
-    """Получить список фильмов"""
-    query = db.query(Film)
+    """
+    Получить список фильмов.
+    Следующая страница: cursor из заголовка X-Next-Cursor (skip игнорируется)
+    """
+    cached = await catalog_cache.lookup(request)
+    if cached is not None:
+        return cached
+    
+    query = select(Film)
     
     if category:
-        query = query.filter(Film.category == category)
+        query = query.where(Film.category == category)
     
-    return query.offset(skip).limit(limit).all()
+    keyset = FILM_KEYSETS[sort]
+    query = keyset.apply(query, cursor, limit)
+    if not cursor:
+        query = query.offset(skip)
+    
+    films, next_cursor = keyset.page((await db.scalars(query)).all(), limit)
+    headers = {NEXT_CURSOR_HEADER: next_cursor} if next_cursor else None
+    return await catalog_cache.store(request, List[FilmResponse], films, headers)
 
 
 @app.get("/films/{film_id}", response_model=FilmResponse)
-async def get_film(film_id: int, db: Session = Depends(get_db)):
+async def get_film(film_id: int, db: AsyncSession = Depends(get_async_db)):
     """Получить информацию о фильме"""
-    film = db.query(Film).filter(Film.id == film_id).first()
+    film = await db.scalar(select(Film).where(Film.id == film_id))
     if not film:
         raise HTTPException(status_code=404, detail="Film not found")
     
-    # Увеличить счётчик просмотров
-    film.views += 1
-    db.commit()
+    # Увеличить счётчик просмотров (запишется в БД фоновым сбросом)
+    view_counter.increment(film.id)
     
-    return film
+    response = FilmResponse.model_validate(film)
+    response.views += view_counter.pending(film.id)
+    return response
 
 
 @app.post("/films", response_model=FilmResponse)
 async def create_film(
     film: FilmCreate,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: Principal = Depends(get_current_principal),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Создать новый фильм (только для админов)"""
     
@@ -332,75 +661,222 @@ async def create_film(
     )
     
     db.add(db_film)
-    db.commit()
-    db.refresh(db_film)
+    await db.commit()
+    await db.refresh(db_film)
+    await catalog_cache.invalidate()
     return db_film
 
 
 # === PROGRESS ENDPOINTS ===
+def build_progress_upsert(dialect_name: str, user_id: int, game_id: int, score: int):
+    """INSERT ... ON CONFLICT (user_id, game_id) DO UPDATE для PostgreSQL и SQLite"""
+    if dialect_name == "postgresql":
+        insert_stmt, greatest = postgresql_insert, func.greatest
+    else:
+        # В SQLite скалярный max(a, b) играет роль GREATEST
+        insert_stmt, greatest = sqlite_insert, func.max
+    
+    completed = score > 70
+    now = datetime.utcnow()
+    table = Progress.__table__
+    stmt = insert_stmt(table).values(
+        user_id=user_id,
+        game_id=game_id,
+        score=score,
+        attempts=1,
+        completed=completed,
+        completed_at=now if completed else None,
+        started_at=now
+    )
+    return stmt.on_conflict_do_update(
+        index_elements=[table.c.user_id, table.c.game_id],
+        set_={
+            "score": greatest(table.c.score, stmt.excluded.score),
+            "attempts": table.c.attempts + 1,
+            "completed": or_(table.c.completed, stmt.excluded.completed),
+            "completed_at": func.coalesce(stmt.excluded.completed_at, table.c.completed_at)
+        }
+    ).returning(*table.c)
+
+
 @app.post("/progress", response_model=ProgressResponse)
 async def save_progress(
     progress_data: ProgressCreate,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: Principal = Depends(get_current_principal),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Сохранить прогресс игры"""
     
-    progress = db.query(Progress).filter(
-        (Progress.user_id == current_user.id) & 
-        (Progress.game_id == progress_data.game_id)
-    ).first()
-    
-    if progress:
-        # Обновить существующий прогресс
-        progress.score = max(progress.score, progress_data.score)
-        progress.attempts += 1
-        if progress_data.score > 70:
-            progress.completed = True
-            progress.completed_at = datetime.utcnow()
-    else:
-        # Создать новый прогресс
-        progress = Progress(
-            user_id=current_user.id,
-            game_id=progress_data.game_id,
-            score=progress_data.score,
-            completed=progress_data.score > 70
-        )
-        if progress_data.score > 70:
-            progress.completed_at = datetime.utcnow()
-    
-    db.add(progress)
-    db.commit()
-    db.refresh(progress)
+    # Один атомарный INSERT ... ON CONFLICT вместо чтения и записи:
+    # параллельные отправки не теряют попытки и не создают дубликатов
+    stmt = build_progress_upsert(
+        db.get_bind().dialect.name,
+        user_id=current_user.id,
+        game_id=progress_data.game_id,
+        score=progress_data.score
+    )
+    row = (await db.execute(stmt)).one()
+    await db.commit()
+    await leaderboards.record(db, current_user.id, row.game_id, row.score)
     
-    return progress
+    return row._mapping
 
 
 @app.get("/progress", response_model=List[ProgressResponse])
 async def get_user_progress(
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: Principal = Depends(get_current_principal),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Получить прогресс текущего пользователя"""
-    return db.query(Progress).filter(Progress.user_id == current_user.id).all()
+    return (await db.scalars(select(Progress).where(Progress.user_id == current_user.id))).all()
+
+
+# === LEADERBOARD ENDPOINTS ===
+async def leaderboard_response(
+    board: str,
+    limit: int,
+    offset: int,
+    principal: Principal,
+    db: AsyncSession
+) -> dict:
+    """Топ таблицы с места offset и место текущего пользователя"""
+    entries, mine = await leaderboards.board(db, board, principal.id, limit, offset)
+    user_ids = [user_id for user_id, _ in entries] + [principal.id]
+    names = dict((await db.execute(select(User.id, User.username).where(User.id.in_(user_ids)))).all())
+    return {
+        "board": board,
+        "entries": [
+            {"rank": offset + place + 1, "user_id": user_id, "username": names.get(user_id), "score": int(score)}
+            for place, (user_id, score) in enumerate(entries)
+        ],
+        "me": None if mine is None else {
+            "rank": mine[0] + 1, "user_id": principal.id, "username": names.get(principal.id), "score": int(mine[1])
+        }
+    }
+
+
+@app.get("/leaderboards/global", response_model=LeaderboardResponse)
+async def global_leaderboard(
+    limit: int = Query(10, ge=1, le=LEADERBOARD_MAX_LIMIT),
+    offset: int = Query(0, ge=0),
+    current_user: Principal = Depends(get_current_principal),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Рейтинг по сумме лучших результатов во всех играх"""
+    return await leaderboard_response("global", limit, offset, current_user, db)
+
+
+@app.get("/leaderboards/games/{game_id}", response_model=LeaderboardResponse)
+async def game_leaderboard(
+    game_id: int,
+    limit: int = Query(10, ge=1, le=LEADERBOARD_MAX_LIMIT),
+    offset: int = Query(0, ge=0),
+    current_user: Principal = Depends(get_current_principal),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Рейтинг по лучшему результату в игре"""
+    return await leaderboard_response(f"game:{game_id}", limit, offset, current_user, db)
+
+
+@app.get("/leaderboards/age/{band}", response_model=LeaderboardResponse)
+async def age_leaderboard(
+    band: str,
+    limit: int = Query(10, ge=1, le=LEADERBOARD_MAX_LIMIT),
+    offset: int = Query(0, ge=0),
+    current_user: Principal = Depends(get_current_principal),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Общий рейтинг среди сверстников (группы из LEADERBOARD_AGE_BANDS, например 6-8)"""
+    if band not in leaderboards.age_bands:
+        raise HTTPException(
+            status_code=404,
+            detail=f"Unknown age band, expected one of: {', '.join(leaderboards.age_bands)}"
+        )
+    return await leaderboard_response(f"age:{band}", limit, offset, current_user, db)
 
 
 # === ACHIEVEMENTS ENDPOINTS ===
 @app.get("/achievements", response_model=List[AchievementResponse])
 async def get_user_achievements(
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: Principal = Depends(get_current_principal),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Получить достижения пользователя"""
-    return db.query(Achievement).filter(Achievement.user_id == current_user.id).all()
+    return (await db.scalars(select(Achievement).where(Achievement.user_id == current_user.id))).all()
 
 
 # === LOCATION ENDPOINTS (GPS) ===
+async def ensure_can_watch(principal: Principal, child_ids: List[int], db: AsyncSession):
+    """Свои точки, точки своих детей (users.parent_id) или любые для администратора"""
+    if len(child_ids) > MAX_WATCHED_CHILDREN:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_WATCHED_CHILDREN} children per request")
+    if principal.role == "admin":
+        return
+    parents = {}
+    missing = []
+    for child_id in set(child_ids) - {principal.id}:
+        parent_id = guardian_cache.get(child_id)
+        if parent_id is None:
+            missing.append(child_id)
+        else:
+            parents[child_id] = parent_id
+    if missing:
+        for row in await db.execute(select(User.id, User.parent_id).where(User.id.in_(missing))):
+            parents[row.id] = row.parent_id or 0
+            guardian_cache.set(row.id, parents[row.id])
+    if any(parents.get(child_id) != principal.id for child_id in set(child_ids) - {principal.id}):
+        raise HTTPException(status_code=403, detail="Not allowed to view this user's location")
+
+
+async def authorize_stream(token: Optional[str], authorization: Optional[str], child_ids: List[int]) -> List[int]:
+    """
+    Проверка подписчика на поток точек. Браузерные WebSocket и EventSource не
+    умеют слать заголовки, поэтому токен можно передать в ?token=. Сессия БД
+    закрывается сразу: соединение с клиентом живёт часами
+    """
+    async with AsyncSessionLocal() as db:
+        principal = await get_current_principal(f"Bearer {token}" if token else authorization, db)
+        child_ids = child_ids or [principal.id]
+        await ensure_can_watch(principal, child_ids, db)
+    if location_hub.full:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Too many location streams",
+            headers={"Retry-After": "5"}
+        )
+    return child_ids
+
+
+async def broadcast_location(
+    user_id: int,
+    latitude: float,
+    longitude: float,
+    accuracy: Optional[float],
+    timestamp: datetime
+):
+    """Новая точка: последняя позиция и поток подписчикам"""
+    fix = {
+        "user_id": user_id,
+        "latitude": latitude,
+        "longitude": longitude,
+        "accuracy": accuracy,
+        "timestamp": timestamp
+    }
+    await last_positions.update(fix)
+    await location_hub.publish(user_id, fix)
+
+
+async def check_geofences(db: AsyncSession, user_id: int, fixes: List[Tuple[float, float, datetime]]):
+    """События входа/выхода из зон уходят в тот же поток, что и точки (с полем event)"""
+    for geofence_event in await geofences.evaluate(db, user_id, fixes):
+        await location_hub.publish(user_id, geofence_event)
+
+
 @app.post("/locations", response_model=LocationResponse)
 async def save_location(
     location_data: LocationCreate,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: Principal = Depends(get_current_principal),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Сохранить GPS координаты (для родителей)"""
     
@@ -412,58 +888,401 @@ async def save_location(
     )
     
     db.add(location)
-    db.commit()
-    db.refresh(location)
+    await db.commit()
+    await db.refresh(location)
+    await broadcast_location(
+        current_user.id, location.latitude, location.longitude, location.accuracy, location.timestamp
+    )
+    await check_geofences(db, current_user.id, [(location.latitude, location.longitude, location.timestamp)])
     
     return location
 
 
+@app.post(
+    "/locations/batch",
+    response_model=LocationBatchResponse,
+    openapi_extra={"requestBody": {
+        "required": True,
+        "content": {"application/json": {"schema": LocationBatch.model_json_schema()}}
+    }}
+)
+async def save_locations_batch(
+    request: Request,
+    current_user: Principal = Depends(get_current_principal),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Сохранить пакет GPS точек одним INSERT.
+    Тело: {"fixes": [[lat, lon, accuracy, timestamp], ...]}, можно сжать
+    gzip/deflate с заголовком Content-Encoding. Дубликаты, неточные и почти
+    не сдвинувшиеся точки отбрасываются до записи в БД
+    """
+    
+    body = await request.body()
+    encoding = request.headers.get("content-encoding", "").lower()
+    if encoding in ("gzip", "deflate"):
+        # wbits=47 принимает и gzip, и zlib заголовок
+        decompressor = zlib.decompressobj(wbits=47)
+        try:
+            body = decompressor.decompress(body, LOCATION_BATCH_MAX_BYTES)
+        except zlib.error:
+            raise HTTPException(status_code=400, detail="Invalid compressed body")
+        if decompressor.unconsumed_tail:
+            raise HTTPException(status_code=413, detail="Batch too large")
+    elif encoding not in ("", "identity"):
+        raise HTTPException(status_code=415, detail=f"Unsupported Content-Encoding: {encoding}")
+    
+    try:
+        batch = LocationBatch.model_validate_json(body)
+    except ValidationError as exc:
+        raise HTTPException(status_code=422, detail=exc.errors(include_url=False))
+    
+    # Точкам без времени — время приёма со сдвигом в 1 мс по порядку в пакете,
+    # чтобы они не сливались в одну и сохраняли очерёдность
+    received_at = time.time()
+    fixes = [
+        (latitude, longitude, accuracy, timestamp if timestamp is not None else received_at + index / 1000)
+        for index, (latitude, longitude, accuracy, timestamp) in enumerate(batch.fixes)
+    ]
+    kept = thin_fixes(fixes, LOCATION_MIN_DISTANCE_M, LOCATION_MAX_ACCURACY_M)
+    
+    if kept:
+        await db.execute(insert(Location).values([
+            {
+                "user_id": current_user.id,
+                "latitude": latitude,
+                "longitude": longitude,
+                "accuracy": accuracy,
+                "timestamp": datetime.utcfromtimestamp(timestamp)
+            }
+            for latitude, longitude, accuracy, timestamp in kept
+        ]))
+        await db.commit()
+        # Родителям важна текущая позиция: дальше уходит только последняя точка пакета
+        latitude, longitude, accuracy, timestamp = kept[-1]
+        await broadcast_location(
+            current_user.id, latitude, longitude, accuracy, datetime.utcfromtimestamp(timestamp)
+        )
+        # В зонах важен каждый переход, поэтому проверяются все точки пакета
+        await check_geofences(db, current_user.id, [
+            (latitude, longitude, datetime.utcfromtimestamp(timestamp))
+            for latitude, longitude, _, timestamp in kept
+        ])
+    
+    return {"received": len(fixes), "stored": len(kept), "skipped": len(fixes) - len(kept)}
+
+
 @app.get("/locations", response_model=List[LocationResponse])
 async def get_user_locations(
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: Principal = Depends(get_current_principal),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Получить историю GPS локаций"""
-    return db.query(Location).filter(Location.user_id == current_user.id).order_by(
+    return (await db.scalars(select(Location).where(Location.user_id == current_user.id).order_by(
         Location.timestamp.desc()
-    ).limit(10).all()
+    ).limit(10))).all()
+
+
+def track_segment(rows: list, tolerance_m: float) -> dict:
+    """Упрощённый кусок трека: Google polyline и времена точек дельтами в секундах"""
+    kept = [rows[i] for i in simplify_track([row[0] for row in rows], [row[1] for row in rows], tolerance_m)]
+    seconds = [round(row[2].replace(tzinfo=timezone.utc).timestamp()) for row in kept]
+    return {
+        "polyline": encode_polyline((row[0], row[1]) for row in kept),
+        "start": seconds[0],
+        "dt": [current - previous for previous, current in zip(seconds, seconds[1:])],
+        "points": len(rows),
+        "kept": len(kept)
+    }
+
+
+def track_query(user_id: int, start: datetime, end: datetime):
+    """Точки трека за [start, end) по индексу (user_id, timestamp)"""
+    return (
+        select(Location.latitude, Location.longitude, Location.timestamp)
+        .where(Location.user_id == user_id, Location.timestamp >= start, Location.timestamp < end)
+        .order_by(Location.timestamp)
+    )
+
+
+@app.get("/locations/track")
+async def get_location_track(
+    start: datetime = Query(..., alias="from"),
+    end: Optional[datetime] = Query(None, alias="to"),
+    child_id: Optional[int] = Query(None),
+    tolerance_m: float = Query(10.0, ge=0, le=1000),
+    current_user: Principal = Depends(get_current_principal),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Маршрут за период для воспроизведения. Точки упрощаются Douglas-Peucker
+    с допуском tolerance_m и кодируются Google polyline; время — Unix start
+    и дельты dt в секундах. Трек читается серверным курсором и отдаётся
+    потоком сегментов по TRACK_SEGMENT_SIZE точек (соседние сегменты
+    делят общую точку): {"user_id", "segments": [{polyline, start, dt, points, kept}]}
+    """
+    user_id = child_id or current_user.id
+    await ensure_can_watch(current_user, [user_id], db)
+    start = naive_utc(start)
+    end = naive_utc(end) if end else datetime.utcnow()
+    if end <= start or end - start > timedelta(days=TRACK_MAX_DAYS):
+        raise HTTPException(status_code=400, detail=f"Range must be positive and at most {TRACK_MAX_DAYS} days")
+    query = track_query(user_id, start, end).execution_options(yield_per=TRACK_SEGMENT_SIZE)
+    
+    async def segments():
+        yield b'{"user_id":%d,"segments":[' % user_id
+        previous = None
+        async with async_engine.connect() as conn:
+            result = await conn.stream(query)
+            async for rows in result.partitions():
+                rows = ([previous] if previous else []) + list(rows)
+                yield (b"," if previous else b"") + orjson.dumps(track_segment(rows, tolerance_m))
+                previous = rows[-1]
+        yield b"]}"
+    
+    return StreamingResponse(segments(), media_type="application/json")
+
+
+@app.get("/locations/latest", response_model=LastPosition)
+async def get_latest_location(
+    child_id: Optional[int] = Query(None),
+    current_user: Principal = Depends(get_current_principal),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Последняя известная позиция (своя или ребёнка) без чтения истории"""
+    user_id = child_id or current_user.id
+    await ensure_can_watch(current_user, [user_id], db)
+    positions = await last_positions.get_many([user_id], db)
+    if user_id not in positions:
+        raise HTTPException(status_code=404, detail="No locations yet")
+    return positions[user_id]
+
+
+@app.get("/locations/latest/batch", response_model=List[LastPosition])
+async def get_latest_locations(
+    child_id: List[int] = Query([]),
+    current_user: Principal = Depends(get_current_principal),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Последние позиции нескольких детей одним запросом; без child_id — всех своих детей"""
+    if not child_id:
+        child_id = list((await db.scalars(
+            select(User.id).where(User.parent_id == current_user.id).limit(MAX_WATCHED_CHILDREN)
+        )).all())
+        for user_id in child_id:
+            guardian_cache.set(user_id, current_user.id)
+    await ensure_can_watch(current_user, child_id, db)
+    positions = await last_positions.get_many(child_id, db)
+    return [positions[user_id] for user_id in child_id if user_id in positions]
+
+
+@app.websocket("/ws/locations")
+async def stream_locations_ws(
+    websocket: WebSocket,
+    token: Optional[str] = Query(None),
+    child_id: List[int] = Query([])
+):
+    """
+    Новые GPS точки детей по WebSocket: ws://.../ws/locations?token=...&child_id=1&child_id=2
+    Каждое сообщение — JSON {user_id, latitude, longitude, accuracy, timestamp}
+    """
+    try:
+        child_ids = await authorize_stream(token, websocket.headers.get("authorization"), child_id)
+    except HTTPException as exc:
+        code = status.WS_1013_TRY_AGAIN_LATER if exc.status_code == 503 else status.WS_1008_POLICY_VIOLATION
+        await websocket.close(code=code, reason=str(exc.detail))
+        return
+    await websocket.accept()
+    
+    async def send_messages():
+        try:
+            async for message in location_hub.messages(child_ids):
+                if message is not None:
+                    await websocket.send_text(message)
+            # Поток закончился: клиент слишком отстал
+            await websocket.close(code=status.WS_1013_TRY_AGAIN_LATER, reason="Slow consumer")
+        except StreamFull:
+            await websocket.close(code=status.WS_1013_TRY_AGAIN_LATER, reason="Too many location streams")
+    
+    async def wait_disconnect():
+        while (await websocket.receive())["type"] != "websocket.disconnect":
+            pass
+    
+    # Отключение клиента сразу отменяет отправку и снимает подписку
+    tasks = {asyncio.create_task(send_messages()), asyncio.create_task(wait_disconnect())}
+    done, pending = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+    for task in pending:
+        task.cancel()
+    for task in done:
+        exc = None if task.cancelled() else task.exception()
+        # обрыв соединения во время отправки — обычное отключение
+        if exc is not None and not isinstance(exc, (WebSocketDisconnect, RuntimeError)):
+            raise exc
+
+
+@app.get("/locations/stream")
+async def stream_locations_sse(
+    child_id: List[int] = Query([]),
+    token: Optional[str] = Query(None),
+    authorization: Optional[str] = Header(None)
+):
+    """Новые GPS точки детей как Server-Sent Events (для EventSource)"""
+    child_ids = await authorize_stream(token, authorization, child_id)
+    # Место занимается до ответа 200: после начала потока отказ уже не передать
+    try:
+        subscriber = location_hub.subscribe(child_ids)
+    except StreamFull:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Too many location streams",
+            headers={"Retry-After": "5"}
+        )
+    
+    async def events():
+        try:
+            async for message in location_hub.listen(subscriber):
+                # комментарий раз в heartbeat не даёт прокси закрыть простаивающее соединение
+                yield ": ping\n\n" if message is None else f"data: {message}\n\n"
+        finally:
+            location_hub.unsubscribe(subscriber)
+    
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        # если поток так и не начался (клиент ушёл сразу), подписка снимается здесь
+        background=BackgroundTask(location_hub.unsubscribe, subscriber)
+    )
+
+
+# === GEOFENCE ENDPOINTS ===
+@app.post("/geofences", response_model=GeofenceResponse, status_code=status.HTTP_201_CREATED)
+async def create_geofence(
+    geofence_data: GeofenceCreate,
+    current_user: Principal = Depends(get_current_principal),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Создать зону (круг или многоугольник) для своего ребёнка"""
+    await ensure_can_watch(current_user, [geofence_data.user_id], db)
+    geofence = Geofence(owner_id=current_user.id, **geofence_data.model_dump())
+    db.add(geofence)
+    await db.commit()
+    await db.refresh(geofence)
+    geofences.add(Fence.from_row(geofence))
+    return geofence
+
+
+@app.get("/geofences", response_model=List[GeofenceResponse])
+async def list_geofences(
+    child_id: Optional[int] = Query(None),
+    current_user: Principal = Depends(get_current_principal),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Зоны ребёнка или все созданные мной"""
+    query = select(Geofence).order_by(Geofence.id)
+    if child_id is not None:
+        await ensure_can_watch(current_user, [child_id], db)
+        query = query.where(Geofence.user_id == child_id)
+    else:
+        query = query.where(Geofence.owner_id == current_user.id)
+    return (await db.scalars(query)).all()
+
+
+@app.delete("/geofences/{geofence_id}", status_code=status.HTTP_204_NO_CONTENT)
+async def delete_geofence(
+    geofence_id: int,
+    current_user: Principal = Depends(get_current_principal),
+    db: AsyncSession = Depends(get_async_db)
+):
+    geofence = await db.get(Geofence, geofence_id)
+    if geofence is None:
+        raise HTTPException(status_code=404, detail="Geofence not found")
+    if geofence.owner_id != current_user.id and current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Not your geofence")
+    # SQLite не соблюдает ON DELETE CASCADE без PRAGMA foreign_keys
+    await db.execute(delete(GeofenceEvent).where(GeofenceEvent.geofence_id == geofence_id))
+    await db.delete(geofence)
+    await db.commit()
+    geofences.remove(geofence_id)
+
+
+@app.get("/geofences/events", response_model=List[GeofenceEventResponse])
+async def list_geofence_events(
+    child_id: Optional[int] = Query(None),
+    limit: int = Query(50, ge=1, le=500),
+    current_user: Principal = Depends(get_current_principal),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Последние входы и выходы ребёнка из зон"""
+    user_id = child_id or current_user.id
+    await ensure_can_watch(current_user, [user_id], db)
+    return (await db.scalars(
+        select(GeofenceEvent).where(GeofenceEvent.user_id == user_id)
+        .order_by(GeofenceEvent.timestamp.desc()).limit(limit)
+    )).all()
 
 
 # === CONTENT ENDPOINTS (CMS) ===
+# Неопубликованная дата (NULL) идёт в конце ленты
+CONTENT_KEYSET = Keyset(
+    "content_published", Content.published_at, Content.id, descending=True,
+    nulls_as={"published_at": datetime(1970, 1, 1)}
+)
+
+
 @app.get("/content", response_model=List[ContentResponse])
 async def get_content(
+    request: Request,
     content_type: Optional[str] = None,
     skip: int = 0,
-    limit: int = 10,
-    db: Session = Depends(get_db)
+    limit: int = Query(10, ge=1, le=100),
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(get_async_db)
 ):
-    """Получить опубликованный контент"""
-    query = db.query(Content).filter(Content.status == "published")
+    """
+    Получить опубликованный контент.
+    Следующая страница: cursor из заголовка X-Next-Cursor (skip игнорируется)
+    """
+    cached = await catalog_cache.lookup(request)
+    if cached is not None:
+        return cached
+    
+    query = select(Content).where(Content.status == "published")
     
     if content_type:
-        query = query.filter(Content.content_type == content_type)
+        query = query.where(Content.content_type == content_type)
     
-    return query.order_by(Content.published_at.desc()).offset(skip).limit(limit).all()
+    query = CONTENT_KEYSET.apply(query, cursor, limit)
+    if not cursor:
+        query = query.offset(skip)
+    
+    items, next_cursor = CONTENT_KEYSET.page((await db.scalars(query)).all(), limit)
+    headers = {NEXT_CURSOR_HEADER: next_cursor} if next_cursor else None
+    return await catalog_cache.store(request, List[ContentResponse], items, headers)
 
 
 @app.get("/content/{slug}", response_model=ContentResponse)
-async def get_content_by_slug(slug: str, db: Session = Depends(get_db)):
+async def get_content_by_slug(slug: str, request: Request, db: AsyncSession = Depends(get_async_db)):
     """Получить контент по slug"""
-    content = db.query(Content).filter(
+    cached = await catalog_cache.lookup(request)
+    if cached is not None:
+        return cached
+    
+    content = await db.scalar(select(Content).where(
         (Content.slug == slug) & (Content.status == "published")
-    ).first()
+    ))
     
     if not content:
         raise HTTPException(status_code=404, detail="Content not found")
     
-    return content
+    return await catalog_cache.store(request, ContentResponse, content)
 
 
 @app.post("/content", response_model=ContentResponse)
 async def create_content(
     content_data: ContentCreate,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Создать новый контент (только для админов и авторов)"""
     
@@ -480,8 +1299,9 @@ async def create_content(
     )
     
     db.add(content)
-    db.commit()
-    db.refresh(content)
+    await db.commit()
+    await db.refresh(content)
+    await catalog_cache.invalidate()
     
     return content
 
@@ -490,48 +1310,154 @@ async def create_content(
 @app.post("/analytics", response_model=AnalyticsResponse)
 async def log_event(
     event: AnalyticsEvent,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: Principal = Depends(get_current_principal),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Логировать аналитический событие"""
     
     analytics = Analytics(
         user_id=current_user.id,
         event_type=event.event_type,
-        event_data=json.dumps(event.event_data)
+        event_data=event.event_data
     )
     
     db.add(analytics)
-    db.commit()
-    db.refresh(analytics)
+    await db.commit()
+    await db.refresh(analytics)
     
     return analytics
 
 
+@app.post("/analytics/batch", response_model=AnalyticsBatchResponse, status_code=status.HTTP_202_ACCEPTED)
+async def log_events_batch(
+    batch: AnalyticsBatch,
+    current_user: Principal = Depends(get_current_principal)
+):
+    """Принять пакет событий; запись в БД выполняется фоновыми пакетами"""
+    
+    received_at = datetime.utcnow()
+    rows = [
+        {
+            "user_id": current_user.id,
+            "event_type": event.event_type,
+            "event_data": event.event_data,
+            "timestamp": received_at
+        }
+        for event in batch.events
+    ]
+    
+    try:
+        accepted = analytics_writer.submit(rows)
+    except QueueFull:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Очередь аналитики переполнена",
+            headers={"Retry-After": "1"}
+        )
+    
+    return {"accepted": accepted, "dropped": len(rows) - accepted}
+
+
+ANALYTICS_KEYSET = Keyset("analytics_time", Analytics.timestamp, Analytics.id, descending=True)
+
+
+@app.get("/analytics/events", response_model=List[AnalyticsAdminResponse])
+async def list_analytics_events(
+    response: Response,
+    user_id: Optional[int] = None,
+    event_type: Optional[str] = None,
+    game_id: Optional[int] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=500),
+    current_user: Principal = Depends(get_current_principal),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Лента событий аналитики, новые первыми (только для админов, курсорная пагинация)"""
+    
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Only admins can view analytics")
+    
+    query = select(Analytics)
+    if user_id is not None:
+        query = query.where(Analytics.user_id == user_id)
+    if event_type:
+        query = query.where(Analytics.event_type == event_type)
+    if game_id is not None:
+        # текст event_data->>'game_id', покрыт индексом ix_analytics_event_game_id_text
+        query = query.where(ANALYTICS_GAME_ID == str(game_id))
+    
+    query = ANALYTICS_KEYSET.apply(query, cursor, limit)
+    events, next_cursor = ANALYTICS_KEYSET.page((await db.scalars(query)).all(), limit)
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
+    
+    return [
+        AnalyticsAdminResponse(
+            id=event.id,
+            user_id=event.user_id,
+            event_type=event.event_type,
+            event_data=event.event_data or {},
+            timestamp=event.timestamp
+        )
+        for event in events
+    ]
+
+
 @app.get("/analytics/stats")
 async def get_analytics_stats(
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: Principal = Depends(get_current_principal),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Получить статистику (только для админов)"""
     
     if current_user.role != "admin":
         raise HTTPException(status_code=403, detail="Only admins can view analytics")
     
-    total_users = db.query(User).count()
-    active_users = db.query(User).filter(User.is_active == True).count()
-    total_games = db.query(Game).count()
-    total_films = db.query(Film).count()
-    completed_games = db.query(Progress).filter(Progress.completed == True).count()
+    # Счётчики поддерживаются триггерами при записи (см. stats.py)
+    counters = (await db.scalars(select(StatsCounter))).all()
     
-    return {
-        "total_users": total_users,
-        "active_users": active_users,
-        "total_games": total_games,
-        "total_films": total_films,
-        "completed_games": completed_games,
+    result = {counter.name: counter.value for counter in counters}
+    result.update({
+        "updated_at": max((c.updated_at for c in counters if c.updated_at), default=None),
+        "reconciled_at": min((c.reconciled_at for c in counters if c.reconciled_at), default=None),
         "timestamp": datetime.utcnow()
-    }
+    })
+    return result
+
+
+@app.post("/analytics/export", response_model=ExportStatus, status_code=status.HTTP_202_ACCEPTED)
+async def start_export(
+    export_request: ExportRequest,
+    current_user: Principal = Depends(get_current_principal)
+):
+    """Запустить выгрузку в Parquet в фоне (только для админов)"""
+    
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Only admins can export analytics")
+    
+    tables = export_request.tables or list(EXPORTS)
+    unknown = [name for name in tables if name not in EXPORTS]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown tables: {', '.join(unknown)}")
+    
+    try:
+        started = export_runner.start(tables)
+    except ExportUnavailable as exc:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=str(exc))
+    if not started:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Export is already running")
+    
+    return export_runner.status()
+
+
+@app.get("/analytics/export", response_model=ExportStatus)
+async def get_export_status(current_user: Principal = Depends(get_current_principal)):
+    """Состояние последней выгрузки и сохранённые позиции (только для админов)"""
+    
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Only admins can export analytics")
+    
+    return export_runner.status()
 
 
 if __name__ == "__main__":
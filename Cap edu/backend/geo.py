@@ -0,0 +1,155 @@
+"""
+Геоутилиты для GPS данных
+"""
+
+import math
+from typing import Iterable, List, Optional, Sequence, Tuple
+
+try:
+    import numpy as np
+except ImportError:  # без NumPy упрощение трека считается на чистом Python
+    np = None
+
+EARTH_RADIUS_M = 6371008.8
+METERS_PER_DEGREE = math.pi * EARTH_RADIUS_M / 180
+NUMPY_MIN_SPAN = 32
+
+# (latitude, longitude, accuracy, timestamp)
+Fix = Tuple[float, float, Optional[float], float]
+
+
+def haversine_m(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """Расстояние по поверхности Земли в метрах"""
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    dphi = phi2 - phi1
+    dlambda = math.radians(lon2 - lon1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlambda / 2) ** 2
+    return 2 * EARTH_RADIUS_M * math.asin(min(1.0, math.sqrt(a)))
+
+
+def thin_fixes(
+    fixes: Sequence[Fix],
+    min_distance_m: float = 10.0,
+    max_accuracy_m: Optional[float] = 100.0,
+) -> List[Fix]:
+    """
+    Отбросить дубликаты (то же время и те же координаты), неточные точки
+    и точки, почти не сдвинувшиеся относительно последней сохранённой.
+    Порог сдвига — не меньше погрешности самой точки, чтобы дрожание GPS
+    на месте не писалось в БД
+    """
+    kept: List[Fix] = []
+    seen = set()
+    for fix in sorted(fixes, key=lambda f: f[3]):
+        latitude, longitude, accuracy, timestamp = fix
+        if (timestamp, latitude, longitude) in seen:
+            continue
+        seen.add((timestamp, latitude, longitude))
+        if max_accuracy_m is not None and accuracy is not None and accuracy > max_accuracy_m:
+            continue
+        if kept:
+            last = kept[-1]
+            threshold = max(min_distance_m, accuracy or 0.0)
+            if haversine_m(last[0], last[1], latitude, longitude) < threshold:
+                continue
+        kept.append(fix)
+    return kept
+
+
+def _segment_distances(xs, ys, ax: float, ay: float, bx: float, by: float):
+    """Расстояния от точек до отрезка A-B (NumPy массивы)"""
+    dx, dy = bx - ax, by - ay
+    length2 = dx * dx + dy * dy
+    if length2 == 0:
+        return np.hypot(xs - ax, ys - ay)
+    t = np.clip(((xs - ax) * dx + (ys - ay) * dy) / length2, 0.0, 1.0)
+    return np.hypot(xs - (ax + t * dx), ys - (ay + t * dy))
+
+
+def _segment_distance(x: float, y: float, ax: float, ay: float, bx: float, by: float) -> float:
+    dx, dy = bx - ax, by - ay
+    length2 = dx * dx + dy * dy
+    t = 0.0 if length2 == 0 else min(1.0, max(0.0, ((x - ax) * dx + (y - ay) * dy) / length2))
+    return math.hypot(x - (ax + t * dx), y - (ay + t * dy))
+
+
+def simplify_track(latitudes: Sequence[float], longitudes: Sequence[float], tolerance_m: float) -> List[int]:
+    """
+    Douglas-Peucker: индексы точек, без которых трек отклоняется больше чем
+    на tolerance_m. Координаты проецируются в метры с масштабом долготы по
+    широте первой точки (для треков в пределах города погрешность мала).
+    Рекурсия заменена стеком; на длинных участках расстояния до отрезка
+    считаются векторно через NumPy, если он установлен
+    """
+    count = len(latitudes)
+    if count < 3 or tolerance_m <= 0:
+        return list(range(count))
+    scale_x = METERS_PER_DEGREE * math.cos(math.radians(latitudes[0]))
+    stack = [(0, count - 1)]
+
+    xs = [longitude * scale_x for longitude in longitudes]
+    ys = [latitude * METERS_PER_DEGREE for latitude in latitudes]
+    if np is not None:
+        x_array, y_array = np.array(xs), np.array(ys)
+    keep = [False] * count
+    keep[0] = keep[-1] = True
+    while stack:
+        start, end = stack.pop()
+        farthest, max_distance = None, tolerance_m
+        if np is not None and end - start > NUMPY_MIN_SPAN:
+            distances = _segment_distances(
+                x_array[start + 1:end], y_array[start + 1:end], xs[start], ys[start], xs[end], ys[end]
+            )
+            candidate = int(distances.argmax())
+            if distances[candidate] > tolerance_m:
+                farthest = start + 1 + candidate
+        else:
+            # на коротких отрезках накладные расходы NumPy больше выигрыша
+            for i in range(start + 1, end):
+                distance = _segment_distance(xs[i], ys[i], xs[start], ys[start], xs[end], ys[end])
+                if distance > max_distance:
+                    farthest, max_distance = i, distance
+        if farthest is not None:
+            keep[farthest] = True
+            stack.append((start, farthest))
+            stack.append((farthest, end))
+    return [i for i, kept in enumerate(keep) if kept]
+
+
+def encode_polyline(points: Iterable[Tuple[float, float]], precision: int = 5) -> str:
+    """Google Encoded Polyline: дельты координат в base64-подобных символах (~1 м при precision=5)"""
+    factor = 10 ** precision
+    chars = []
+    previous_lat = previous_lon = 0
+    for latitude, longitude in points:
+        lat, lon = round(latitude * factor), round(longitude * factor)
+        for delta in (lat - previous_lat, lon - previous_lon):
+            value = ~(delta << 1) if delta < 0 else delta << 1
+            while value >= 0x20:
+                chars.append(chr((0x20 | (value & 0x1F)) + 63))
+                value >>= 5
+            chars.append(chr(value + 63))
+        previous_lat, previous_lon = lat, lon
+    return "".join(chars)
+
+
+def decode_polyline(encoded: str, precision: int = 5) -> List[Tuple[float, float]]:
+    factor = 10 ** precision
+    points = []
+    index = lat = lon = 0
+    while index < len(encoded):
+        deltas = []
+        for _ in range(2):
+            shift = result = 0
+            while True:
+                value = ord(encoded[index]) - 63
+                index += 1
+                result |= (value & 0x1F) << shift
+                shift += 5
+                if value < 0x20:
+                    break
+            deltas.append(~(result >> 1) if result & 1 else result >> 1)
+        lat += deltas[0]
+        lon += deltas[1]
+        points.append((lat / factor, lon / factor))
+    return points
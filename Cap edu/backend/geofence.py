@@ -0,0 +1,313 @@
+"""
+Геозоны (дом, школа) и события входа/выхода ребёнка
+Все зоны держатся в памяти в сеточном индексе: ключ клетки — (user_id, x, y),
+где x, y — номер клетки GEOFENCE_CELL_DEG градусов. Точка проверяется только
+против зон своего ребёнка в своей клетке, поэтому проверка не зависит от
+общего числа зон. Зоны с очень большой рамкой хранятся отдельным списком.
+
+Кто в какой зоне сейчас: в Redis (общий для воркеров) или в памяти; при
+промахе состояние восстанавливается по последним событиям из geofence_events.
+Индекс догружает изменённые зоны каждые GEOFENCE_RELOAD_INTERVAL секунд,
+поэтому зоны, созданные через другой воркер, начинают работать с задержкой.
+"""
+
+import asyncio
+import math
+import os
+from collections import Counter
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Dict, List, Optional, Sequence, Set, Tuple
+
+import orjson
+from sqlalchemy import func, insert, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from cache import RedisError, get_redis, mark_redis_down
+from database import async_engine
+from geo import METERS_PER_DEGREE, haversine_m
+from models import Geofence, GeofenceEvent
+
+STATE_TTL = 7 * 24 * 3600
+
+FENCE_COLUMNS = (
+    Geofence.id, Geofence.user_id, Geofence.name, Geofence.kind,
+    Geofence.latitude, Geofence.longitude, Geofence.radius_m, Geofence.points,
+)
+
+
+def point_in_polygon(latitude: float, longitude: float, points: Sequence[Tuple[float, float]]) -> bool:
+    """Ray casting в координатах lat/lon: зоны небольшие, искажением проекции можно пренебречь"""
+    inside = False
+    previous_lat, previous_lon = points[-1]
+    for point_lat, point_lon in points:
+        if (point_lat > latitude) != (previous_lat > latitude):
+            crossing = point_lon + (latitude - point_lat) * (previous_lon - point_lon) / (previous_lat - point_lat)
+            if longitude < crossing:
+                inside = not inside
+        previous_lat, previous_lon = point_lat, point_lon
+    return inside
+
+
+@dataclass(frozen=True)
+class Fence:
+    id: int
+    user_id: int
+    name: str
+    kind: str
+    latitude: Optional[float] = None
+    longitude: Optional[float] = None
+    radius_m: Optional[float] = None
+    points: Tuple[Tuple[float, float], ...] = ()
+
+    @classmethod
+    def from_row(cls, row) -> "Fence":
+        points = tuple((float(lat), float(lon)) for lat, lon in row.points or ())
+        return cls(row.id, row.user_id, row.name, row.kind, row.latitude, row.longitude, row.radius_m, points)
+
+    def bbox(self) -> Tuple[float, float, float, float]:
+        """(min_lat, min_lon, max_lat, max_lon)"""
+        if self.kind == "circle":
+            dlat = self.radius_m / METERS_PER_DEGREE
+            dlon = self.radius_m / (METERS_PER_DEGREE * max(math.cos(math.radians(self.latitude)), 1e-6))
+            return self.latitude - dlat, self.longitude - dlon, self.latitude + dlat, self.longitude + dlon
+        lats = [lat for lat, _ in self.points]
+        lons = [lon for _, lon in self.points]
+        return min(lats), min(lons), max(lats), max(lons)
+
+    def contains(self, latitude: float, longitude: float) -> bool:
+        if self.kind == "circle":
+            return haversine_m(self.latitude, self.longitude, latitude, longitude) <= self.radius_m
+        return point_in_polygon(latitude, longitude, self.points)
+
+
+class GeofenceIndex:
+    """Сетка клеток (user_id, x, y) -> зоны, чья рамка задевает клетку"""
+
+    def __init__(self, cell_deg: float = 0.01, max_cells: int = 1024):
+        self.cell_deg = cell_deg
+        self.max_cells = max_cells
+        self.fences: Dict[int, Fence] = {}
+        self._cells: Dict[Tuple[int, int, int], List[Fence]] = {}
+        self._large: Dict[int, List[Fence]] = {}
+        self._users: Counter = Counter()
+
+    def _cell(self, degrees: float) -> int:
+        return math.floor(degrees / self.cell_deg)
+
+    def _keys(self, fence: Fence) -> Optional[List[Tuple[int, int, int]]]:
+        min_lat, min_lon, max_lat, max_lon = fence.bbox()
+        xs = range(self._cell(min_lat), self._cell(max_lat) + 1)
+        ys = range(self._cell(min_lon), self._cell(max_lon) + 1)
+        if len(xs) * len(ys) > self.max_cells:
+            return None
+        return [(fence.user_id, x, y) for x in xs for y in ys]
+
+    def add(self, fence: Fence):
+        self.remove(fence.id)
+        self.fences[fence.id] = fence
+        self._users[fence.user_id] += 1
+        keys = self._keys(fence)
+        if keys is None:
+            self._large.setdefault(fence.user_id, []).append(fence)
+            return
+        for key in keys:
+            self._cells.setdefault(key, []).append(fence)
+
+    def remove(self, fence_id: int):
+        fence = self.fences.pop(fence_id, None)
+        if fence is None:
+            return
+        self._users[fence.user_id] -= 1
+        if not self._users[fence.user_id]:
+            del self._users[fence.user_id]
+        keys = self._keys(fence)
+        buckets = [(self._large, fence.user_id)] if keys is None else [(self._cells, key) for key in keys]
+        for mapping, key in buckets:
+            bucket = mapping[key]
+            bucket.remove(fence)
+            if not bucket:
+                del mapping[key]
+
+    def has_user(self, user_id: int) -> bool:
+        return user_id in self._users
+
+    def containing(self, user_id: int, latitude: float, longitude: float) -> Set[int]:
+        """id зон ребёнка, в которых лежит точка"""
+        inside = set()
+        for fence in self._cells.get((user_id, self._cell(latitude), self._cell(longitude)), ()):
+            if fence.contains(latitude, longitude):
+                inside.add(fence.id)
+        for fence in self._large.get(user_id, ()):
+            if fence.contains(latitude, longitude):
+                inside.add(fence.id)
+        return inside
+
+    def __len__(self) -> int:
+        return len(self.fences)
+
+
+class GeofenceEngine:
+    """Индекс зон, состояние «внутри» по детям и запись событий"""
+
+    redis_prefix = "geofence:inside:"
+
+    def __init__(self, cell_deg: float = 0.01, reload_interval: float = 60.0):
+        self.cell_deg = cell_deg
+        self.reload_interval = reload_interval
+        self.index = GeofenceIndex(cell_deg)
+        self._inside: Dict[int, Set[int]] = {}
+        self._watermark: Optional[datetime] = None
+        self._task = None
+        self.evaluated = 0
+        self.events = 0
+        self.rebuilds = 0
+
+    @classmethod
+    def from_env(cls) -> "GeofenceEngine":
+        return cls(
+            cell_deg=float(os.getenv("GEOFENCE_CELL_DEG", "0.01")),
+            reload_interval=float(os.getenv("GEOFENCE_RELOAD_INTERVAL", "60")),
+        )
+
+    def add(self, fence: Fence):
+        self.index.add(fence)
+
+    def remove(self, fence_id: int):
+        self.index.remove(fence_id)
+
+    async def refresh(self):
+        """Догрузить зоны, изменённые после прошлой загрузки; при удалениях — перестроить"""
+        async with async_engine.connect() as conn:
+            total = await conn.scalar(select(func.count()).select_from(Geofence))
+            watermark = await conn.scalar(select(func.max(Geofence.updated_at)))
+            query = select(*FENCE_COLUMNS)
+            incremental = self._watermark is not None
+            if incremental:
+                query = query.where(Geofence.updated_at >= self._watermark)
+            rows = (await conn.execute(query)).all()
+
+        if incremental:
+            for row in rows:
+                self.index.add(Fence.from_row(row))
+            if len(self.index) != total:
+                # Зоны удалялись (или запись закоммитилась позже прочитанного
+                # watermark): инкрементально этого не увидеть
+                self._watermark = None
+                await self.refresh()
+                return
+        else:
+            # 100k зон строятся около секунды: в потоке, чтобы не блокировать цикл событий.
+            # Новый индекс подменяется целиком: проверки видят старый или новый
+            self.index = await asyncio.get_running_loop().run_in_executor(None, self._build, rows)
+            self.rebuilds += 1
+        self._watermark = watermark
+
+    def _build(self, rows) -> GeofenceIndex:
+        index = GeofenceIndex(self.cell_deg)
+        for row in rows:
+            index.add(Fence.from_row(row))
+        return index
+
+    async def _load_state(self, db: AsyncSession, user_id: int) -> Set[int]:
+        redis = get_redis()
+        if redis is not None:
+            try:
+                raw = await redis.get(f"{self.redis_prefix}{user_id}")
+                if raw is not None:
+                    return set(orjson.loads(raw))
+            except RedisError:
+                mark_redis_down()
+        elif user_id in self._inside:
+            return self._inside[user_id]
+
+        latest = (
+            select(func.max(GeofenceEvent.id).label("id"))
+            .where(GeofenceEvent.user_id == user_id)
+            .group_by(GeofenceEvent.geofence_id)
+            .subquery()
+        )
+        rows = await db.execute(
+            select(GeofenceEvent.geofence_id, GeofenceEvent.event).join(latest, GeofenceEvent.id == latest.c.id)
+        )
+        return {geofence_id for geofence_id, event in rows if event == "enter"}
+
+    async def _save_state(self, user_id: int, inside: Set[int]):
+        self._inside[user_id] = inside
+        redis = get_redis()
+        if redis is not None:
+            try:
+                await redis.set(f"{self.redis_prefix}{user_id}", orjson.dumps(sorted(inside)), ex=STATE_TTL)
+            except RedisError:
+                mark_redis_down()
+
+    async def evaluate(
+        self,
+        db: AsyncSession,
+        user_id: int,
+        fixes: Sequence[Tuple[float, float, datetime]]
+    ) -> List[dict]:
+        """Проверить точки ребёнка (по возрастанию времени), записать и вернуть события"""
+        index = self.index
+        if not index.has_user(user_id):
+            return []
+        # зоны, удалённые с прошлой точки, выпадают из состояния без события exit
+        before = await self._load_state(db, user_id) & index.fences.keys()
+        inside = before
+        events = []
+        for latitude, longitude, timestamp in fixes:
+            current = index.containing(user_id, latitude, longitude)
+            for event, fence_ids in (("exit", inside - current), ("enter", current - inside)):
+                for fence_id in sorted(fence_ids):
+                    events.append({
+                        "event": event,
+                        "geofence_id": fence_id,
+                        "name": index.fences[fence_id].name,
+                        "user_id": user_id,
+                        "latitude": latitude,
+                        "longitude": longitude,
+                        "timestamp": timestamp
+                    })
+            inside = current
+        self.evaluated += len(fixes)
+
+        if events:
+            await db.execute(insert(GeofenceEvent), [
+                {key: value for key, value in event.items() if key != "name"} for event in events
+            ])
+            await db.commit()
+            self.events += len(events)
+        if inside != before or user_id not in self._inside:
+            await self._save_state(user_id, inside)
+        return events
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.reload_interval)
+            try:
+                await self.refresh()
+            except Exception as exc:
+                print(f"⚠️ Geofence reload failed: {exc}")
+
+    async def start(self):
+        if self._task is None:
+            await self.refresh()
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def stats(self) -> dict:
+        return {
+            "fences": len(self.index),
+            "tracked_users": len(self._inside),
+            "evaluated": self.evaluated,
+            "events": self.events,
+            "rebuilds": self.rebuilds,
+        }
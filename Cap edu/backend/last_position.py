@@ -0,0 +1,136 @@
+"""
+Последняя известная позиция пользователей для панели родителя
+save_location обновляет запись при каждой новой точке, поэтому «где ребёнок
+сейчас» отвечается по ключу, без ORDER BY по истории locations.
+
+С REDIS_URL позиции лежат в одном хэше Redis (общем для воркеров, пакет
+детей читается одним HMGET). Без Redis — в памяти процесса с коротким TTL:
+точки, принятые другими воркерами, подхватываются из БД после истечения
+записи. При промахе последняя точка читается из БД по индексу
+(user_id, timestamp DESC) и сохраняется в хранилище.
+"""
+
+import os
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List
+
+import orjson
+from sqlalchemy import Select, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from cache import TTLCache, RedisError, get_redis, mark_redis_down
+from models import Location
+
+# Точка записывается, только если она не старше сохранённой:
+# пакеты, выгруженные телефоном после офлайна, не откатывают позицию назад
+UPDATE_IF_NEWER = """
+local current = tonumber(redis.call('HGET', KEYS[2], ARGV[1]))
+if current and current > tonumber(ARGV[2]) then
+    return 0
+end
+redis.call('HSET', KEYS[1], ARGV[1], ARGV[3])
+redis.call('HSET', KEYS[2], ARGV[1], ARGV[2])
+return 1
+"""
+
+
+def _epoch(moment: datetime) -> float:
+    return moment.replace(tzinfo=timezone.utc).timestamp()
+
+
+def latest_query(user_ids: List[int]) -> Select:
+    """Последняя точка каждого пользователя: по одному LIMIT 1 по индексу на пользователя"""
+    latest_ids = [
+        select(Location.id)
+        .where(Location.user_id == user_id)
+        .order_by(Location.timestamp.desc())
+        .limit(1)
+        .scalar_subquery()
+        for user_id in user_ids
+    ]
+    return (
+        select(Location.user_id, Location.latitude, Location.longitude, Location.accuracy, Location.timestamp)
+        .where(Location.id.in_(latest_ids))
+    )
+
+
+async def load_latest(db: AsyncSession, user_ids: List[int]) -> Dict[int, dict]:
+    rows = await db.execute(latest_query(user_ids))
+    return {row.user_id: dict(row._mapping) for row in rows}
+
+
+class LastPositionStore:
+    """user_id -> {user_id, latitude, longitude, accuracy, timestamp}"""
+
+    redis_key = "locations:last"
+    redis_time_key = "locations:last:ts"
+
+    def __init__(self, maxsize: int = 100000, ttl: float = 30.0):
+        self.local = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._update_script = None
+        self.redis_hits = 0
+        self.db_loads = 0
+
+    @classmethod
+    def from_env(cls) -> "LastPositionStore":
+        return cls(
+            maxsize=int(os.getenv("LAST_POSITION_CACHE_SIZE", "100000")),
+            ttl=float(os.getenv("LAST_POSITION_TTL", "30")),
+        )
+
+    def _update_local(self, fix: dict):
+        current = self.local.get(fix["user_id"])
+        if current is None or current["timestamp"] <= fix["timestamp"]:
+            self.local.set(fix["user_id"], fix)
+
+    async def update(self, fix: dict):
+        """Записать новую точку; более старая, чем сохранённая, игнорируется"""
+        redis = get_redis()
+        if redis is not None:
+            if self._update_script is None:
+                self._update_script = redis.register_script(UPDATE_IF_NEWER)
+            try:
+                await self._update_script(
+                    keys=[self.redis_key, self.redis_time_key],
+                    args=[fix["user_id"], _epoch(fix["timestamp"]), orjson.dumps(fix)],
+                    client=redis,
+                )
+                return
+            except RedisError:
+                mark_redis_down()
+        self._update_local(fix)
+
+    async def get_many(self, user_ids: Iterable[int], db: AsyncSession) -> Dict[int, dict]:
+        """Последние позиции; пользователи без единой точки отсутствуют в ответе"""
+        user_ids = list(dict.fromkeys(user_ids))
+        positions: Dict[int, dict] = {}
+        redis = get_redis()
+        from_redis = False
+        if redis is not None:
+            try:
+                for user_id, raw in zip(user_ids, await redis.hmget(self.redis_key, user_ids)):
+                    if raw is not None:
+                        fix = orjson.loads(raw)
+                        fix["timestamp"] = datetime.fromisoformat(fix["timestamp"])
+                        positions[user_id] = fix
+                self.redis_hits += len(positions)
+                from_redis = True
+            except RedisError:
+                mark_redis_down()
+        if not from_redis:
+            for user_id in user_ids:
+                fix = self.local.get(user_id)
+                if fix is not None:
+                    positions[user_id] = fix
+
+        missing = [user_id for user_id in user_ids if user_id not in positions]
+        if missing:
+            self.db_loads += 1
+            loaded = await load_latest(db, missing)
+            for fix in loaded.values():
+                await self.update(fix)
+            positions.update(loaded)
+        return positions
+
+    def stats(self) -> dict:
+        return {**self.local.stats(), "redis_hits": self.redis_hits, "db_loads": self.db_loads}
@@ -0,0 +1,481 @@
+"""
+Рейтинги игроков: общий, по игре и по возрастной группе
+Таблицы хранятся заранее отсортированными и обновляются из save_progress,
+поэтому топ-N и «моё место» не сортируют progress на каждый запрос:
+
+    game:<id>    лучший счёт пользователя в игре (Progress.score)
+    global       сумма лучших счетов по всем играм
+    age:<группа> то же, что global, среди пользователей группы (LEADERBOARD_AGE_BANDS)
+
+С REDIS_URL таблицы — sorted set в Redis (общие для воркеров), без Redis —
+skip list в памяти процесса. Обе структуры дают место и топ за O(log n).
+Раз в LEADERBOARD_REBUILD_INTERVAL секунд таблицы пересобираются из progress,
+что исправляет пропущенные обновления и смену возраста. В Redis пересборку
+ведёт один воркер под флагом: пока он стоит, record всех воркеров дублирует
+обновления в очередь, и после подмены таблиц они применяются поверх снимка.
+Пока Redis недоступен или таблицы в памяти ещё не собраны, ответы считаются
+запросом к БД.
+"""
+
+import asyncio
+import os
+import random
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+import orjson
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from cache import TTLCache, RedisError, get_redis, mark_redis_down
+from models import Progress, User
+
+GLOBAL = "global"
+MAX_LEVEL = 32
+
+# KEYS: флаг пересборки, очередь пересборки, таблица игры, общий и возрастной рейтинги.
+# Лучший счёт растёт только вверх; общий и возрастной рейтинги получают разницу.
+# Во время пересборки обновление ещё и ставится в очередь (ARGV[3])
+RECORD_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 1 then
+    redis.call('RPUSH', KEYS[2], ARGV[3])
+end
+local old = tonumber(redis.call('ZSCORE', KEYS[3], ARGV[1]))
+local new = tonumber(ARGV[2])
+if old and old >= new then
+    return 0
+end
+local delta = new - (old or 0)
+redis.call('ZADD', KEYS[3], new, ARGV[1])
+for i = 4, #KEYS do
+    redis.call('ZINCRBY', KEYS[i], delta, ARGV[1])
+end
+return 1
+"""
+
+
+class _Node:
+    __slots__ = ("key", "forward", "span")
+
+    def __init__(self, key: Optional[tuple], level: int):
+        self.key = key
+        self.forward: List[Optional["_Node"]] = [None] * level
+        self.span = [0] * level
+
+
+class SortedScores:
+    """
+    Skip list с длинами переходов (как zset в Redis): порядок по убыванию
+    счёта, при равенстве — по user_id; место и элемент по месту за O(log n)
+    """
+
+    def __init__(self):
+        self._head = _Node(None, MAX_LEVEL)
+        self._level = 1
+        self._length = 0
+        self._scores: Dict[int, float] = {}
+
+    @classmethod
+    def from_scores(cls, scores: Dict[int, float]) -> "SortedScores":
+        """Собрать из готовых счетов: сортировка и один проход вместо n вставок"""
+        board = cls()
+        board._scores = dict(scores)
+        last = [board._head] * MAX_LEVEL
+        last_rank = [0] * MAX_LEVEL
+        for rank, key in enumerate(sorted((-score, member) for member, score in board._scores.items()), 1):
+            level = cls._random_level()
+            node = _Node(key, level)
+            for i in range(level):
+                last[i].forward[i] = node
+                last[i].span[i] = rank - last_rank[i]
+                last[i] = node
+                last_rank[i] = rank
+            board._level = max(board._level, level)
+        board._length = len(board._scores)
+        # переход последнего узла уровня в конец списка, как после _insert
+        for i in range(board._level):
+            last[i].span[i] = board._length - last_rank[i]
+        return board
+
+    @staticmethod
+    def _random_level() -> int:
+        level = 1
+        while level < MAX_LEVEL and random.random() < 0.25:
+            level += 1
+        return level
+
+    def _insert(self, key: tuple):
+        update = [self._head] * MAX_LEVEL
+        rank = [0] * MAX_LEVEL
+        node = self._head
+        for i in reversed(range(self._level)):
+            rank[i] = rank[i + 1] if i + 1 < self._level else 0
+            while node.forward[i] is not None and node.forward[i].key < key:
+                rank[i] += node.span[i]
+                node = node.forward[i]
+            update[i] = node
+        level = self._random_level()
+        if level > self._level:
+            for i in range(self._level, level):
+                self._head.span[i] = self._length
+            self._level = level
+        new = _Node(key, level)
+        for i in range(level):
+            new.forward[i] = update[i].forward[i]
+            update[i].forward[i] = new
+            new.span[i] = update[i].span[i] - (rank[0] - rank[i])
+            update[i].span[i] = rank[0] - rank[i] + 1
+        for i in range(level, self._level):
+            update[i].span[i] += 1
+        self._length += 1
+
+    def _delete(self, key: tuple):
+        update = [self._head] * MAX_LEVEL
+        node = self._head
+        for i in reversed(range(self._level)):
+            while node.forward[i] is not None and node.forward[i].key < key:
+                node = node.forward[i]
+            update[i] = node
+        target = node.forward[0]
+        for i in range(self._level):
+            if update[i].forward[i] is target:
+                update[i].span[i] += target.span[i] - 1
+                update[i].forward[i] = target.forward[i]
+            else:
+                update[i].span[i] -= 1
+        while self._level > 1 and self._head.forward[self._level - 1] is None:
+            self._level -= 1
+        self._length -= 1
+
+    def set(self, member: int, score: float):
+        old = self._scores.get(member)
+        if old == score:
+            return
+        if old is not None:
+            self._delete((-old, member))
+        self._scores[member] = score
+        self._insert((-score, member))
+
+    def increment(self, member: int, delta: float):
+        self.set(member, self._scores.get(member, 0) + delta)
+
+    def score(self, member: int) -> Optional[float]:
+        return self._scores.get(member)
+
+    def rank(self, member: int) -> Optional[int]:
+        """Место с нуля или None, если участника нет"""
+        score = self._scores.get(member)
+        if score is None:
+            return None
+        key = (-score, member)
+        rank = 0
+        node = self._head
+        for i in reversed(range(self._level)):
+            while node.forward[i] is not None and node.forward[i].key <= key:
+                rank += node.span[i]
+                node = node.forward[i]
+        return rank - 1
+
+    def top(self, limit: int, offset: int = 0) -> List[Tuple[int, float]]:
+        # спуск к месту offset по длинам переходов, дальше — по нижнему уровню
+        traversed = 0
+        node = self._head
+        for i in reversed(range(self._level)):
+            while node.forward[i] is not None and traversed + node.span[i] <= offset:
+                traversed += node.span[i]
+                node = node.forward[i]
+        entries = []
+        node = node.forward[0]
+        while node is not None and len(entries) < limit:
+            entries.append((node.key[1], -node.key[0]))
+            node = node.forward[0]
+        return entries
+
+    def __len__(self) -> int:
+        return self._length
+
+
+def parse_age_bands(value: str) -> Dict[str, Tuple[int, int]]:
+    """'6-8,9-12' -> {'6-8': (6, 8), '9-12': (9, 12)}"""
+    bands = {}
+    for band in filter(None, (part.strip() for part in value.split(","))):
+        low, _, high = band.partition("-")
+        bands[band] = (int(low), int(high))
+    return bands
+
+
+def _load_scores(engine) -> List[tuple]:
+    """(user_id, game_id, score, age) по всем записям progress"""
+    with engine.connect() as conn:
+        return conn.execute(
+            select(Progress.user_id, Progress.game_id, Progress.score, User.age)
+            .join(User, User.id == Progress.user_id)
+            .where(Progress.score > 0)
+        ).all()
+
+
+class Leaderboards:
+    redis_prefix = "leaderboard:"
+    # Флаг живёт дольше любой пересборки; если воркер упал, он сам истечёт
+    rebuild_lock_ttl = 600
+
+    def __init__(self, age_bands: Optional[Dict[str, Tuple[int, int]]] = None, rebuild_interval: float = 3600.0):
+        self.age_bands = age_bands or {}
+        self.rebuild_interval = rebuild_interval
+        self._boards: Dict[str, SortedScores] = {}
+        self._ready = False
+        self._pending: Optional[list] = None  # обновления, пришедшие во время пересборки
+        self._ages = TTLCache(maxsize=100000, ttl=600.0)
+        self._task = None
+        self._record_script = None
+        self.updates = 0
+        self.rebuilds = 0
+        self.rebuilt_at: Optional[datetime] = None
+        self.db_fallbacks = 0
+
+    @classmethod
+    def from_env(cls) -> "Leaderboards":
+        return cls(
+            age_bands=parse_age_bands(os.getenv("LEADERBOARD_AGE_BANDS", "3-5,6-8,9-12,13-17")),
+            rebuild_interval=float(os.getenv("LEADERBOARD_REBUILD_INTERVAL", "3600")),
+        )
+
+    def band(self, age: Optional[int]) -> Optional[str]:
+        if age is None:
+            return None
+        for name, (low, high) in self.age_bands.items():
+            if low <= age <= high:
+                return name
+        return None
+
+    def _boards_for(self, game_id: int, band: Optional[str]) -> List[str]:
+        return [f"game:{game_id}", GLOBAL] + ([f"age:{band}"] if band else [])
+
+    async def _band_of(self, db: AsyncSession, user_id: int) -> Optional[str]:
+        band = self._ages.get(user_id)
+        if band is None:
+            band = self.band(await db.scalar(select(User.age).where(User.id == user_id))) or ""
+            self._ages.set(user_id, band)
+        return band or None
+
+    def forget_user(self, user_id: int):
+        """Возраст изменился: группа определится заново, таблицы поправит пересборка"""
+        self._ages.pop(user_id)
+
+    def _apply(self, boards: Dict[str, SortedScores], user_id: int, game_id: int, score: int, band: Optional[str]):
+        names = self._boards_for(game_id, band)
+        game_board = boards.setdefault(names[0], SortedScores())
+        old = game_board.score(user_id)
+        if old is not None and old >= score:
+            return
+        game_board.set(user_id, score)
+        for name in names[1:]:
+            boards.setdefault(name, SortedScores()).increment(user_id, score - (old or 0))
+
+    async def _record_redis(self, redis, names: List[str], user_id: int, score: int):
+        if self._record_script is None:
+            self._record_script = redis.register_script(RECORD_SCRIPT)
+        keys = [self.redis_prefix + "rebuilding", self.redis_prefix + "rebuild:queue"]
+        keys += [self.redis_prefix + name for name in names]
+        entry = orjson.dumps([names, user_id, score])
+        await self._record_script(keys=keys, args=[user_id, score, entry], client=redis)
+
+    async def record(self, db: AsyncSession, user_id: int, game_id: int, score: int):
+        """Лучший счёт пользователя в игре после save_progress"""
+        if score <= 0:
+            return
+        band = await self._band_of(db, user_id)
+        self.updates += 1
+        redis = get_redis()
+        if redis is not None:
+            try:
+                await self._record_redis(redis, self._boards_for(game_id, band), user_id, score)
+            except RedisError:
+                mark_redis_down()
+            return
+        if self._pending is not None:
+            self._pending.append((user_id, game_id, score, band))
+        self._apply(self._boards, user_id, game_id, score, band)
+
+    async def _redis_board(self, redis, board: str, user_id: int, limit: int, offset: int):
+        key = self.redis_prefix + board
+        pipe = redis.pipeline()
+        pipe.zrevrange(key, offset, offset + limit - 1, withscores=True)
+        pipe.zrevrank(key, user_id)
+        pipe.zscore(key, user_id)
+        top, rank, score = await pipe.execute()
+        entries = [(int(member), score) for member, score in top]
+        return entries, None if rank is None else (rank, score)
+
+    async def _db_board(self, db: AsyncSession, board: str, user_id: int, limit: int, offset: int):
+        """Расчёт по progress на лету: пока таблицы недоступны"""
+        self.db_fallbacks += 1
+        if board.startswith("game:"):
+            scores = (
+                select(Progress.user_id.label("user_id"), Progress.score.label("score"))
+                .where(Progress.game_id == int(board[5:]), Progress.score > 0)
+            )
+        else:
+            scores = (
+                select(Progress.user_id.label("user_id"), func.sum(Progress.score).label("score"))
+                .where(Progress.score > 0)
+                .group_by(Progress.user_id)
+            )
+            if board.startswith("age:"):
+                low, high = self.age_bands[board[4:]]
+                scores = scores.join(User, User.id == Progress.user_id).where(User.age.between(low, high))
+        scores = scores.subquery()
+        top = await db.execute(
+            select(scores.c.user_id, scores.c.score)
+            .order_by(scores.c.score.desc(), scores.c.user_id)
+            .limit(limit).offset(offset)
+        )
+        entries = [(row.user_id, row.score) for row in top]
+        mine = await db.scalar(select(scores.c.score).where(scores.c.user_id == user_id))
+        if mine is None:
+            return entries, None
+        ahead = await db.scalar(
+            select(func.count()).select_from(scores)
+            .where((scores.c.score > mine) | ((scores.c.score == mine) & (scores.c.user_id < user_id)))
+        )
+        return entries, (ahead, mine)
+
+    async def board(
+        self,
+        db: AsyncSession,
+        board: str,
+        user_id: int,
+        limit: int = 10,
+        offset: int = 0
+    ) -> Tuple[List[Tuple[int, float]], Optional[Tuple[int, float]]]:
+        """Топ [(user_id, счёт)] с места offset и (место с нуля, счёт) пользователя"""
+        redis = get_redis()
+        if redis is not None:
+            try:
+                return await self._redis_board(redis, board, user_id, limit, offset)
+            except RedisError:
+                mark_redis_down()
+        elif self._ready:
+            scores = self._boards.get(board)
+            if scores is None:
+                return [], None
+            rank = scores.rank(user_id)
+            return scores.top(limit, offset), None if rank is None else (rank, scores.score(user_id))
+        return await self._db_board(db, board, user_id, limit, offset)
+
+    def _totals(self, rows: List[tuple]) -> Dict[str, Dict[int, float]]:
+        """Счета всех таблиц по строкам progress"""
+        totals: Dict[str, Dict[int, float]] = defaultdict(dict)
+        bands = {}
+        for user_id, game_id, score, age in rows:
+            if age not in bands:
+                bands[age] = self.band(age)
+            for name in self._boards_for(game_id, bands[age]):
+                board = totals[name]
+                board[user_id] = board.get(user_id, 0) + score
+        return totals
+
+    def _build(self, rows: List[tuple]) -> Dict[str, SortedScores]:
+        return {name: SortedScores.from_scores(scores) for name, scores in self._totals(rows).items()}
+
+    async def _rebuild_redis(self, redis, engine) -> bool:
+        """Пересборка в Redis; False, если её уже ведёт другой воркер"""
+        lock, queue = self.redis_prefix + "rebuilding", self.redis_prefix + "rebuild:queue"
+        if not await redis.set(lock, 1, nx=True, ex=self.rebuild_lock_ttl):
+            return False
+        try:
+            # Флаг стоит до чтения снимка: всё, что в снимок не попало, окажется в очереди
+            await redis.delete(queue)
+            rows = await asyncio.get_running_loop().run_in_executor(None, _load_scores, engine)
+            totals = self._totals(rows)
+            for name, scores in totals.items():
+                key = self.redis_prefix + name + ":rebuild"
+                pipe = redis.pipeline(transaction=False)
+                pipe.delete(key)
+                members = list(scores.items())
+                for start in range(0, len(members), 10000):
+                    pipe.zadd(key, dict(members[start:start + 10000]))
+                await pipe.execute()
+            # Все таблицы подменяются одной транзакцией: скрипт записи видит
+            # либо только старые таблицы, либо только новые
+            pipe = redis.pipeline(transaction=True)
+            for name in totals:
+                pipe.rename(self.redis_prefix + name + ":rebuild", self.redis_prefix + name)
+            await pipe.execute()
+            # Обновления с любых воркеров за время пересборки применяются поверх
+            # (повтор безопасен: счёт только растёт)
+            pipe = redis.pipeline(transaction=True)
+            pipe.lrange(queue, 0, -1)
+            pipe.delete(queue, lock)
+            queued, _ = await pipe.execute()
+            for entry in queued:
+                names, user_id, score = orjson.loads(entry)
+                await self._record_redis(redis, names, user_id, score)
+        except BaseException:
+            try:
+                await redis.delete(queue, lock)
+            except RedisError:
+                pass  # флаг истечёт сам через rebuild_lock_ttl
+            raise
+        return True
+
+    async def _rebuild_local(self, engine):
+        loop = asyncio.get_running_loop()
+        self._pending = []
+        try:
+            rows = await loop.run_in_executor(None, _load_scores, engine)
+            self._boards = await loop.run_in_executor(None, self._build, rows)
+            self._ready = True
+            # Обновления за время пересборки применяются поверх (повтор безопасен: счёт только растёт)
+            for user_id, game_id, score, band in self._pending:
+                self._apply(self._boards, user_id, game_id, score, band)
+        finally:
+            self._pending = None
+
+    async def rebuild(self):
+        """Пересобрать все таблицы из progress"""
+        from database import engine
+
+        redis = get_redis()
+        if redis is not None:
+            if not await self._rebuild_redis(redis, engine):
+                return
+        else:
+            await self._rebuild_local(engine)
+        self.rebuilds += 1
+        self.rebuilt_at = datetime.utcnow()
+
+    async def _run(self):
+        while True:
+            try:
+                await self.rebuild()
+            except RedisError:
+                mark_redis_down()
+            except Exception as exc:
+                print(f"⚠️ Leaderboard rebuild failed: {exc}")
+            await asyncio.sleep(self.rebuild_interval)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        # Пересборка идемпотентна, её можно просто отменить
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def stats(self) -> dict:
+        return {
+            "boards": len(self._boards),
+            "ready": self._ready,
+            "updates": self.updates,
+            "rebuilds": self.rebuilds,
+            "rebuilt_at": self.rebuilt_at,
+            "db_fallbacks": self.db_fallbacks,
+        }
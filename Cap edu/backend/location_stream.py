@@ -0,0 +1,210 @@
+"""
+Рассылка новых GPS точек родителям в реальном времени (WebSocket и SSE)
+save_location публикует точку один раз: она сериализуется в строку, и хаб
+раздаёт эту строку всем подписчикам ребёнка в памяти воркера. С REDIS_URL
+точки идут через Redis pub/sub, поэтому подписчик получает точки, принятые
+любым воркером; без Redis (или пока он недоступен) — только точки своего.
+
+У каждого подписчика ограниченная очередь: если клиент не успевает читать,
+вытесняются самые старые точки (родителю важна последняя позиция), а после
+LOCATION_STREAM_MAX_DROPPED вытеснений подряд соединение закрывается.
+"""
+
+import asyncio
+import os
+from typing import AsyncIterator, Dict, Iterable, Optional, Set
+
+import orjson
+
+from cache import REDIS_RETRY_SECONDS, REDIS_URL, RedisError, aioredis, get_redis, mark_redis_down
+
+CHANNEL_PREFIX = "locations:"
+_CLOSE = object()
+
+
+class StreamFull(Exception):
+    """Достигнут предел соединений на воркер"""
+
+
+class Subscriber:
+    __slots__ = ("child_ids", "queue", "dropped", "closed")
+
+    def __init__(self, child_ids: Iterable[int], queue_size: int):
+        self.child_ids = frozenset(child_ids)
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self.dropped = 0  # вытеснено подряд, пока клиент ничего не прочитал
+        self.closed = False
+
+
+class LocationHub:
+    """Подписчики по child_id и доставка точек в их очереди"""
+
+    def __init__(
+        self,
+        queue_size: int = 16,
+        max_dropped: int = 64,
+        max_connections: int = 10000,
+        heartbeat: float = 25.0
+    ):
+        self.queue_size = queue_size
+        self.max_dropped = max_dropped
+        self.max_connections = max_connections
+        self.heartbeat = heartbeat
+        self._subscribers: Dict[int, Set[Subscriber]] = {}
+        self.connections = 0
+        self._listener = None
+        self._listening = False
+        self.published = 0
+        self.delivered = 0
+        self.dropped = 0
+        self.slow_disconnects = 0
+
+    @classmethod
+    def from_env(cls) -> "LocationHub":
+        return cls(
+            queue_size=int(os.getenv("LOCATION_STREAM_QUEUE", "16")),
+            max_dropped=int(os.getenv("LOCATION_STREAM_MAX_DROPPED", "64")),
+            max_connections=int(os.getenv("LOCATION_STREAM_MAX_CONNECTIONS", "10000")),
+            heartbeat=float(os.getenv("LOCATION_STREAM_HEARTBEAT", "25")),
+        )
+
+    @property
+    def full(self) -> bool:
+        return self.connections >= self.max_connections
+
+    def subscribe(self, child_ids: Iterable[int]) -> Subscriber:
+        if self.full:
+            raise StreamFull()
+        subscriber = Subscriber(child_ids, self.queue_size)
+        for child_id in subscriber.child_ids:
+            self._subscribers.setdefault(child_id, set()).add(subscriber)
+        self.connections += 1
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber):
+        """Снять подписку; повторный вызов ничего не делает"""
+        if subscriber.closed:
+            return
+        subscriber.closed = True
+        for child_id in subscriber.child_ids:
+            subscribers = self._subscribers.get(child_id)
+            if subscribers is not None:
+                subscribers.discard(subscriber)
+                if not subscribers:
+                    del self._subscribers[child_id]
+        self.connections -= 1
+
+    async def listen(self, subscriber: Subscriber) -> AsyncIterator[Optional[str]]:
+        """
+        Точки для одного соединения; None раз в heartbeat секунд простоя
+        (для SSE комментария и проверки, что клиент ещё подключён).
+        Заканчивается, если клиент слишком отстал. Подписку снимает вызывающий
+        """
+        while True:
+            try:
+                message = await asyncio.wait_for(subscriber.queue.get(), self.heartbeat)
+            except asyncio.TimeoutError:
+                yield None
+                continue
+            if message is _CLOSE:
+                return
+            subscriber.dropped = 0
+            yield message
+
+    async def messages(self, child_ids: Iterable[int]) -> AsyncIterator[Optional[str]]:
+        """listen с подпиской на время итерации"""
+        subscriber = self.subscribe(child_ids)
+        try:
+            async for message in self.listen(subscriber):
+                yield message
+        finally:
+            self.unsubscribe(subscriber)
+
+    def _deliver(self, subscriber: Subscriber, message: str):
+        queue = subscriber.queue
+        if queue.full():
+            if subscriber.dropped >= self.max_dropped:
+                return  # уже закрывается
+            queue.get_nowait()
+            subscriber.dropped += 1
+            self.dropped += 1
+            if subscriber.dropped >= self.max_dropped:
+                # Медленный клиент: очередь заменяется сигналом закрытия
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait(_CLOSE)
+                self.slow_disconnects += 1
+                return
+        queue.put_nowait(message)
+        self.delivered += 1
+
+    def dispatch(self, child_id: int, message: str):
+        """Раздать точку подписчикам этого воркера"""
+        for subscriber in self._subscribers.get(child_id, ()):
+            self._deliver(subscriber, message)
+
+    async def publish(self, child_id: int, fix: dict):
+        """Опубликовать точку ребёнка; не ждёт подписчиков"""
+        message = orjson.dumps(fix).decode()
+        self.published += 1
+        redis = get_redis()
+        if redis is not None and self._listening:
+            try:
+                # Своим подписчикам точка вернётся через подписку, как и остальным воркерам
+                await redis.publish(f"{CHANNEL_PREFIX}{child_id}", message)
+                return
+            except RedisError:
+                mark_redis_down()
+        self.dispatch(child_id, message)
+
+    async def _listen(self):
+        while True:
+            if get_redis() is None:
+                await asyncio.sleep(REDIS_RETRY_SECONDS)
+                continue
+            # Отдельный клиент без socket_timeout: подписка ждёт сообщений неограниченно
+            client = aioredis.from_url(REDIS_URL, socket_connect_timeout=0.2, health_check_interval=30)
+            pubsub = client.pubsub(ignore_subscribe_messages=True)
+            try:
+                await pubsub.psubscribe(f"{CHANNEL_PREFIX}*")
+                self._listening = True
+                while True:
+                    message = await pubsub.get_message(timeout=1.0)
+                    if message is not None:
+                        child_id = int(message["channel"][len(CHANNEL_PREFIX):])
+                        self.dispatch(child_id, message["data"].decode())
+            except (RedisError, OSError) as exc:
+                print(f"⚠️ Location stream Redis subscription failed: {exc}")
+                mark_redis_down()
+            finally:
+                self._listening = False
+                try:
+                    await pubsub.close()
+                    await client.close()
+                except (RedisError, OSError):
+                    pass
+            await asyncio.sleep(REDIS_RETRY_SECONDS)
+
+    def start(self):
+        if self._listener is None and aioredis is not None and REDIS_URL:
+            self._listener = asyncio.get_running_loop().create_task(self._listen())
+
+    async def stop(self):
+        if self._listener is not None:
+            self._listener.cancel()
+            try:
+                await self._listener
+            except asyncio.CancelledError:
+                pass
+            self._listener = None
+
+    def stats(self) -> dict:
+        return {
+            "connections": self.connections,
+            "children": len(self._subscribers),
+            "redis": self._listening,
+            "published": self.published,
+            "delivered": self.delivered,
+            "dropped": self.dropped,
+            "slow_disconnects": self.slow_disconnects,
+        }
@@ -0,0 +1,199 @@
+"""
+Метрики Prometheus для /metrics
+Middleware считает задержку, число запросов в работе и коды ответов по
+шаблону маршрута; события движков SQLAlchemy — число и время запросов к БД
+на каждый HTTP запрос, ожидание и загрузку пула соединений. Значения stats()
+фоновых компонентов (кэши, очереди) экспортируются как gauge.
+"""
+
+import contextvars
+import time
+from typing import Callable, Dict, Optional
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+try:
+    from prometheus_client import CollectorRegistry, Counter, Gauge, Histogram, generate_latest, CONTENT_TYPE_LATEST
+    from prometheus_client.core import GaugeMetricFamily
+except ImportError:  # без prometheus_client /metrics отвечает 503
+    CollectorRegistry = None
+    CONTENT_TYPE_LATEST = "text/plain; version=0.0.4; charset=utf-8"
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+# [число запросов к БД, секунды] текущего HTTP запроса
+_request_db: contextvars.ContextVar[Optional[list]] = contextvars.ContextVar("request_db", default=None)
+
+enabled = CollectorRegistry is not None
+_pools: Dict[str, object] = {}
+registry = CollectorRegistry() if enabled else None
+
+if enabled:
+    HTTP_REQUESTS = Counter(
+        "http_requests_total", "HTTP запросы по маршруту и коду ответа",
+        ["method", "route", "status"], registry=registry,
+    )
+    HTTP_LATENCY = Histogram(
+        "http_request_duration_seconds", "Время обработки HTTP запроса",
+        ["method", "route"], buckets=LATENCY_BUCKETS, registry=registry,
+    )
+    HTTP_IN_PROGRESS = Gauge(
+        "http_requests_in_progress", "HTTP запросы в обработке",
+        ["method"], registry=registry,
+    )
+    REQUEST_DB_QUERIES = Histogram(
+        "http_request_db_queries", "Число запросов к БД на HTTP запрос",
+        ["route"], buckets=COUNT_BUCKETS, registry=registry,
+    )
+    REQUEST_DB_TIME = Histogram(
+        "http_request_db_seconds", "Время запросов к БД на HTTP запрос",
+        ["route"], buckets=LATENCY_BUCKETS, registry=registry,
+    )
+    DB_QUERY_TIME = Histogram(
+        "db_query_duration_seconds", "Время одного SQL запроса",
+        ["engine", "operation"], buckets=QUERY_BUCKETS, registry=registry,
+    )
+    POOL_WAIT = Histogram(
+        "db_pool_checkout_seconds", "Ожидание соединения из пула",
+        ["engine"], buckets=QUERY_BUCKETS, registry=registry,
+    )
+
+
+def _operation(statement: str) -> str:
+    word = statement.lstrip().split(None, 1)[0].lower() if statement.strip() else ""
+    return word if word in ("select", "insert", "update", "delete", "with") else "other"
+
+
+def instrument_engine(engine: Engine, name: str):
+    """Подписаться на события движка: время запросов и ожидание пула"""
+    if not enabled:
+        return
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["query_started"].pop()
+        DB_QUERY_TIME.labels(name, _operation(statement)).observe(elapsed)
+        current = _request_db.get()
+        if current is not None:
+            current[0] += 1
+            current[1] += elapsed
+
+    # В событиях пула нет момента начала ожидания, поэтому оборачивается
+    # Pool.connect, через который движок получает каждое соединение
+    pool = engine.pool
+    connect = pool.connect
+
+    def timed_connect():
+        started = time.perf_counter()
+        try:
+            return connect()
+        finally:
+            POOL_WAIT.labels(name).observe(time.perf_counter() - started)
+
+    pool.connect = timed_connect
+    _pools[name] = pool
+
+
+_stats_source: Optional[Callable[[], Dict[str, dict]]] = None
+
+
+def register_stats(source: Callable[[], Dict[str, dict]]):
+    """Экспортировать {компонент: stats()} как qazkids_stat{component, key}"""
+    global _stats_source
+    _stats_source = source
+
+
+def _flatten(prefix: str, value, out: Dict[str, float]):
+    if isinstance(value, bool):
+        out[prefix] = float(value)
+    elif isinstance(value, (int, float)):
+        out[prefix] = float(value)
+    elif isinstance(value, dict):
+        for key, nested in value.items():
+            _flatten(f"{prefix}_{key}" if prefix else str(key), nested, out)
+
+
+class _SnapshotCollector:
+    """Значения, которые читаются в момент запроса /metrics"""
+
+    def collect(self):
+        size = GaugeMetricFamily("db_pool_size", "Размер пула соединений", labels=["engine"])
+        checked_out = GaugeMetricFamily("db_pool_checked_out", "Соединения, выданные из пула", labels=["engine"])
+        utilization = GaugeMetricFamily("db_pool_utilization", "Доля занятых соединений пула", labels=["engine"])
+        for name, pool in _pools.items():
+            if not hasattr(pool, "checkedout"):
+                continue
+            used = pool.checkedout()
+            capacity = pool.size() + max(getattr(pool, "_max_overflow", 0), 0)
+            size.add_metric([name], pool.size())
+            checked_out.add_metric([name], used)
+            utilization.add_metric([name], used / capacity if capacity else 0.0)
+        yield size
+        yield checked_out
+        yield utilization
+
+        stats = GaugeMetricFamily(
+            "qazkids_stat", "Значения stats() компонентов приложения", labels=["component", "key"]
+        )
+        for component, component_stats in (_stats_source() if _stats_source else {}).items():
+            values: Dict[str, float] = {}
+            _flatten("", component_stats, values)
+            for key, value in values.items():
+                stats.add_metric([component, key], value)
+        yield stats
+
+
+if enabled:
+    registry.register(_SnapshotCollector())
+
+
+def render() -> bytes:
+    return generate_latest(registry)
+
+
+class MetricsMiddleware:
+    """ASGI middleware: задержка, коды ответов и запросы к БД по маршруту"""
+
+    def __init__(self, app: ASGIApp, skip_paths=("/metrics",)):
+        self.app = app
+        self.skip_paths = set(skip_paths)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if not enabled or scope["type"] != "http" or scope["path"] in self.skip_paths:
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        status_code = 500
+        db = [0, 0.0]
+        token = _request_db.set(db)
+
+        async def send_wrapper(message: Message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        HTTP_IN_PROGRESS.labels(method).inc()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - started
+            HTTP_IN_PROGRESS.labels(method).dec()
+            _request_db.reset(token)
+            # Шаблон пути (/games/{game_id}) вместо самого пути: ограниченное число меток
+            route = scope.get("route")
+            route = getattr(route, "path", None) or "unmatched"
+            HTTP_REQUESTS.labels(method, route, str(status_code)).inc()
+            HTTP_LATENCY.labels(method, route).observe(elapsed)
+            REQUEST_DB_QUERIES.labels(route).observe(db[0])
+            REQUEST_DB_TIME.labels(route).observe(db[1])
@@ -0,0 +1,206 @@
+"""
+Миграции схемы для уже существующих баз данных
+create_all создаёт только отсутствующие таблицы, поэтому новые индексы
+на старых таблицах добавляются здесь. Все шаги идемпотентны.
+
+Запуск вручную: python migrations.py
+"""
+
+from collections import defaultdict
+
+from sqlalchemy import JSON, select, delete, update, func, inspect
+from sqlalchemy.engine import Connection
+
+from models import Base, Progress, Game
+from payloads import pack_content
+import retention
+import stats
+
+progress = Progress.__table__
+games = Game.__table__
+
+
+def merge_duplicate_progress(conn: Connection) -> int:
+    """Слить дубликаты (user_id, game_id) перед уникальным индексом"""
+    duplicates = conn.execute(
+        select(progress.c.user_id, progress.c.game_id)
+        .group_by(progress.c.user_id, progress.c.game_id)
+        .having(func.count() > 1)
+    ).all()
+
+    removed = 0
+    for user_id, game_id in duplicates:
+        rows = conn.execute(
+            select(progress)
+            .where((progress.c.user_id == user_id) & (progress.c.game_id == game_id))
+            .order_by(progress.c.id)
+        ).all()
+        keep, rest = rows[0], rows[1:]
+        completed_at = [row.completed_at for row in rows if row.completed_at is not None]
+        started_at = [row.started_at for row in rows if row.started_at is not None]
+        conn.execute(
+            update(progress)
+            .where(progress.c.id == keep.id)
+            .values(
+                score=max(row.score or 0 for row in rows),
+                attempts=sum(row.attempts or 0 for row in rows),
+                completed=any(row.completed for row in rows),
+                completed_at=min(completed_at) if completed_at else None,
+                started_at=min(started_at) if started_at else None,
+            )
+        )
+        conn.execute(delete(progress).where(progress.c.id.in_([row.id for row in rest])))
+        removed += len(rest)
+    return removed
+
+
+def ensure_columns(conn: Connection) -> list:
+    """Добавить в существующие таблицы новые nullable колонки из models.py"""
+    inspector = inspect(conn)
+    tables = set(inspector.get_table_names())
+    added = []
+    for table in Base.metadata.sorted_tables:
+        if table.name not in tables:
+            continue
+        existing = {column["name"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing or not column.nullable:
+                continue
+            column_type = column.type.compile(dialect=conn.dialect)
+            conn.exec_driver_sql(f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}")
+            added.append(f"{table.name}.{column.name}")
+    return added
+
+
+def convert_json_columns(conn: Connection) -> list:
+    """Перевести старые Text колонки с JSON в JSONB (PostgreSQL)
+
+    В SQLite JSON хранится как текст, поэтому существующие строки
+    читаются без изменений и конвертация не нужна.
+    """
+    if conn.dialect.name != "postgresql":
+        return []
+    inspector = inspect(conn)
+    tables = set(inspector.get_table_names())
+    converted = []
+    for table in Base.metadata.sorted_tables:
+        if table.name not in tables:
+            continue
+        current = {column["name"]: column["type"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if not isinstance(column.type, JSON) or column.name not in current:
+                continue
+            if current[column.name].compile(dialect=conn.dialect) == "JSONB":
+                continue
+            conn.exec_driver_sql(
+                f"ALTER TABLE {table.name} ALTER COLUMN {column.name} "
+                f"TYPE JSONB USING {column.name}::jsonb"
+            )
+            converted.append(f"{table.name}.{column.name}")
+    return converted
+
+
+def backfill_game_payloads(conn: Connection) -> int:
+    """Заполнить сжатый payload и хеш для игр, созданных до их появления"""
+    rows = conn.execute(
+        select(games.c.id, games.c.content)
+        .where(games.c.content.is_not(None) & games.c.content_hash.is_(None))
+    ).all()
+    for game_id, content in rows:
+        content_gzip, content_hash = pack_content(content)
+        conn.execute(
+            update(games)
+            .where(games.c.id == game_id)
+            .values(content_gzip=content_gzip, content_hash=content_hash)
+        )
+    return len(rows)
+
+
+def ensure_indexes(conn: Connection) -> list:
+    """Создать индексы из models.py, которых нет в базе"""
+    existing = _existing_indexes(conn)
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            if index.name not in existing[table.name]:
+                # индексы с ddl_if для другого диалекта create() пропускает
+                index.create(conn)
+    after = _existing_indexes(conn)
+    return sorted(
+        name for table_name, names in after.items()
+        for name in names - existing[table_name]
+    )
+
+
+def _existing_indexes(conn: Connection) -> dict:
+    # Имена читаются из системного каталога: inspector пропускает
+    # индексы по выражениям (SQLite), и они создавались бы повторно
+    if conn.dialect.name == "postgresql":
+        sql = "SELECT tablename, indexname FROM pg_indexes WHERE schemaname = current_schema()"
+    else:
+        sql = "SELECT tbl_name, name FROM sqlite_master WHERE type = 'index'"
+    names = defaultdict(set)
+    for table_name, index_name in conn.exec_driver_sql(sql).all():
+        names[table_name].add(index_name)
+    return names
+
+
+# Индексы, заменённые в models.py другим выражением
+OBSOLETE_INDEXES = {
+    # CAST(event_data->>'game_id' AS INTEGER) падал на нечисловых game_id
+    "analytics": ["ix_analytics_event_game_id"],
+}
+
+
+def drop_obsolete_indexes(conn: Connection) -> list:
+    """Удалить индексы из OBSOLETE_INDEXES, если они ещё есть в базе"""
+    existing = _existing_indexes(conn)
+    dropped = []
+    for table_name, names in OBSOLETE_INDEXES.items():
+        for name in names:
+            if name in existing[table_name]:
+                conn.exec_driver_sql(f"DROP INDEX {name}")
+                dropped.append(name)
+    return dropped
+
+
+def upgrade(conn: Connection):
+    """Применить все миграции"""
+    added = ensure_columns(conn)
+    converted = convert_json_columns(conn)
+    removed = merge_duplicate_progress(conn)
+    dropped = drop_obsolete_indexes(conn)
+    created = ensure_indexes(conn)
+    partitioned = retention.install(conn)
+    stats.install(conn)
+    packed = backfill_game_payloads(conn)
+    if added:
+        print(f"✅ Added columns: {', '.join(added)}")
+    if converted:
+        print(f"✅ Converted to JSONB: {', '.join(converted)}")
+    if packed:
+        print(f"✅ Packed content for {packed} games")
+    if removed:
+        print(f"✅ Merged {removed} duplicate progress rows")
+    if dropped:
+        print(f"✅ Dropped indexes: {', '.join(dropped)}")
+    if created:
+        print(f"✅ Created indexes: {', '.join(created)}")
+    if partitioned:
+        print(f"✅ Partitioned by month: {', '.join(partitioned)}")
+
+
+async def upgrade_async():
+    """Применить миграции через асинхронный движок (при старте приложения)"""
+    from database import async_engine
+
+    async with async_engine.begin() as conn:
+        await conn.run_sync(upgrade)
+
+
+if __name__ == "__main__":
+    from database import engine
+
+    with engine.begin() as connection:
+        Base.metadata.create_all(bind=connection)
+        upgrade(connection)
+    print("✅ Migrations applied")
@@ -3,14 +3,20 @@
 Модели для хранения всех данных приложения
 """
 
-from sqlalchemy import Column, Integer, String, Float, DateTime, Boolean, ForeignKey, Text, Enum
+from sqlalchemy import (
+    Column, Integer, String, Float, DateTime, Boolean, ForeignKey, Text, Enum, Index, LargeBinary, JSON, cast
+)
+from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import relationship
+from sqlalchemy.orm import relationship, deferred
 from datetime import datetime
 import enum
 
 Base = declarative_base()
 
+# JSONB в PostgreSQL, JSON1 (текст + json_extract) в SQLite
+JSONDocument = JSON().with_variant(JSONB(), "postgresql")
+
 
 class User(Base):
     """Модель пользователя"""
@@ -23,6 +29,7 @@ class User(Base):
     full_name = Column(String)
     age = Column(Integer)
     role = Column(String, default="student")  # роли: ученик, родитель, учитель, администратор
+    parent_id = Column(Integer, ForeignKey("users.id"), index=True)  # родитель, который видит GPS ребёнка
     is_active = Column(Boolean, default=True)
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
@@ -44,7 +51,11 @@ class Game(Base):
     difficulty = Column(String)  # сложность: легко, средне, сложно
     duration_minutes = Column(Integer, default=10)
     image_url = Column(String)
-    content = Column(Text)  # JSON с вопросами/уровнями
+    # JSON с вопросами/уровнями; может весить мегабайты, поэтому не
+    # загружается в обычных запросах (отдаётся через /games/{id}/content)
+    content = deferred(Column(JSONDocument))
+    content_gzip = deferred(Column(LargeBinary))  # сжатый content для отдачи
+    content_hash = Column(String(64))  # sha256 content, используется как ETag
     max_score = Column(Integer, default=100)
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
@@ -85,6 +96,13 @@ class Progress(Base):
     # Связи
     user = relationship("User", back_populates="progress")
     game = relationship("Game", back_populates="progress")
+    
+    __table_args__ = (
+        # Одна запись прогресса на пару (пользователь, игра)
+        Index("ix_progress_user_game", "user_id", "game_id", unique=True),
+        # Рейтинг игры без таблицы в памяти/Redis (leaderboard.py)
+        Index("ix_progress_game_score", "game_id", score.desc()),
+    )
 
 
 class Achievement(Base):
@@ -101,6 +119,10 @@ class Achievement(Base):
     
     # Связи
     user = relationship("User", back_populates="achievements")
+    
+    __table_args__ = (
+        Index("ix_achievements_user_id", "user_id"),
+    )
 
 
 class Location(Base):
@@ -116,6 +138,48 @@ class Location(Base):
     
     # Связи
     user = relationship("User", back_populates="locations")
+    
+    __table_args__ = (
+        # История локаций: WHERE user_id = ? ORDER BY timestamp DESC LIMIT n
+        Index("ix_locations_user_timestamp", "user_id", timestamp.desc()),
+        # Очистка и прореживание по диапазону времени (retention.py)
+        Index("ix_locations_timestamp", "timestamp"),
+    )
+
+
+class Geofence(Base):
+    """Зона (дом, школа), при входе и выходе ребёнка из которой родитель получает событие"""
+    __tablename__ = "geofences"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    owner_id = Column(Integer, ForeignKey("users.id"), nullable=False)  # родитель, создавший зону
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)  # ребёнок
+    name = Column(String, nullable=False)
+    kind = Column(String, nullable=False)  # circle | polygon
+    latitude = Column(Float)  # центр круга
+    longitude = Column(Float)
+    radius_m = Column(Float)
+    points = Column(JSONDocument)  # [[lat, lon], ...] вершины многоугольника
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+class GeofenceEvent(Base):
+    """Вход (enter) или выход (exit) ребёнка из зоны"""
+    __tablename__ = "geofence_events"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    geofence_id = Column(Integer, ForeignKey("geofences.id", ondelete="CASCADE"), nullable=False)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    event = Column(String, nullable=False)
+    latitude = Column(Float, nullable=False)
+    longitude = Column(Float, nullable=False)
+    timestamp = Column(DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        # Лента событий ребёнка и последнее состояние по зонам
+        Index("ix_geofence_events_user_timestamp", "user_id", timestamp.desc()),
+    )
 
 
 class Content(Base):
@@ -141,5 +205,45 @@ class Analytics(Base):
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"))
     event_type = Column(String)  # события: старт игры, завершение игры, просмотр фильма
-    event_data = Column(Text)  # JSON
+    event_data = Column(JSONDocument)
     timestamp = Column(DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        Index("ix_analytics_user_timestamp", "user_id", "timestamp"),
+        # Админская лента: ORDER BY timestamp DESC, id DESC
+        Index("ix_analytics_timestamp_id", "timestamp", "id"),
+    )
+
+
+# Фильтр по игре внутри event_data: выражение индекса совпадает с тем,
+# что генерирует ANALYTICS_GAME_ID в запросах, иначе планировщик его не использует.
+# Индексируется текст, а не CAST(... AS INTEGER): клиентский game_id вроде "quiz-1"
+# ломал бы выражение индекса в PostgreSQL и вместе с ним весь пакет вставки
+ANALYTICS_GAME_ID = cast(Analytics.event_data["game_id"].as_string(), Text)
+Index("ix_analytics_event_game_id_text", ANALYTICS_GAME_ID)
+# Произвольные фильтры по ключам (event_data @> '{...}') — только PostgreSQL
+Index(
+    "ix_analytics_event_data",
+    Analytics.event_data,
+    postgresql_using="gin",
+    postgresql_ops={"event_data": "jsonb_path_ops"},
+).ddl_if(dialect="postgresql")
+
+
+class RetentionState(Base):
+    """До какого момента таблица уже прорежена (см. retention.py)"""
+    __tablename__ = "retention_state"
+    
+    name = Column(String, primary_key=True)
+    downsampled_until = Column(DateTime)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
+
+class StatsCounter(Base):
+    """Агрегаты для статистики, поддерживаются триггерами (см. stats.py)"""
+    __tablename__ = "stats_counters"
+    
+    name = Column(String, primary_key=True)
+    value = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+    reconciled_at = Column(DateTime)
@@ -0,0 +1,80 @@
+"""
+Курсорная (keyset) пагинация
+Вместо OFFSET следующая страница начинается после ключа последней строки,
+поэтому глубокие страницы стоят столько же, сколько первая.
+Курсор — непрозрачный base64 токен с именем ключа сортировки и значениями.
+NULL в nullable колонках ключа заменяется значением из nulls_as и в ORDER BY,
+и в сравнении: иначе курсор с null не сравнить, а PostgreSQL и SQLite ставят
+NULL с разных концов.
+"""
+
+import base64
+import json
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Sequence
+
+from fastapi import HTTPException
+from sqlalchemy import Select, func, tuple_
+from sqlalchemy.orm import InstrumentedAttribute
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+class Keyset:
+    """Ключ сортировки из нескольких колонок с общим направлением"""
+
+    def __init__(
+        self,
+        name: str,
+        *columns: InstrumentedAttribute,
+        descending: bool = False,
+        nulls_as: Optional[Dict[str, Any]] = None
+    ):
+        self.name = name
+        self.columns = columns
+        self.descending = descending
+        self.nulls_as = nulls_as or {}
+        self.keys = [
+            func.coalesce(column, self.nulls_as[column.key]) if column.key in self.nulls_as else column
+            for column in columns
+        ]
+
+    def encode(self, row) -> str:
+        values = []
+        for column in self.columns:
+            value = getattr(row, column.key)
+            if value is None:
+                value = self.nulls_as.get(column.key)
+            values.append(value.isoformat() if isinstance(value, datetime) else value)
+        raw = json.dumps({"k": self.name, "v": values}, separators=(",", ":")).encode()
+        return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+    def decode(self, cursor: str) -> List:
+        try:
+            padded = cursor + "=" * (-len(cursor) % 4)
+            payload = json.loads(base64.urlsafe_b64decode(padded))
+            if payload["k"] != self.name or len(payload["v"]) != len(self.columns):
+                raise ValueError("cursor belongs to another ordering")
+            return [
+                datetime.fromisoformat(value) if column.type.python_type is datetime else value
+                for column, value in zip(self.columns, payload["v"])
+            ]
+        except (ValueError, KeyError, TypeError):
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+
+    def apply(self, query: Select, cursor: Optional[str], limit: int) -> Select:
+        """Добавить ORDER BY, условие «после курсора» и LIMIT limit + 1"""
+        if cursor:
+            key = tuple_(*self.keys)
+            after = tuple_(*self.decode(cursor))
+            query = query.where(key < after if self.descending else key > after)
+        order = [key.desc() if self.descending else key.asc() for key in self.keys]
+        return query.order_by(*order).limit(limit + 1)
+
+    def page(self, rows: Sequence, limit: int) -> tuple:
+        """Обрезать лишнюю строку; вернуть (строки, курсор следующей страницы или None)"""
+        rows = list(rows)
+        if len(rows) <= limit:
+            return rows, None
+        rows = rows[:limit]
+        return rows, self.encode(rows[-1])
@@ -0,0 +1,113 @@
+"""
+Хеширование паролей вне event loop
+bcrypt выполняется в отдельном ограниченном пуле потоков с лимитом очереди
+"""
+
+import asyncio
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable
+
+from passlib.context import CryptContext
+
+
+class PasswordPoolSaturated(Exception):
+    """Очередь хеширования заполнена — запрос нужно отклонить (503)"""
+
+
+class Timing:
+    """Накопитель длительностей: количество, сумма и максимум в секундах"""
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds: float):
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    def snapshot(self) -> dict:
+        return {
+            "count": self.count,
+            "avg_ms": round(self.total / self.count * 1000, 2) if self.count else 0.0,
+            "max_ms": round(self.max * 1000, 2),
+        }
+
+
+class PasswordHasher:
+    """Пул для bcrypt с ограничением числа ожидающих задач"""
+
+    def __init__(self, workers: int = 2, max_pending: int = 64, rounds: int = 12):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=rounds)
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="password-hash")
+        # Счётчики меняются только из потока event loop, блокировки не нужны
+        self.pending = 0
+        self.rejected = 0
+        self.hash_latency = Timing()
+        self.queue_wait = Timing()
+
+    @classmethod
+    def from_env(cls) -> "PasswordHasher":
+        return cls(
+            workers=int(os.getenv("PASSWORD_HASH_WORKERS", "2")),
+            max_pending=int(os.getenv("PASSWORD_HASH_MAX_PENDING", "64")),
+            rounds=int(os.getenv("BCRYPT_ROUNDS", "12")),
+        )
+
+    async def _run(self, func: Callable, *args):
+        if self.pending >= self.max_pending:
+            self.rejected += 1
+            raise PasswordPoolSaturated()
+
+        enqueued = time.perf_counter()
+
+        def job():
+            started = time.perf_counter()
+            result = func(*args)
+            return result, started - enqueued, time.perf_counter() - started
+
+        loop = asyncio.get_running_loop()
+        future = self._executor.submit(job)
+        self.pending += 1
+        # Освобождение по завершении задачи в пуле, а не ожидания: отключившийся
+        # клиент отменяет await, но bcrypt в потоке продолжает выполняться
+        future.add_done_callback(lambda _: self._release(loop))
+        result, waited, took = await asyncio.wrap_future(future, loop=loop)
+
+        self.queue_wait.observe(waited)
+        self.hash_latency.observe(took)
+        return result
+
+    def _release(self, loop: asyncio.AbstractEventLoop):
+        # колбэк вызывается в потоке пула; счётчик меняется в потоке event loop
+        try:
+            loop.call_soon_threadsafe(self._decrement)
+        except RuntimeError:  # цикл уже закрыт при остановке
+            pass
+
+    def _decrement(self):
+        self.pending -= 1
+
+    async def hash(self, password: str) -> str:
+        return await self._run(self.context.hash, password)
+
+    async def verify(self, plain_password: str, hashed_password: str) -> bool:
+        return await self._run(self.context.verify, plain_password, hashed_password)
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.workers,
+            "pending": self.pending,
+            "max_pending": self.max_pending,
+            "rejected": self.rejected,
+            "hash_latency": self.hash_latency.snapshot(),
+            "queue_wait": self.queue_wait.snapshot(),
+        }
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
@@ -0,0 +1,38 @@
+"""
+Подготовка больших игровых payload'ов для отдачи клиентам
+Контент игры хранится заранее сжатым (gzip) вместе с sha256 хешем,
+который служит ETag и позволяет клиентам кэшировать payload
+"""
+
+import gzip
+import hashlib
+import zlib
+from typing import Any, Iterator, Tuple
+
+import orjson
+
+CHUNK_SIZE = 64 * 1024
+
+
+def pack_content(content: Any) -> Tuple[bytes, str]:
+    """Вернуть (gzip байты, sha256 хеш) для JSON документа контента"""
+    raw = orjson.dumps(content)
+    # mtime=0: одинаковый контент даёт одинаковые байты
+    return gzip.compress(raw, compresslevel=6, mtime=0), hashlib.sha256(raw).hexdigest()
+
+
+def iter_chunks(data: bytes, chunk_size: int = CHUNK_SIZE) -> Iterator[bytes]:
+    for start in range(0, len(data), chunk_size):
+        yield data[start:start + chunk_size]
+
+
+def iter_decompressed(data: bytes, chunk_size: int = CHUNK_SIZE) -> Iterator[bytes]:
+    """Распаковывать gzip по частям для клиентов без Accept-Encoding: gzip"""
+    decompressor = zlib.decompressobj(wbits=31)
+    for chunk in iter_chunks(data, chunk_size):
+        output = decompressor.decompress(chunk)
+        if output:
+            yield output
+    tail = decompressor.flush()
+    if tail:
+        yield tail
@@ -0,0 +1,100 @@
+"""
+Кэш аутентифицированных пользователей
+Хранит облегчённый Principal (id, role, is_active) вместо запроса к users на каждый вызов
+"""
+
+import asyncio
+import json
+import os
+from dataclasses import dataclass, asdict
+from typing import Optional
+
+from cache import TTLCache, RedisError, get_redis, mark_redis_down
+
+
+@dataclass(frozen=True)
+class Principal:
+    """Минимальные данные пользователя, нужные для авторизации"""
+    id: int
+    role: str
+    is_active: bool
+
+
+class PrincipalCache:
+    """Двухуровневый кэш: локальный TTL/LRU и, если настроен, Redis"""
+
+    key_prefix = "principal:"
+
+    def __init__(self, maxsize: int = 10000, ttl: float = 60.0, redis_ttl: int = 600):
+        # С Redis локальная копия живёт недолго: другие воркеры
+        # узнают об инвалидации не позже, чем через ttl
+        self.local = TTLCache(maxsize=maxsize, ttl=ttl)
+        self.redis_ttl = redis_ttl
+        self.redis_hits = 0
+        self.redis_misses = 0
+
+    @classmethod
+    def from_env(cls) -> "PrincipalCache":
+        return cls(
+            maxsize=int(os.getenv("PRINCIPAL_CACHE_SIZE", "10000")),
+            ttl=float(os.getenv("PRINCIPAL_CACHE_TTL", "30" if get_redis() else "60")),
+            redis_ttl=int(os.getenv("PRINCIPAL_CACHE_REDIS_TTL", "600")),
+        )
+
+    async def get(self, user_id: int) -> Optional[Principal]:
+        principal = self.local.get(user_id)
+        if principal is not None:
+            return principal
+
+        redis = get_redis()
+        if redis is None:
+            return None
+        try:
+            raw = await redis.get(f"{self.key_prefix}{user_id}")
+        except RedisError:
+            mark_redis_down()
+            return None
+        if raw is None:
+            self.redis_misses += 1
+            return None
+
+        self.redis_hits += 1
+        principal = Principal(**json.loads(raw))
+        self.local.set(user_id, principal)
+        return principal
+
+    async def put(self, principal: Principal):
+        self.local.set(principal.id, principal)
+        redis = get_redis()
+        if redis is None:
+            return
+        try:
+            await redis.set(f"{self.key_prefix}{principal.id}", json.dumps(asdict(principal)), ex=self.redis_ttl)
+        except RedisError:
+            mark_redis_down()
+
+    async def invalidate(self, user_id: int):
+        self.local.pop(user_id)
+        redis = get_redis()
+        if redis is None:
+            return
+        try:
+            await redis.delete(f"{self.key_prefix}{user_id}")
+        except RedisError:
+            mark_redis_down()
+
+    def invalidate_nowait(self, user_id: int):
+        """Инвалидация из синхронного кода (например, ORM событий)"""
+        self.local.pop(user_id)
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        loop.create_task(self.invalidate(user_id))
+
+    def stats(self) -> dict:
+        return {
+            **self.local.stats(),
+            "redis_hits": self.redis_hits,
+            "redis_misses": self.redis_misses,
+        }
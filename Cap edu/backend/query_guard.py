@@ -0,0 +1,190 @@
+"""
+Обнаружение N+1 и медленных запросов (для разработки и CI)
+Включается переменной QUERY_GUARD:
+
+    off     — выключено (по умолчанию, в production)
+    log     — после запроса печатать нарушения и повторяющиеся SQL
+    strict  — тестовый режим: нарушение сразу прерывает запрос ошибкой 500
+
+Нарушения: больше запросов к БД, чем бюджет endpoint (QUERY_BUDGETS или
+QUERY_BUDGET_DEFAULT), один и тот же нормализованный SQL больше
+QUERY_REPEAT_LIMIT раз (признак N+1) и запрос дольше SLOW_QUERY_MS.
+"""
+
+import contextvars
+import os
+import re
+import time
+from collections import Counter
+from typing import Dict, List, Optional
+
+from fastapi import Request
+from fastapi.responses import JSONResponse
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+MODES = ("off", "log", "strict")
+
+_current: contextvars.ContextVar[Optional["RequestQueries"]] = contextvars.ContextVar("request_queries", default=None)
+
+
+class QueryBudgetExceeded(Exception):
+    """Нарушение бюджета запросов в режиме strict"""
+
+    def __init__(self, route: str, violations: List[str]):
+        super().__init__(f"{route}: {'; '.join(violations)}")
+        self.route = route
+        self.violations = violations
+
+
+def parse_budgets(value: str) -> Dict[str, int]:
+    """'GET /games=2, POST /progress=4' -> {'GET /games': 2, 'POST /progress': 4}"""
+    budgets = {}
+    for item in filter(None, (part.strip() for part in value.split(","))):
+        route, _, budget = item.rpartition("=")
+        budgets[route.strip()] = int(budget)
+    return budgets
+
+
+_whitespace = re.compile(r"\s+")
+_literals = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_in_lists = re.compile(r"\((?:\s*(?:\?|%s|%\(\w+\)s|:\w+|\$\d+)\s*,)+\s*(?:\?|%s|%\(\w+\)s|:\w+|\$\d+)\s*\)")
+_postcompile = re.compile(r"\(?__\[POSTCOMPILE_\w+\]\)?")
+
+
+def normalize(statement: str) -> str:
+    """SQL без литералов и с одинаковыми IN-списками, чтобы сравнивать «форму» запроса"""
+    sql = _whitespace.sub(" ", statement).strip()
+    sql = _postcompile.sub("(?)", sql)
+    sql = _in_lists.sub("(?)", sql)
+    return _literals.sub("?", sql)
+
+
+class RequestQueries:
+    """Запросы к БД одного HTTP запроса"""
+
+    def __init__(self, scope: Scope):
+        self.scope = scope
+        self.count = 0
+        self.statements: Counter = Counter()
+        self.slow: List[tuple] = []
+
+    @property
+    def route(self) -> str:
+        route = self.scope.get("route")
+        return f"{self.scope['method']} {getattr(route, 'path', self.scope['path'])}"
+
+
+class QueryGuard:
+    def __init__(
+        self,
+        mode: str = "off",
+        default_budget: int = 10,
+        budgets: Optional[Dict[str, int]] = None,
+        repeat_limit: int = 5,
+        slow_query_ms: float = 100.0
+    ):
+        if mode not in MODES:
+            raise ValueError(f"QUERY_GUARD must be one of {MODES}")
+        self.mode = mode
+        self.default_budget = default_budget
+        self.budgets = budgets or {}
+        self.repeat_limit = repeat_limit
+        self.slow_query_ms = slow_query_ms
+        self.violations = 0
+
+    @classmethod
+    def from_env(cls) -> "QueryGuard":
+        return cls(
+            mode=os.getenv("QUERY_GUARD", "off"),
+            default_budget=int(os.getenv("QUERY_BUDGET_DEFAULT", "10")),
+            budgets=parse_budgets(os.getenv("QUERY_BUDGETS", "")),
+            repeat_limit=int(os.getenv("QUERY_REPEAT_LIMIT", "5")),
+            slow_query_ms=float(os.getenv("SLOW_QUERY_MS", "100")),
+        )
+
+    @property
+    def enabled(self) -> bool:
+        return self.mode != "off"
+
+    def budget(self, route: str) -> int:
+        return self.budgets.get(route, self.default_budget)
+
+    def check(self, queries: RequestQueries) -> List[str]:
+        violations = []
+        budget = self.budget(queries.route)
+        if queries.count > budget:
+            violations.append(f"{queries.count} queries, budget {budget}")
+        for sql, count in queries.statements.items():
+            if count > self.repeat_limit:
+                violations.append(f"{count}x repeated (N+1?): {sql}")
+        for sql, elapsed_ms in queries.slow:
+            violations.append(f"slow query {elapsed_ms:.0f} ms > {self.slow_query_ms:.0f} ms: {sql}")
+        return violations
+
+    def instrument(self, engine: Engine):
+        if not self.enabled:
+            return
+
+        @event.listens_for(engine, "before_cursor_execute")
+        def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            conn.info.setdefault("guard_started", []).append(time.perf_counter())
+
+        @event.listens_for(engine, "after_cursor_execute")
+        def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            elapsed_ms = (time.perf_counter() - conn.info["guard_started"].pop()) * 1000
+            queries = _current.get()
+            if queries is None:
+                return  # фоновые задачи и миграции не проверяются
+            sql = normalize(statement)
+            queries.count += 1
+            queries.statements[sql] += 1
+            if elapsed_ms > self.slow_query_ms:
+                queries.slow.append((sql, elapsed_ms))
+            if self.mode == "strict":
+                violations = self.check(queries)
+                if violations:
+                    # Падение в момент нарушения: в traceback видно место лишнего запроса
+                    self.violations += 1
+                    raise QueryBudgetExceeded(queries.route, violations)
+
+    def report(self, queries: RequestQueries):
+        violations = self.check(queries)
+        if not violations:
+            return
+        self.violations += 1
+        print(f"⚠️ Query guard {queries.route}:")
+        for violation in violations:
+            print(f"   - {violation}")
+
+    def stats(self) -> dict:
+        return {"mode": self.mode, "violations": self.violations}
+
+
+class QueryGuardMiddleware:
+    """ASGI middleware: собирает запросы к БД на время HTTP запроса"""
+
+    def __init__(self, app: ASGIApp, guard: QueryGuard):
+        self.app = app
+        self.guard = guard
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if not self.guard.enabled or scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        queries = RequestQueries(scope)
+        token = _current.set(queries)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _current.reset(token)
+            if self.guard.mode == "log":
+                self.guard.report(queries)
+
+
+async def query_budget_exceeded_handler(request: Request, exc: QueryBudgetExceeded):
+    return JSONResponse(
+        status_code=500,
+        content={"detail": "Query budget exceeded", "route": exc.route, "violations": exc.violations},
+    )
@@ -0,0 +1,139 @@
+"""
+Кэш готовых JSON ответов для редко меняющихся каталогов
+Ключ — путь и параметры запроса; ответы отдаются со strong ETag
+и 304 Not Modified на If-None-Match
+"""
+
+import hashlib
+import json
+import os
+from typing import Any, Dict, Optional, Tuple
+
+from fastapi import Request, Response
+from pydantic import TypeAdapter
+
+from cache import TTLCache, RedisError, get_redis, mark_redis_down
+
+_adapters = {}
+
+
+def _adapter(response_type: Any) -> TypeAdapter:
+    adapter = _adapters.get(response_type)
+    if adapter is None:
+        adapter = _adapters[response_type] = TypeAdapter(response_type)
+    return adapter
+
+
+class ResponseCache:
+    """Кэш тел ответов: локальный TTL/LRU и общий Redis с номером поколения"""
+
+    def __init__(self, namespace: str, maxsize: int = 1000, ttl: float = 300.0):
+        self.namespace = namespace
+        self.ttl = ttl
+        self.enabled = ttl > 0
+        self.local = TTLCache(maxsize=maxsize, ttl=ttl)
+        # Инвалидация увеличивает поколение; старые ключи просто перестают совпадать
+        self.generation = 0
+        self.not_modified = 0
+
+    @classmethod
+    def from_env(cls, namespace: str) -> "ResponseCache":
+        return cls(
+            namespace,
+            maxsize=int(os.getenv("RESPONSE_CACHE_SIZE", "1000")),
+            ttl=float(os.getenv("RESPONSE_CACHE_TTL", "300")),
+        )
+
+    @property
+    def _generation_key(self) -> str:
+        return f"{self.namespace}:generation"
+
+    async def _current_generation(self) -> Tuple[int, Any]:
+        redis = get_redis()
+        if redis is None:
+            return self.generation, None
+        try:
+            value = await redis.get(self._generation_key)
+        except RedisError:
+            mark_redis_down()
+            return self.generation, None
+        return int(value or 0), redis
+
+    @staticmethod
+    def _request_key(request: Request) -> str:
+        query = "&".join(f"{k}={v}" for k, v in sorted(request.query_params.multi_items()))
+        return f"{request.url.path}?{query}"
+
+    def _response(self, request: Request, body: bytes, etag: str, extra_headers: Dict[str, str]) -> Response:
+        headers = {**extra_headers, "ETag": etag, "Cache-Control": "no-cache"}
+        if_none_match = request.headers.get("if-none-match", "")
+        if etag in (tag.strip() for tag in if_none_match.split(",")) or if_none_match.strip() == "*":
+            self.not_modified += 1
+            return Response(status_code=304, headers=headers)
+        return Response(content=body, media_type="application/json", headers=headers)
+
+    async def lookup(self, request: Request) -> Optional[Response]:
+        """Готовый ответ из кэша или None"""
+        if not self.enabled:
+            return None
+        generation, redis = await self._current_generation()
+        # store() запишет ответ под этим же поколением: если между чтением
+        # из БД и записью кэш инвалидировали, устаревший ответ не всплывёт
+        request.state.response_cache_generation = generation
+        key = f"{self.namespace}:{generation}:{self._request_key(request)}"
+
+        entry = self.local.get(key)
+        if entry is None and redis is not None:
+            try:
+                raw = await redis.get(key)
+            except RedisError:
+                mark_redis_down()
+                raw = None
+            if raw is not None:
+                etag, headers, body = raw.split(b"\n", 2)
+                entry = (etag.decode(), body, json.loads(headers))
+                self.local.set(key, entry)
+        if entry is None:
+            return None
+        etag, body, headers = entry
+        return self._response(request, body, etag, headers)
+
+    async def store(
+        self,
+        request: Request,
+        response_type: Any,
+        data: Any,
+        headers: Optional[Dict[str, str]] = None
+    ) -> Response:
+        """Сериализовать данные по схеме ответа, закэшировать и вернуть Response"""
+        headers = headers or {}
+        adapter = _adapter(response_type)
+        body = adapter.dump_json(adapter.validate_python(data, from_attributes=True))
+        etag = '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+        if self.enabled:
+            generation, redis = await self._current_generation()
+            generation = getattr(request.state, "response_cache_generation", generation)
+            key = f"{self.namespace}:{generation}:{self._request_key(request)}"
+            self.local.set(key, (etag, body, headers))
+            if redis is not None:
+                try:
+                    raw = b"\n".join([etag.encode(), json.dumps(headers).encode(), body])
+                    await redis.set(key, raw, ex=int(self.ttl))
+                except RedisError:
+                    mark_redis_down()
+        return self._response(request, body, etag, headers)
+
+    async def invalidate(self):
+        """Сбросить все закэшированные ответы этого пространства имён"""
+        self.generation += 1
+        self.local.clear()
+        redis = get_redis()
+        if redis is None:
+            return
+        try:
+            await redis.incr(self._generation_key)
+        except RedisError:
+            mark_redis_down()
+
+    def stats(self) -> dict:
+        return {**self.local.stats(), "not_modified": self.not_modified, "generation": self.generation}
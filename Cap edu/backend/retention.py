@@ -0,0 +1,385 @@
+"""
+Хранение по времени и очистка Analytics и Location
+
+PostgreSQL: таблицы секционированы по месяцам (PARTITION BY RANGE timestamp),
+истёкший месяц удаляется или отсоединяется в архив целиком — без DELETE.
+SQLite: эмуляция «скользящей» таблицы — основная таблица держит только окно
+хранения, истёкшие месяцы переносятся в архивные таблицы по месяцам
+(или удаляются). В обеих БД архивы <table>_archive_yYYYYmMM старше
+archive_keep_days после окна хранения удаляются простым DROP TABLE.
+
+Старые GPS точки прореживаются: в каждом интервале остаётся одна точка
+на пользователя. Граница уже прореженного хранится в retention_state,
+поэтому каждый запуск обрабатывает только дни, перешедшие порог с прошлого.
+
+Запуск вручную:
+    python retention.py            # применить политики
+    python retention.py --convert  # секционировать непустые таблицы (PostgreSQL)
+"""
+
+import asyncio
+import os
+import re
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+from sqlalchemy import (
+    Integer, Table, cast, column, delete, func, insert, inspect, select, update, table as table_clause
+)
+from sqlalchemy.engine import Connection
+from sqlalchemy.schema import AddConstraint
+
+from models import Analytics, Location, RetentionState
+
+PARTITION_MONTHS_AHEAD = 2
+
+
+@dataclass(frozen=True)
+class RetentionPolicy:
+    """Политика хранения одной таблицы (0 — шаг отключён)"""
+    table: Table
+    keep_days: int = 0  # строки старше удаляются (или уходят в архив) помесячно
+    archive: bool = False  # переносить истёкшие месяцы в <table>_archive_yYYYYmMM
+    archive_keep_days: int = 0  # архивы старше keep_days + archive_keep_days удаляются
+    downsample_after_days: int = 0  # после этого возраста строки прореживаются
+    downsample_interval_s: int = 0  # одна строка на пользователя за интервал
+
+    @property
+    def name(self) -> str:
+        return self.table.name
+
+
+def policies_from_env() -> List[RetentionPolicy]:
+    return [
+        RetentionPolicy(
+            Analytics.__table__,
+            keep_days=int(os.getenv("ANALYTICS_RETENTION_DAYS", "365")),
+            archive=os.getenv("ANALYTICS_RETENTION_ARCHIVE", "0") == "1",
+            archive_keep_days=int(os.getenv("ANALYTICS_ARCHIVE_KEEP_DAYS", "365")),
+        ),
+        RetentionPolicy(
+            Location.__table__,
+            keep_days=int(os.getenv("LOCATION_RETENTION_DAYS", "180")),
+            archive=os.getenv("LOCATION_RETENTION_ARCHIVE", "0") == "1",
+            archive_keep_days=int(os.getenv("LOCATION_ARCHIVE_KEEP_DAYS", "365")),
+            downsample_after_days=int(os.getenv("LOCATION_DOWNSAMPLE_AFTER_DAYS", "30")),
+            downsample_interval_s=int(os.getenv("LOCATION_DOWNSAMPLE_INTERVAL", "300")),
+        ),
+    ]
+
+
+# === МЕСЯЦЫ ===
+def month_start(moment: datetime) -> datetime:
+    return datetime(moment.year, moment.month, 1)
+
+
+def next_month(moment: datetime) -> datetime:
+    return datetime(moment.year + moment.month // 12, moment.month % 12 + 1, 1)
+
+
+def month_suffix(moment: datetime) -> str:
+    return f"y{moment.year:04d}m{moment.month:02d}"
+
+
+def _parse_suffix(table: str, name: str) -> Optional[datetime]:
+    match = re.fullmatch(rf"{table}_y(\d{{4}})m(\d{{2}})", name)
+    return datetime(int(match.group(1)), int(match.group(2)), 1) if match else None
+
+
+# === POSTGRESQL: СЕКЦИИ ===
+def is_partitioned(conn: Connection, table: str) -> bool:
+    relkind = conn.exec_driver_sql(
+        f"SELECT relkind FROM pg_class WHERE oid = to_regclass('{table}')"
+    ).scalar()
+    return relkind == "p"
+
+
+def list_partitions(conn: Connection, table: str) -> Dict[datetime, str]:
+    """Месячные секции таблицы: начало месяца -> имя секции"""
+    names = conn.exec_driver_sql(
+        "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+        f"WHERE i.inhparent = '{table}'::regclass"
+    ).scalars().all()
+    partitions = {}
+    for name in names:
+        start = _parse_suffix(table, name)
+        if start is not None:
+            partitions[start] = name
+    return partitions
+
+
+def ensure_partitions(
+    conn: Connection,
+    table: str,
+    first: datetime,
+    months_ahead: int = PARTITION_MONTHS_AHEAD
+) -> List[str]:
+    """Создать секции с месяца first до текущего + months_ahead"""
+    existing = list_partitions(conn, table)
+    default = f"{table}_default"
+    has_default = conn.exec_driver_sql(f"SELECT to_regclass('{default}')").scalar() is not None
+    last = month_start(datetime.utcnow())
+    for _ in range(months_ahead):
+        last = next_month(last)
+    created = []
+    start = month_start(first)
+    while start <= last:
+        if start not in existing:
+            name = f"{table}_{month_suffix(start)}"
+            bounds = f"FROM ('{start:%Y-%m-%d}') TO ('{next_month(start):%Y-%m-%d}')"
+            conn.exec_driver_sql(f"CREATE TABLE {name} (LIKE {table} INCLUDING DEFAULTS)")
+            if has_default:
+                # Строки месяца, попавшие в DEFAULT, нужно перенести до ATTACH,
+                # иначе PostgreSQL откажется подключать секцию
+                conn.exec_driver_sql(
+                    f"WITH moved AS (DELETE FROM {default} WHERE \"timestamp\" >= '{start:%Y-%m-%d}' "
+                    f"AND \"timestamp\" < '{next_month(start):%Y-%m-%d}' RETURNING *) "
+                    f"INSERT INTO {name} SELECT * FROM moved"
+                )
+            conn.exec_driver_sql(f"ALTER TABLE {table} ATTACH PARTITION {name} FOR VALUES {bounds}")
+            created.append(name)
+        start = next_month(start)
+    # Строки вне созданных месяцев (часы клиента в будущем и т.п.)
+    if not has_default:
+        conn.exec_driver_sql(f"CREATE TABLE {default} PARTITION OF {table} DEFAULT")
+    return created
+
+
+def convert_to_partitioned(conn: Connection, table: Table) -> int:
+    """Пересоздать таблицу секционированной по месяцам и перенести строки
+
+    Первичный ключ становится (id, timestamp): PostgreSQL требует, чтобы
+    уникальные ключи секционированной таблицы включали ключ секционирования.
+    """
+    name = table.name
+    legacy = f"{name}_unpartitioned"
+    sequence = conn.exec_driver_sql(f"SELECT pg_get_serial_sequence('{name}', 'id')").scalar()
+    if sequence:
+        # иначе последовательность удалится вместе со старой таблицей
+        conn.exec_driver_sql(f"ALTER SEQUENCE {sequence} OWNED BY NONE")
+    conn.exec_driver_sql(
+        f"UPDATE {name} SET \"timestamp\" = now() AT TIME ZONE 'utc' WHERE \"timestamp\" IS NULL"
+    )
+    conn.exec_driver_sql(f"ALTER TABLE {name} RENAME TO {legacy}")
+    conn.exec_driver_sql(
+        f"CREATE TABLE {name} (LIKE {legacy} INCLUDING DEFAULTS) PARTITION BY RANGE (\"timestamp\")"
+    )
+    first = conn.exec_driver_sql(f"SELECT min(\"timestamp\") FROM {legacy}").scalar()
+    ensure_partitions(conn, name, first or datetime.utcnow())
+    moved = conn.exec_driver_sql(f"INSERT INTO {name} SELECT * FROM {legacy}").rowcount
+    # Имена индексов общие для схемы: старую таблицу удаляем до их создания
+    conn.exec_driver_sql(f"DROP TABLE {legacy}")
+    conn.exec_driver_sql(f"ALTER TABLE {name} ADD PRIMARY KEY (id, \"timestamp\")")
+    if sequence:
+        conn.exec_driver_sql(f"ALTER SEQUENCE {sequence} OWNED BY {name}.id")
+    for constraint in table.foreign_key_constraints:
+        conn.execute(AddConstraint(constraint))
+    for index in table.indexes:
+        index.create(conn)
+    return moved
+
+
+# === ОЧИСТКА ===
+def _cutoff(days: int, now: datetime) -> datetime:
+    """Граница хранения, округлённая вниз до начала месяца"""
+    return month_start(now - timedelta(days=days))
+
+
+def _expire_postgresql(conn: Connection, policy: RetentionPolicy, cutoff: datetime) -> List[str]:
+    name = policy.name
+    expired = []
+    for start, partition in sorted(list_partitions(conn, name).items()):
+        if next_month(start) > cutoff:
+            continue
+        if policy.archive:
+            conn.exec_driver_sql(f"ALTER TABLE {name} DETACH PARTITION {partition}")
+            conn.exec_driver_sql(f"ALTER TABLE {partition} RENAME TO {name}_archive_{month_suffix(start)}")
+        else:
+            conn.exec_driver_sql(f"DROP TABLE {partition}")
+        expired.append(partition)
+    # В DEFAULT секции могут оказаться старые строки с неверным временем
+    conn.exec_driver_sql(f"DELETE FROM {name}_default WHERE \"timestamp\" < '{cutoff:%Y-%m-%d}'")
+    return expired
+
+
+def _expire_rows(conn: Connection, policy: RetentionPolicy, cutoff: datetime) -> List[str]:
+    """Эмуляция секций: вынести из основной таблицы месяцы до cutoff"""
+    table = policy.table
+    first = conn.scalar(select(func.min(table.c.timestamp)))
+    expired = []
+    start = month_start(first) if first else cutoff
+    while start < cutoff:
+        end = next_month(start)
+        in_month = (table.c.timestamp >= start) & (table.c.timestamp < end)
+        if policy.archive:
+            archive = f"{table.name}_archive_{month_suffix(start)}"
+            conn.exec_driver_sql(f"CREATE TABLE IF NOT EXISTS {archive} AS SELECT * FROM {table.name} LIMIT 0")
+            target = table_clause(archive, *[column(name) for name in table.columns.keys()])
+            conn.execute(insert(target).from_select(table.columns.keys(), select(table).where(in_month)))
+        if conn.execute(delete(table).where(in_month)).rowcount:
+            expired.append(f"{table.name}_{month_suffix(start)}")
+        start = end
+    return expired
+
+
+def drop_archives(conn: Connection, policy: RetentionPolicy, cutoff: datetime) -> List[str]:
+    """DROP TABLE архивных месяцев целиком до cutoff"""
+    dropped = []
+    for name in sorted(inspect(conn).get_table_names()):
+        start = _parse_suffix(f"{policy.name}_archive", name)
+        if start is not None and next_month(start) <= cutoff:
+            conn.exec_driver_sql(f"DROP TABLE {name}")
+            dropped.append(name)
+    return dropped
+
+
+def downsample(conn: Connection, policy: RetentionPolicy, start: datetime, end: datetime) -> int:
+    """Оставить одну строку на пользователя за downsample_interval_s в [start, end)"""
+    table = policy.table
+    if conn.dialect.name == "postgresql":
+        epoch = cast(func.extract("epoch", table.c.timestamp), Integer)
+    else:
+        epoch = cast(func.strftime("%s", table.c.timestamp), Integer)
+    bucket = epoch // policy.downsample_interval_s
+    removed = 0
+    # По месяцу за раз, чтобы каждый DELETE затрагивал ограниченный диапазон
+    while start < end:
+        chunk_end = min(next_month(start), end)
+        window = (table.c.timestamp >= start) & (table.c.timestamp < chunk_end)
+        keep = select(func.min(table.c.id)).where(window).group_by(table.c.user_id, bucket)
+        removed += conn.execute(delete(table).where(window & table.c.id.not_in(keep))).rowcount
+        start = chunk_end
+    return removed
+
+
+def apply_policy(conn: Connection, policy: RetentionPolicy, now: Optional[datetime] = None) -> dict:
+    now = now or datetime.utcnow()
+    postgresql = conn.dialect.name == "postgresql"
+    result = {"expired": [], "archives_dropped": [], "downsampled": 0}
+    if postgresql and is_partitioned(conn, policy.name):
+        ensure_partitions(conn, policy.name, now)
+
+    horizon = datetime.min
+    if policy.keep_days:
+        horizon = _cutoff(policy.keep_days, now)
+        if postgresql and is_partitioned(conn, policy.name):
+            result["expired"] = _expire_postgresql(conn, policy, horizon)
+        else:
+            result["expired"] = _expire_rows(conn, policy, horizon)
+        if policy.archive_keep_days:
+            archive_cutoff = _cutoff(policy.keep_days + policy.archive_keep_days, now)
+            result["archives_dropped"] = drop_archives(conn, policy, archive_cutoff)
+
+    if policy.downsample_after_days and policy.downsample_interval_s:
+        # По целым дням: прошлые запуски уже проредили всё до downsampled_until
+        threshold = now - timedelta(days=policy.downsample_after_days)
+        end = datetime(threshold.year, threshold.month, threshold.day)
+        done = conn.scalar(select(RetentionState.downsampled_until).where(RetentionState.name == policy.name))
+        start = max(horizon, done or conn.scalar(select(func.min(policy.table.c.timestamp))) or end)
+        if start < end:
+            result["downsampled"] = downsample(conn, policy, start, end)
+        _save_downsampled_until(conn, policy.name, max(end, done or end))
+    return result
+
+
+def _save_downsampled_until(conn: Connection, name: str, moment: datetime):
+    values = {"downsampled_until": moment, "updated_at": datetime.utcnow()}
+    state = RetentionState.__table__
+    if not conn.execute(update(state).where(state.c.name == name).values(**values)).rowcount:
+        conn.execute(insert(state).values(name=name, **values))
+
+
+def apply_all(conn: Connection, policies: Optional[List[RetentionPolicy]] = None) -> Dict[str, dict]:
+    return {policy.name: apply_policy(conn, policy) for policy in policies or policies_from_env()}
+
+
+def install(conn: Connection, convert_non_empty: bool = False) -> List[str]:
+    """Секционировать таблицы в PostgreSQL (при миграции)
+
+    Пустые таблицы конвертируются сразу; перенос существующих строк
+    может занять долго, поэтому выполняется только явно (--convert).
+    """
+    if conn.dialect.name != "postgresql":
+        return []
+    converted = []
+    for policy in policies_from_env():
+        name = policy.name
+        if is_partitioned(conn, name):
+            ensure_partitions(conn, name, datetime.utcnow())
+            continue
+        has_rows = conn.exec_driver_sql(f"SELECT 1 FROM {name} LIMIT 1").first() is not None
+        if has_rows and not convert_non_empty:
+            print(f"⚠️ {name} is not partitioned; run: python retention.py --convert")
+            continue
+        convert_to_partitioned(conn, policy.table)
+        converted.append(name)
+    return converted
+
+
+class RetentionJob:
+    """Фоновое применение политик хранения"""
+
+    def __init__(self, interval: float = 86400.0):
+        self.interval = interval
+        self._task = None
+        self.last_run: Optional[datetime] = None
+        self.last_result: Dict[str, dict] = {}
+
+    @classmethod
+    def from_env(cls) -> "RetentionJob":
+        return cls(interval=float(os.getenv("RETENTION_INTERVAL", "86400")))
+
+    async def run_once(self) -> Dict[str, dict]:
+        from database import async_engine
+
+        async with async_engine.begin() as conn:
+            self.last_result = await conn.run_sync(apply_all)
+        self.last_run = datetime.utcnow()
+        return self.last_result
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.run_once()
+            except Exception as exc:
+                print(f"⚠️ Retention run failed: {exc}")
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        # Каждый запуск — одна транзакция, отмена откатывает её целиком
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def stats(self) -> dict:
+        return {
+            "last_run": self.last_run.isoformat() if self.last_run else None,
+            "last_result": self.last_result,
+        }
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from database import engine
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--convert", action="store_true", help="секционировать непустые таблицы (PostgreSQL)")
+    args = parser.parse_args()
+    with engine.begin() as connection:
+        if args.convert:
+            print(f"✅ Partitioned: {install(connection, convert_non_empty=True) or 'nothing to do'}")
+        for table_name, outcome in apply_all(connection).items():
+            print(
+                f"✅ {table_name}: expired {outcome['expired'] or 'none'}, "
+                f"archives dropped {outcome['archives_dropped'] or 'none'}, downsampled {outcome['downsampled']}"
+            )
@@ -2,9 +2,9 @@
 Pydantic Schemas для валидации данных
 """
 
-from pydantic import BaseModel, EmailStr, Field
+from pydantic import BaseModel, EmailStr, Field, model_validator
 from datetime import datetime
-from typing import Optional, List
+from typing import Annotated, Optional, List, Tuple, Dict, Literal
 
 
 # === СХЕМЫ ПОЛЬЗОВАТЕЛЯ ===
@@ -29,11 +29,13 @@ class UserUpdate(BaseModel):
     full_name: Optional[str] = None
     age: Optional[int] = None
     email: Optional[EmailStr] = None
+    parent_id: Optional[int] = None  # аккаунт родителя, которому ребёнок открывает свои GPS точки
 
 
 class UserResponse(UserBase):
     id: int
     is_active: bool
+    parent_id: Optional[int] = None
     created_at: datetime
     
     class Config:
@@ -58,6 +60,7 @@ class GameCreate(GameBase):
 class GameResponse(GameBase):
     id: int
     image_url: Optional[str]
+    content_hash: Optional[str] = None  # ETag для /games/{id}/content
     created_at: datetime
     
     class Config:
@@ -112,6 +115,20 @@ class ProgressResponse(ProgressBase):
         from_attributes = True
 
 
+# === СХЕМЫ РЕЙТИНГОВ ===
+class LeaderboardEntry(BaseModel):
+    rank: int  # с единицы
+    user_id: int
+    username: Optional[str] = None
+    score: int
+
+
+class LeaderboardResponse(BaseModel):
+    board: str
+    entries: List[LeaderboardEntry]
+    me: Optional[LeaderboardEntry] = None
+
+
 # === СХЕМЫ ДОСТИЖЕНИЙ ===
 class AchievementBase(BaseModel):
     title: str
@@ -151,6 +168,72 @@ class LocationResponse(LocationBase):
         from_attributes = True
 
 
+class LastPosition(LocationBase):
+    user_id: int
+    timestamp: datetime
+
+
+# Элементы компактной точки: координаты вне диапазона, NaN/inf и метки
+# времени, которые не переводятся в datetime, отклоняются с 422
+BatchLatitude = Annotated[float, Field(ge=-90, le=90, allow_inf_nan=False)]
+BatchLongitude = Annotated[float, Field(ge=-180, le=180, allow_inf_nan=False)]
+BatchAccuracy = Annotated[float, Field(ge=0, allow_inf_nan=False)]
+BatchTimestamp = Annotated[float, Field(ge=0, le=4102444800, allow_inf_nan=False)]  # до 2100-01-01
+
+
+class LocationBatch(BaseModel):
+    # Компактные точки: [latitude, longitude, accuracy, timestamp (Unix, сек)]
+    fixes: List[Tuple[BatchLatitude, BatchLongitude, Optional[BatchAccuracy], Optional[BatchTimestamp]]] = Field(
+        ..., min_length=1, max_length=1000
+    )
+
+
+class LocationBatchResponse(BaseModel):
+    received: int
+    stored: int
+    skipped: int
+
+
+# === СХЕМЫ ГЕОЗОН ===
+class GeofenceCreate(BaseModel):
+    user_id: int  # ребёнок
+    name: str = Field(..., min_length=1, max_length=100)
+    kind: Literal["circle", "polygon"]
+    latitude: Optional[float] = Field(None, ge=-90, le=90)
+    longitude: Optional[float] = Field(None, ge=-180, le=180)
+    radius_m: Optional[float] = Field(None, gt=0, le=50000)
+    points: Optional[List[Tuple[float, float]]] = Field(None, min_length=3, max_length=200)
+    
+    @model_validator(mode="after")
+    def check_shape(self):
+        if self.kind == "circle" and None in (self.latitude, self.longitude, self.radius_m):
+            raise ValueError("circle requires latitude, longitude and radius_m")
+        if self.kind == "polygon" and not self.points:
+            raise ValueError("polygon requires points")
+        return self
+
+
+class GeofenceResponse(GeofenceCreate):
+    id: int
+    owner_id: int
+    created_at: datetime
+    
+    class Config:
+        from_attributes = True
+
+
+class GeofenceEventResponse(BaseModel):
+    geofence_id: int
+    user_id: int
+    event: str
+    latitude: float
+    longitude: float
+    timestamp: datetime
+    
+    class Config:
+        from_attributes = True
+
+
 # === СХЕМЫ КОНТЕНТА ===
 class ContentBase(BaseModel):
     title: str
@@ -197,3 +280,29 @@ class AnalyticsResponse(AnalyticsEvent):
     
     class Config:
         from_attributes = True
+
+
+class AnalyticsAdminResponse(AnalyticsResponse):
+    user_id: Optional[int]
+
+
+class AnalyticsBatch(BaseModel):
+    events: List[AnalyticsEvent] = Field(..., min_length=1, max_length=500)
+
+
+class AnalyticsBatchResponse(BaseModel):
+    accepted: int
+    dropped: int
+
+
+class ExportRequest(BaseModel):
+    tables: Optional[List[str]] = None  # по умолчанию analytics, locations, progress
+
+
+class ExportStatus(BaseModel):
+    running: bool
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    error: Optional[str] = None
+    results: Dict[str, dict] = {}
+    watermarks: Dict[str, dict] = {}  # последний выгруженный id по таблицам
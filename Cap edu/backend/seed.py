@@ -1,184 +1,424 @@
 """
 Сид-данные для базы данных QazKids
-Инициальные данные для демонстрации
+Демо каталог (игры, фильмы, статьи) и синтетические данные для нагрузочных тестов
+
+Каталог обновляется по естественному ключу (название игры/фильма, slug статьи),
+поэтому повторный запуск не создаёт дубликатов. Синтетические пользователи
+генерируются детерминированно (load_user_<n>) и досоздаются только недостающие:
+прерванный или повторный запуск продолжает с того же места.
+
+Запуск:
+    python seed.py                          # только демо каталог
+    python seed.py --preset small           # + нагрузочные данные
+    python seed.py --preset large --seed 7
 """
 
-from datetime import datetime
-from models import Game, Film, Content
-from database import SessionLocal
-
-def seed_games():
-    """Добавить примеры игр"""
-    db = SessionLocal()
-    
-    games = [
-        Game(
-            title="Викторина: Казахские традиции",
-            description="Узнайте о казахской культуре, традициях и истории",
-            category="quiz",
-            difficulty="easy",
-            duration_minutes=10,
-            image_url="/images/card-kz-1.jpg",
-            content='{"questions": [{"q": "Что такое юрта?", "a": "Жилище кочевников"}]}',
-            max_score=100
-        ),
-        Game(
-            title="Словарь казахского языка",
-            description="Учите новые слова на казахском языке через игру",
-            category="word-game",
-            difficulty="medium",
-            duration_minutes=15,
-            image_url="/images/card-kz-2.jpg",
-            content='{"words": [{"en": "hello", "kz": "сәлем"}]}',
-            max_score=100
-        ),
-        Game(
-            title="Математические пазлы",
-            description="Решайте математические задачи в увлекательной форме",
-            category="puzzle",
-            difficulty="medium",
-            duration_minutes=20,
-            image_url="/images/card-modern-1.jpg",
-            content='{"puzzles": []}',
-            max_score=100
-        ),
-        Game(
-            title="Память: Казахская история",
-            description="Игра на память с картинками из казахской истории",
-            category="memory",
-            difficulty="easy",
-            duration_minutes=10,
-            image_url="/images/card-author.jpg",
-            content='{"cards": []}',
-            max_score=100
-        ),
-        Game(
-            title="Викторина: География Казахстана",
-            description="Тестируйте знания о географии нашей страны",
-            category="quiz",
-            difficulty="hard",
-            duration_minutes=15,
-            image_url="/images/card-cinema-1.jpg",
-            content='{"questions": []}',
-            max_score=100
-        ),
-    ]
-    
-    db.add_all(games)
-    db.commit()
-    print(f"✅ Добавлено {len(games)} игр")
-    db.close()
-
-
-def seed_films():
-    """Добавить примеры фильмов"""
-    db = SessionLocal()
-    
-    films = [
-        Film(
-            title="Мен Қожа Түгімеулі болдым",
-            description="Документальный фильм о казахском герое Қожа Түгімеулі",
-            duration_minutes=45,
-            video_url="https://example.com/video1.mp4",
-            thumbnail_url="/images/image-14.png",
-            category="history",
-            rating=4.8,
-            views=150
-        ),
-        Film(
-            title="Казахская кухня: История и традиции",
-            description="Учебный фильм о традиционной казахской кухне",
-            duration_minutes=30,
-            video_url="https://example.com/video2.mp4",
-            thumbnail_url="/images/image-69.png",
-            category="culture",
-            rating=4.6,
-            views=120
-        ),
-        Film(
-            title="Великие люди Казахстана",
-            description="Серия фильмов о известных казахских писателях и деятелях",
-            duration_minutes=60,
-            video_url="https://example.com/video3.mp4",
-            thumbnail_url="/images/card-cinema-1.jpg",
-            category="education",
-            rating=4.9,
-            views=200
-        ),
-        Film(
-            title="Природа Казахстана",
-            description="Красивый фильм о природе и животных Казахстана",
-            duration_minutes=50,
-            video_url="https://example.com/video4.mp4",
-            thumbnail_url="/images/image-14.png",
-            category="nature",
-            rating=4.7,
-            views=180
-        ),
-    ]
-    
-    db.add_all(films)
-    db.commit()
-    print(f"✅ Добавлено {len(films)} фильмов")
-    db.close()
-
-
-def seed_content():
-    """Добавить примеры контента (статей)"""
-    db = SessionLocal()
-    
-    content_items = [
-        Content(
-            title="Как помочь ребёнку учиться эффективнее",
-            slug="how-to-help-child-learn",
-            body="Практические советы для родителей по поддержке обучения детей...",
-            content_type="article",
-            author="admin",
-            status="published",
-            published_at=datetime.utcnow()
-        ),
-        Content(
-            title="Казахский язык: Основные фразы",
-            slug="kazakh-language-phrases",
-            body="Учебный материал с основными казахскими фразами...",
-            content_type="lesson",
-            author="teacher",
-            status="published",
-            published_at=datetime.utcnow()
-        ),
-        Content(
-            title="Безопасность детей в интернете",
-            slug="internet-safety-for-kids",
-            body="Руководство по безопасному использованию интернета...",
-            content_type="guide",
-            author="admin",
-            status="published",
-            published_at=datetime.utcnow()
-        ),
-        Content(
-            title="История Казахского ханства",
-            slug="history-of-kazakh-khanate",
-            body="Исторический обзор развития Казахского ханства...",
-            content_type="article",
-            author="teacher",
-            status="published",
-            published_at=datetime.utcnow()
-        ),
+import argparse
+import csv
+import io
+import random
+import time
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, Iterator, List
+
+import orjson
+from sqlalchemy import Table, insert, select, update, func, bindparam
+from sqlalchemy.engine import Connection
+
+from models import Base, User, Game, Film, Content, Progress, Achievement, Location, Analytics
+from database import engine
+from migrations import upgrade
+from passwords import PasswordHasher
+from payloads import pack_content
+
+# === ДЕМО КАТАЛОГ ===
+GAMES = [
+    {
+        "title": "Викторина: Казахские традиции",
+        "description": "Узнайте о казахской культуре, традициях и истории",
+        "category": "quiz",
+        "difficulty": "easy",
+        "duration_minutes": 10,
+        "image_url": "/images/card-kz-1.jpg",
+        "content": {"questions": [{"q": "Что такое юрта?", "a": "Жилище кочевников"}]},
+        "max_score": 100,
+    },
+    {
+        "title": "Словарь казахского языка",
+        "description": "Учите новые слова на казахском языке через игру",
+        "category": "word-game",
+        "difficulty": "medium",
+        "duration_minutes": 15,
+        "image_url": "/images/card-kz-2.jpg",
+        "content": {"words": [{"en": "hello", "kz": "сәлем"}]},
+        "max_score": 100,
+    },
+    {
+        "title": "Математические пазлы",
+        "description": "Решайте математические задачи в увлекательной форме",
+        "category": "puzzle",
+        "difficulty": "medium",
+        "duration_minutes": 20,
+        "image_url": "/images/card-modern-1.jpg",
+        "content": {"puzzles": []},
+        "max_score": 100,
+    },
+    {
+        "title": "Память: Казахская история",
+        "description": "Игра на память с картинками из казахской истории",
+        "category": "memory",
+        "difficulty": "easy",
+        "duration_minutes": 10,
+        "image_url": "/images/card-author.jpg",
+        "content": {"cards": []},
+        "max_score": 100,
+    },
+    {
+        "title": "Викторина: География Казахстана",
+        "description": "Тестируйте знания о географии нашей страны",
+        "category": "quiz",
+        "difficulty": "hard",
+        "duration_minutes": 15,
+        "image_url": "/images/card-cinema-1.jpg",
+        "content": {"questions": []},
+        "max_score": 100,
+    },
+]
+
+FILMS = [
+    {
+        "title": "Мен Қожа Түгімеулі болдым",
+        "description": "Документальный фильм о казахском герое Қожа Түгімеулі",
+        "duration_minutes": 45,
+        "video_url": "https://example.com/video1.mp4",
+        "thumbnail_url": "/images/image-14.png",
+        "category": "history",
+        "rating": 4.8,
+        "views": 150,
+    },
+    {
+        "title": "Казахская кухня: История и традиции",
+        "description": "Учебный фильм о традиционной казахской кухне",
+        "duration_minutes": 30,
+        "video_url": "https://example.com/video2.mp4",
+        "thumbnail_url": "/images/image-69.png",
+        "category": "culture",
+        "rating": 4.6,
+        "views": 120,
+    },
+    {
+        "title": "Великие люди Казахстана",
+        "description": "Серия фильмов о известных казахских писателях и деятелях",
+        "duration_minutes": 60,
+        "video_url": "https://example.com/video3.mp4",
+        "thumbnail_url": "/images/card-cinema-1.jpg",
+        "category": "education",
+        "rating": 4.9,
+        "views": 200,
+    },
+    {
+        "title": "Природа Казахстана",
+        "description": "Красивый фильм о природе и животных Казахстана",
+        "duration_minutes": 50,
+        "video_url": "https://example.com/video4.mp4",
+        "thumbnail_url": "/images/image-14.png",
+        "category": "nature",
+        "rating": 4.7,
+        "views": 180,
+    },
+]
+
+CONTENT = [
+    {
+        "title": "Как помочь ребёнку учиться эффективнее",
+        "slug": "how-to-help-child-learn",
+        "body": "Практические советы для родителей по поддержке обучения детей...",
+        "content_type": "article",
+        "author": "admin",
+        "status": "published",
+    },
+    {
+        "title": "Казахский язык: Основные фразы",
+        "slug": "kazakh-language-phrases",
+        "body": "Учебный материал с основными казахскими фразами...",
+        "content_type": "lesson",
+        "author": "teacher",
+        "status": "published",
+    },
+    {
+        "title": "Безопасность детей в интернете",
+        "slug": "internet-safety-for-kids",
+        "body": "Руководство по безопасному использованию интернета...",
+        "content_type": "guide",
+        "author": "admin",
+        "status": "published",
+    },
+    {
+        "title": "История Казахского ханства",
+        "slug": "history-of-kazakh-khanate",
+        "body": "Исторический обзор развития Казахского ханства...",
+        "content_type": "article",
+        "author": "teacher",
+        "status": "published",
+    },
+]
+
+
+def upsert_by_key(conn: Connection, table: Table, key: str, rows: List[dict], insert_only=()) -> tuple:
+    """Вставить новые строки и обновить существующие по естественному ключу
+
+    Уникальных ограничений на названия нет (старые базы могут содержать
+    дубликаты), поэтому вместо ON CONFLICT — выборка ключей и два пакета.
+    insert_only — поля, которые задаются только при вставке (например, views).
+    """
+    key_column = table.c[key]
+    existing = set(conn.scalars(select(key_column).where(key_column.in_([row[key] for row in rows]))))
+    new_rows = [row for row in rows if row[key] not in existing]
+    changed = [
+        {**{name: value for name, value in row.items() if name not in insert_only}, "_key": row[key]}
+        for row in rows if row[key] in existing
     ]
-    
-    db.add_all(content_items)
-    db.commit()
-    print(f"✅ Добавлено {len(content_items)} статей")
-    db.close()
+    if new_rows:
+        conn.execute(insert(table), new_rows)
+    if changed:
+        values = {name: bindparam(name) for name in changed[0] if name not in ("_key", key)}
+        conn.execute(update(table).where(key_column == bindparam("_key")).values(values), changed)
+    return len(new_rows), len(changed)
+
+
+def seed_games(conn: Connection):
+    """Добавить или обновить примеры игр"""
+    rows = []
+    for game in GAMES:
+        content_gzip, content_hash = pack_content(game["content"])
+        rows.append({**game, "content_gzip": content_gzip, "content_hash": content_hash})
+    added, updated = upsert_by_key(conn, Game.__table__, "title", rows)
+    print(f"✅ Игры: добавлено {added}, обновлено {updated}")
+
+
+def seed_films(conn: Connection):
+    """Добавить или обновить примеры фильмов"""
+    # Накопленные просмотры не сбрасываются при повторном запуске
+    added, updated = upsert_by_key(conn, Film.__table__, "title", FILMS, insert_only=("views",))
+    print(f"✅ Фильмы: добавлено {added}, обновлено {updated}")
+
+
+def seed_content(conn: Connection):
+    """Добавить или обновить примеры контента (статей)"""
+    now = datetime.utcnow()
+    rows = [{**item, "published_at": now} for item in CONTENT]
+    added, updated = upsert_by_key(conn, Content.__table__, "slug", rows, insert_only=("published_at",))
+    print(f"✅ Статьи: добавлено {added}, обновлено {updated}")
+
+
+# === НАГРУЗОЧНЫЕ ДАННЫЕ ===
+# пользователей, GPS точек на пользователя, событий на пользователя
+PRESETS = {
+    "small": {"users": 1_000, "locations": 50, "events": 50},
+    "medium": {"users": 20_000, "locations": 100, "events": 100},
+    "large": {"users": 100_000, "locations": 200, "events": 150},
+}
+USER_BATCH = 1_000
+LOAD_USER_PREFIX = "load_user_"
+LOAD_PASSWORD = "password123"
+
+FIRST_NAMES = ["Айгерим", "Алихан", "Дана", "Ерлан", "Жанель", "Нурлан", "Айсулу", "Тимур", "Амина", "Арман"]
+LAST_NAMES = ["Ахметов", "Серикова", "Жумабаев", "Нурланова", "Касымов", "Оспанова", "Бекова", "Тулегенов"]
+# Центры районов Алматы, вокруг которых «гуляют» дети
+HOME_AREAS = [(43.2389, 76.8897), (43.2567, 76.9286), (43.2220, 76.8512), (43.2775, 76.8958)]
+EVENT_TYPES = ["game_start", "game_complete", "film_view"]
+
+
+def _user_rows(first: int, last: int, seed: int, password_hash: str, now: datetime) -> Iterator[dict]:
+    for n in range(first, last):
+        rng = random.Random(f"{seed}:user:{n}")
+        yield {
+            "username": f"{LOAD_USER_PREFIX}{n}",
+            "email": f"{LOAD_USER_PREFIX}{n}@load.qazkids.kz",
+            "password_hash": password_hash,
+            "full_name": f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}",
+            "age": rng.randint(5, 14),
+            "role": "parent" if rng.random() < 0.1 else "student",
+            "is_active": rng.random() > 0.02,
+            "created_at": now - timedelta(days=rng.uniform(30, 365)),
+        }
+
+
+def _activity_rows(
+    user_id: int,
+    n: int,
+    seed: int,
+    preset: dict,
+    game_ids: List[int],
+    film_ids: List[int],
+    now: datetime
+) -> Dict[str, list]:
+    """Прогресс, достижения, GPS трек и события одного пользователя"""
+    rng = random.Random(f"{seed}:activity:{n}")
+    rows = {"progress": [], "achievements": [], "locations": [], "analytics": []}
+
+    for game_id in rng.sample(game_ids, rng.randint(0, len(game_ids))):
+        score = max(0, min(100, int(rng.gauss(65, 20))))
+        started = now - timedelta(days=rng.uniform(0, 90))
+        completed = score >= 70
+        rows["progress"].append({
+            "user_id": user_id, "game_id": game_id, "score": score,
+            "attempts": rng.randint(1, 8), "completed": completed,
+            "completed_at": started + timedelta(minutes=rng.randint(5, 30)) if completed else None,
+            "started_at": started,
+        })
+        if score >= 90:
+            rows["achievements"].append({
+                "user_id": user_id, "title": "Отличник", "badge_type": "gold", "earned_at": started,
+            })
+
+    # Прогулки по минуте между точками: случайное блуждание вокруг дома
+    lat, lon = rng.choice(HOME_AREAS)
+    moment = now - timedelta(days=rng.uniform(1, 30))
+    for _ in range(preset["locations"]):
+        lat += rng.gauss(0, 0.0004)
+        lon += rng.gauss(0, 0.0005)
+        moment += timedelta(seconds=rng.randint(30, 120))
+        rows["locations"].append({
+            "user_id": user_id, "latitude": round(lat, 6), "longitude": round(lon, 6),
+            "accuracy": round(rng.uniform(3, 40), 1), "timestamp": moment,
+        })
+
+    for _ in range(preset["events"]):
+        event_type = rng.choice(EVENT_TYPES)
+        if event_type == "film_view":
+            data = {"film_id": rng.choice(film_ids)}
+        else:
+            data = {"game_id": rng.choice(game_ids), "level": rng.randint(1, 10)}
+        rows["analytics"].append({
+            "user_id": user_id, "event_type": event_type, "event_data": data,
+            "timestamp": now - timedelta(seconds=rng.uniform(0, 90 * 86400)),
+        })
+    return rows
+
+
+def _copy_value(value):
+    if value is None:
+        return None
+    if isinstance(value, bool):
+        return "t" if value else "f"
+    if isinstance(value, dict):
+        return orjson.dumps(value).decode()
+    return value
+
+
+def bulk_insert(conn: Connection, table: Table, rows: List[dict]):
+    """Пакетная вставка: COPY в PostgreSQL (psycopg2), иначе Core executemany"""
+    if not rows:
+        return
+    if conn.dialect.name == "postgresql" and conn.dialect.driver == "psycopg2":
+        columns = list(rows[0])
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        for row in rows:
+            writer.writerow([_copy_value(row[column]) for column in columns])
+        buffer.seek(0)
+        cursor = conn.connection.dbapi_connection.cursor()
+        # Пустое значение без кавычек в CSV — NULL
+        cursor.copy_expert(f"COPY {table.name} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)", buffer)
+        cursor.close()
+    else:
+        conn.execute(insert(table), rows)
+
+
+def _chunks(items: Iterable, size: int) -> Iterator[list]:
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def link_children(seed: int = 42) -> int:
+    """Привязать часть нагрузочных учеников к родителям (users.parent_id)"""
+    with engine.begin() as conn:
+        load_users = User.username.like(f"{LOAD_USER_PREFIX}%")
+        parents = conn.scalars(select(User.id).where(load_users & (User.role == "parent")).order_by(User.id)).all()
+        children = conn.scalars(
+            select(User.id).where(load_users & (User.role == "student") & User.parent_id.is_(None)).order_by(User.id)
+        ).all()
+        if not parents:
+            return 0
+        links = []
+        for child_id in children:
+            # Решение по каждому ребёнку детерминировано: повторный запуск не добавит новых связей
+            rng = random.Random(f"{seed}:parent:{child_id}")
+            if rng.random() < 0.3:
+                links.append({"child_id": child_id, "linked_parent": rng.choice(parents)})
+        if links:
+            conn.execute(
+                update(User.__table__)
+                .where(User.id == bindparam("child_id"))
+                .values(parent_id=bindparam("linked_parent")),
+                links
+            )
+    return len(links)
+
+
+def seed_load(preset_name: str, seed: int = 42):
+    """Досоздать синтетических пользователей и их активность до размера пресета"""
+    preset = PRESETS[preset_name]
+    with engine.begin() as conn:
+        game_ids = list(conn.scalars(select(Game.id).order_by(Game.id)))
+        film_ids = list(conn.scalars(select(Film.id).order_by(Film.id)))
+        existing = conn.scalar(
+            select(func.count()).select_from(User).where(User.username.like(f"{LOAD_USER_PREFIX}%"))
+        )
+    if existing >= preset["users"]:
+        print(f"✅ Нагрузочные данные уже есть: {existing} пользователей")
+        link_children(seed)
+        return
+
+    hasher = PasswordHasher.from_env()
+    # Один bcrypt хеш на всех: миллионы хешей заняли бы часы
+    password_hash = hasher.context.hash(LOAD_PASSWORD)
+    hasher.shutdown()
+
+    # Фиксированное «сейчас» в пределах суток: повторный запуск даёт те же данные
+    now = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+    started = time.perf_counter()
+    users = _user_rows(existing, preset["users"], seed, password_hash, now)
+    created = 0
+    for batch in _chunks(users, USER_BATCH):
+        # Пакет пользователей и вся их активность — одна транзакция,
+        # поэтому прерванный запуск не оставляет пользователей без данных
+        with engine.begin() as conn:
+            user_ids = conn.scalars(insert(User).returning(User.id, sort_by_parameter_order=True), batch).all()
+            tables = {"progress": [], "achievements": [], "locations": [], "analytics": []}
+            for user_id, row in zip(user_ids, batch):
+                n = int(row["username"][len(LOAD_USER_PREFIX):])
+                for name, rows in _activity_rows(user_id, n, seed, preset, game_ids, film_ids, now).items():
+                    tables[name].extend(rows)
+            for model in (Progress, Achievement, Location, Analytics):
+                bulk_insert(conn, model.__table__, tables[model.__tablename__])
+        created += len(batch)
+        elapsed = time.perf_counter() - started
+        print(f"   {existing + created}/{preset['users']} пользователей ({created / elapsed:.0f}/с)", flush=True)
+    print(f"✅ Нагрузочные данные: добавлено {created} пользователей за {time.perf_counter() - started:.1f}с")
+    print(f"✅ Привязано к родителям: {link_children(seed)} детей")
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--preset", choices=list(PRESETS), help="добавить нагрузочные данные")
+    parser.add_argument("--seed", type=int, default=42, help="seed генератора (данные детерминированы)")
+    args = parser.parse_args()
+
     print("🌱 Seed data initialization...")
-    try:
-        seed_games()
-        seed_films()
-        seed_content()
-        print("\n✅ Database seeding completed successfully!")
-    except Exception as e:
-        print(f"❌ Error: {e}")
-        
+    with engine.begin() as connection:
+        Base.metadata.create_all(bind=connection)
+        upgrade(connection)
+        seed_games(connection)
+        seed_films(connection)
+        seed_content(connection)
+    if args.preset:
+        seed_load(args.preset, args.seed)
+    print("\n✅ Database seeding completed successfully!")
@@ -0,0 +1,188 @@
+"""
+Счётчики для /analytics/stats
+Значения хранятся в таблице stats_counters и поддерживаются триггерами БД
+при каждой записи, поэтому endpoint читает несколько строк вместо COUNT(*).
+Периодическая сверка пересчитывает счётчики и исправляет расхождения.
+"""
+
+import asyncio
+import os
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from sqlalchemy import select, update, insert, func, true
+from sqlalchemy.engine import Connection
+
+from models import StatsCounter, User, Game, Film, Progress
+
+# имя счётчика -> (модель, булев флаг или None для всех строк)
+COUNTERS = {
+    "total_users": (User, None),
+    "active_users": (User, "is_active"),
+    "total_games": (Game, None),
+    "total_films": (Film, None),
+    "completed_games": (Progress, "completed"),
+}
+
+
+def _counter_update(name: str, delta: str, now: str, condition: Optional[str] = None) -> str:
+    where = f"name = '{name}'" + (f" AND {condition}" if condition else "")
+    return f"UPDATE stats_counters SET value = value + ({delta}), updated_at = {now} WHERE {where};"
+
+
+def _tables() -> Dict[str, List[tuple]]:
+    tables: Dict[str, List[tuple]] = {}
+    for name, (model, flag) in COUNTERS.items():
+        tables.setdefault(model.__tablename__, []).append((name, flag))
+    return tables
+
+
+def sqlite_triggers() -> List[str]:
+    now = "CURRENT_TIMESTAMP"
+    statements = []
+    for table, counters in _tables().items():
+        on_insert = [
+            _counter_update(name, "1", now, f"COALESCE(NEW.{flag}, 0)" if flag else None)
+            for name, flag in counters
+        ]
+        on_delete = [
+            _counter_update(name, "-1", now, f"COALESCE(OLD.{flag}, 0)" if flag else None)
+            for name, flag in counters
+        ]
+        statements.append(
+            f"CREATE TRIGGER IF NOT EXISTS trg_{table}_stats_insert AFTER INSERT ON {table} "
+            f"BEGIN {' '.join(on_insert)} END"
+        )
+        statements.append(
+            f"CREATE TRIGGER IF NOT EXISTS trg_{table}_stats_delete AFTER DELETE ON {table} "
+            f"BEGIN {' '.join(on_delete)} END"
+        )
+        for name, flag in counters:
+            if flag is None:
+                continue
+            change = _counter_update(name, f"CASE WHEN NEW.{flag} THEN 1 ELSE -1 END", now)
+            statements.append(
+                f"CREATE TRIGGER IF NOT EXISTS trg_{table}_stats_{flag} AFTER UPDATE OF {flag} ON {table} "
+                f"WHEN COALESCE(OLD.{flag}, 0) <> COALESCE(NEW.{flag}, 0) "
+                f"BEGIN {change} END"
+            )
+    return statements
+
+
+def postgresql_triggers() -> List[str]:
+    now = "(now() AT TIME ZONE 'utc')"
+    statements = []
+    for table, counters in _tables().items():
+        flags = [flag for _, flag in counters if flag]
+        on_insert = " ".join(
+            _counter_update(name, "1", now, f"COALESCE(NEW.{flag}, false)" if flag else None)
+            for name, flag in counters
+        )
+        on_delete = " ".join(
+            _counter_update(name, "-1", now, f"COALESCE(OLD.{flag}, false)" if flag else None)
+            for name, flag in counters
+        )
+        on_update = " ".join(
+            f"IF COALESCE(OLD.{flag}, false) IS DISTINCT FROM COALESCE(NEW.{flag}, false) THEN "
+            + _counter_update(name, f"CASE WHEN NEW.{flag} THEN 1 ELSE -1 END", now)
+            + " END IF;"
+            for name, flag in counters if flag
+        )
+        statements.append(
+            f"CREATE OR REPLACE FUNCTION {table}_stats_trigger() RETURNS trigger AS $$ BEGIN "
+            f"IF TG_OP = 'INSERT' THEN {on_insert} "
+            f"ELSIF TG_OP = 'DELETE' THEN {on_delete} "
+            f"ELSIF TG_OP = 'UPDATE' THEN {on_update or 'NULL;'} "
+            f"END IF; RETURN NULL; END $$ LANGUAGE plpgsql"
+        )
+        events = "INSERT OR DELETE" + "".join(f" OR UPDATE OF {flag}" for flag in flags)
+        statements.append(
+            f"CREATE OR REPLACE TRIGGER trg_{table}_stats AFTER {events} ON {table} "
+            f"FOR EACH ROW EXECUTE FUNCTION {table}_stats_trigger()"
+        )
+    return statements
+
+
+def _count_query(model, flag: Optional[str]):
+    query = select(func.count()).select_from(model)
+    if flag:
+        query = query.where(getattr(model, flag) == true())
+    return query.scalar_subquery()
+
+
+def reconcile(conn: Connection, names: Optional[List[str]] = None) -> Dict[str, int]:
+    """Пересчитать счётчики по таблицам; вернуть найденные расхождения"""
+    now = datetime.utcnow()
+    current = dict(conn.execute(select(StatsCounter.name, StatsCounter.value)).all())
+    drift = {}
+    for name in names or COUNTERS:
+        model, flag = COUNTERS[name]
+        # Пересчёт одним UPDATE, чтобы не разрывать чтение и запись
+        conn.execute(
+            update(StatsCounter.__table__)
+            .where(StatsCounter.name == name)
+            .values(value=_count_query(model, flag), updated_at=now, reconciled_at=now)
+        )
+        value = conn.scalar(select(StatsCounter.value).where(StatsCounter.name == name))
+        if current.get(name) != value:
+            drift[name] = value - (current.get(name) or 0)
+    return drift
+
+
+def install(conn: Connection):
+    """Создать строки счётчиков и триггеры (идемпотентно)"""
+    existing = set(conn.scalars(select(StatsCounter.name)).all())
+    missing = [name for name in COUNTERS if name not in existing]
+    if missing:
+        conn.execute(insert(StatsCounter.__table__), [{"name": name, "value": 0} for name in missing])
+
+    statements = postgresql_triggers() if conn.dialect.name == "postgresql" else sqlite_triggers()
+    for statement in statements:
+        conn.exec_driver_sql(statement)
+
+    if missing:
+        reconcile(conn, missing)
+
+
+class StatsReconciler:
+    """Фоновая периодическая сверка счётчиков"""
+
+    def __init__(self, interval: float = 3600.0):
+        self.interval = interval
+        self._task = None
+        self.last_drift: Dict[str, int] = {}
+
+    @classmethod
+    def from_env(cls) -> "StatsReconciler":
+        return cls(interval=float(os.getenv("STATS_RECONCILE_INTERVAL", "3600")))
+
+    async def run_once(self) -> Dict[str, int]:
+        from database import async_engine
+
+        async with async_engine.begin() as conn:
+            self.last_drift = await conn.run_sync(reconcile)
+        if self.last_drift:
+            print(f"⚠️ Stats counters drift corrected: {self.last_drift}")
+        return self.last_drift
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.run_once()
+            except Exception as exc:
+                print(f"⚠️ Stats reconcile failed: {exc}")
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        # Сверка идемпотентна, поэтому её можно просто отменить
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
@@ -0,0 +1,48 @@
+"""
+Общие фикстуры тестов: приложение на временной SQLite (если DATABASE_URL
+не задан, как в CI) и пользователи с готовым токеном
+"""
+
+import itertools
+import os
+import sys
+import tempfile
+
+import pytest
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+if "DATABASE_URL" not in os.environ:
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tempfile.mkdtemp(prefix='qazkids-test-'), 'test.db')}"
+
+from fastapi.testclient import TestClient  # noqa: E402
+
+from database import SessionLocal  # noqa: E402
+from models import User  # noqa: E402
+import fastapi_app  # noqa: E402
+
+_user_numbers = itertools.count(1)
+
+
+@pytest.fixture(scope="session")
+def client():
+    """Одно приложение на всю сессию: startup создаёт таблицы и фоновые пулы"""
+    with TestClient(fastapi_app.app) as test_client:
+        yield test_client
+
+
+@pytest.fixture
+def make_user(client):
+    """Создать пользователя напрямую в БД и вернуть (id, заголовки с токеном)"""
+    def make(**fields):
+        number = f"{os.getpid()}-{next(_user_numbers)}"
+        db = SessionLocal()
+        user = User(username=f"test{number}", email=f"test{number}@example.com", password_hash="x", **fields)
+        db.add(user)
+        db.commit()
+        user_id = user.id
+        db.close()
+        return user_id, {"Authorization": f"Bearer {fastapi_app.create_access_token(user_id)}"}
+
+    return make
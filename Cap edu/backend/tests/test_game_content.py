@@ -0,0 +1,22 @@
+"""GET /games/{id}/content: отдельные ETag для gzip и распакованного тела"""
+
+
+def test_content_etag_depends_on_encoding(client, make_user):
+    _, admin = make_user(role="admin")
+    game = client.post(
+        "/games", json={"title": "Quiz", "category": "quiz", "content": {"questions": [1, 2, 3]}}, headers=admin
+    ).json()
+    url = f"/games/{game['id']}/content"
+
+    gzipped = client.get(url, headers={"Accept-Encoding": "gzip"})
+    plain = client.get(url, headers={"Accept-Encoding": "identity"})
+
+    assert gzipped.headers["etag"] == f'"{game["content_hash"]}-gz"'
+    assert plain.headers["etag"] == f'"{game["content_hash"]}"'
+    assert gzipped.headers["vary"] == plain.headers["vary"] == "Accept-Encoding"
+    assert gzipped.json() == plain.json() == {"questions": [1, 2, 3]}
+    # тег одного представления не подтверждает другое
+    revalidated = client.get(url, headers={"Accept-Encoding": "identity", "If-None-Match": gzipped.headers["etag"]})
+    assert revalidated.status_code == 200
+    not_modified = client.get(url, headers={"Accept-Encoding": "gzip", "If-None-Match": gzipped.headers["etag"]})
+    assert not_modified.status_code == 304
@@ -0,0 +1,38 @@
+"""Пакетная загрузка GPS точек: POST /locations/batch"""
+
+import fastapi_app
+from geo import thin_fixes
+from location_stream import StreamFull
+
+
+def test_thin_fixes_keeps_distinct_places_with_same_timestamp():
+    fixes = [(43.20, 76.90, 5.0, 1000.0), (43.30, 76.90, 5.0, 1000.0), (43.20, 76.90, 5.0, 1000.0)]
+    assert thin_fixes(fixes) == fixes[:2]
+
+
+def test_batch_without_timestamps_keeps_every_point(client, make_user):
+    _, headers = make_user()
+    # ~1 км между соседними точками, времени нет ни у одной
+    fixes = [[43.20 + i * 0.01, 76.90, 5.0, None] for i in range(3)]
+
+    response = client.post("/locations/batch", json={"fixes": fixes}, headers=headers)
+
+    assert response.status_code == 200
+    assert response.json() == {"received": 3, "stored": 3, "skipped": 0}
+    latest = client.get("/locations", headers=headers).json()
+    # порядок точек пакета сохраняется: последней записана последняя точка
+    assert [round(row["latitude"], 2) for row in latest] == [43.22, 43.21, 43.20]
+
+
+def test_sse_stream_full_returns_503(client, make_user, monkeypatch):
+    _, headers = make_user()
+
+    def full(child_ids):
+        raise StreamFull()
+
+    # предел достигнут уже после проверки в authorize_stream (другие запросы успели подписаться)
+    monkeypatch.setattr(fastapi_app.location_hub, "subscribe", full)
+    response = client.get("/locations/stream", headers=headers)
+
+    assert response.status_code == 503
+    assert response.headers["retry-after"] == "5"
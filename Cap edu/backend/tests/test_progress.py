@@ -0,0 +1,39 @@
+"""Атомарность POST /progress при одновременных отправках"""
+
+import random
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlalchemy import select
+
+from database import SessionLocal
+from models import Game, Progress
+
+REQUESTS = 200
+CONCURRENCY = 50
+
+
+def test_concurrent_results_keep_every_attempt(client, make_user):
+    user_id, headers = make_user()
+    db = SessionLocal()
+    game = Game(title="Hammer", category="quiz")
+    db.add(game)
+    db.commit()
+    game_id = game.id
+    db.close()
+    scores = [random.randint(0, 100) for _ in range(REQUESTS)]
+
+    def submit(score: int) -> int:
+        return client.post("/progress", json={"game_id": game_id, "score": score}, headers=headers).status_code
+
+    # TestClient передаёт запросы из потоков в один event loop приложения,
+    # поэтому upsert'ы действительно идут параллельно
+    with ThreadPoolExecutor(max_workers=CONCURRENCY) as pool:
+        statuses = list(pool.map(submit, scores))
+
+    assert statuses == [200] * REQUESTS
+    db = SessionLocal()
+    rows = db.scalars(select(Progress).where(Progress.user_id == user_id, Progress.game_id == game_id)).all()
+    db.close()
+    assert len(rows) == 1
+    assert rows[0].attempts == REQUESTS
+    assert rows[0].score == max(scores)
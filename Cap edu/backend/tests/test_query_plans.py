@@ -0,0 +1,122 @@
+"""
+Планы запросов endpoints с данными пользователей
+
+Заполняет progress, achievements, locations и analytics большим объёмом
+данных и проверяет EXPLAIN запроса каждого endpoint: полный проход по
+таблице или сортировка вместо индекса — ошибка
+"""
+
+import json
+import os
+import random
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import insert, select, text
+
+from database import engine, create_tables
+from fastapi_app import track_query
+from last_position import latest_query
+from models import User, Game, Progress, Achievement, Location, Analytics, ANALYTICS_GAME_ID
+
+USERS = 1000
+ROWS_PER_USER = 100
+START = datetime(2025, 1, 1)
+
+
+@pytest.fixture(scope="module")
+def seeded():
+    """id пользователей и игр, добавленных для проверки"""
+    create_tables()
+    prefix = f"plan{os.getpid()}-"
+    rng = random.Random(8)
+    with engine.begin() as conn:
+        conn.execute(insert(User), [
+            {"username": f"{prefix}{i}", "email": f"{prefix}{i}@example.com", "password_hash": "x"}
+            for i in range(USERS)
+        ])
+        user_ids = conn.scalars(select(User.id).where(User.username.startswith(prefix)).order_by(User.id)).all()
+        conn.execute(insert(Game), [{"title": f"{prefix}{i}", "category": "quiz"} for i in range(20)])
+        game_ids = conn.scalars(select(Game.id).where(Game.title.startswith(prefix)).order_by(Game.id)).all()
+        conn.execute(insert(Progress), [
+            {"user_id": user_id, "game_id": game_id, "score": rng.randint(0, 100)}
+            for user_id in user_ids for game_id in game_ids
+        ])
+        conn.execute(insert(Achievement), [
+            {"user_id": user_id, "title": "badge", "badge_type": "gold"}
+            for user_id in user_ids for _ in range(5)
+        ])
+        for user_id in user_ids:
+            moments = [START + timedelta(seconds=rng.randint(0, 90 * 86400)) for _ in range(ROWS_PER_USER)]
+            conn.execute(insert(Location), [
+                {"user_id": user_id, "latitude": 43.2, "longitude": 76.9, "timestamp": moment}
+                for moment in moments
+            ])
+            conn.execute(insert(Analytics), [
+                {
+                    "user_id": user_id,
+                    "event_type": "game_start",
+                    "event_data": {"game_id": moment.day % 20 + 1},
+                    "timestamp": moment
+                }
+                for moment in moments
+            ])
+        conn.execute(text("ANALYZE"))
+    return user_ids, game_ids
+
+
+def endpoint_queries(user_id: int, children: list, game_id: int) -> dict:
+    """Запросы в том виде, в каком их выполняют endpoints"""
+    return {
+        "GET /progress": select(Progress).where(Progress.user_id == user_id),
+        "GET /achievements": select(Achievement).where(Achievement.user_id == user_id),
+        "GET /locations": select(Location).where(Location.user_id == user_id).order_by(
+            Location.timestamp.desc()
+        ).limit(10),
+        "GET /locations/latest": latest_query(children),
+        "GET /locations/latest/batch (children)": select(User.id).where(User.parent_id == user_id).limit(20),
+        "GET /locations/track (access)": select(User.id, User.parent_id).where(User.id.in_(children[:1])),
+        "GET /locations/track": track_query(user_id, START + timedelta(days=10), START + timedelta(days=11)),
+        "analytics by user": select(Analytics).where(Analytics.user_id == user_id).order_by(
+            Analytics.timestamp
+        ).limit(100),
+        "GET /analytics/events": select(Analytics).order_by(
+            Analytics.timestamp.desc(), Analytics.id.desc()
+        ).limit(51),
+        "analytics by game_id": select(Analytics.id).where(ANALYTICS_GAME_ID == str(game_id)),
+    }
+
+
+def problems_sqlite(conn, sql: str) -> list:
+    rows = conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {sql}").all()
+    details = [row[-1] for row in rows]
+    return [
+        detail for detail in details
+        if (detail.startswith("SCAN") and "USING" not in detail) or "TEMP B-TREE" in detail
+    ]
+
+
+def problems_postgresql(conn, sql: str) -> list:
+    plan = conn.exec_driver_sql(f"EXPLAIN (FORMAT JSON) {sql}").scalar()
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    found = []
+
+    def walk(node):
+        if node["Node Type"] in ("Seq Scan", "Sort"):
+            found.append(f"{node['Node Type']} {node.get('Relation Name', '')}".strip())
+        for child in node.get("Plans", []):
+            walk(child)
+
+    walk(plan[0]["Plan"])
+    return found
+
+
+@pytest.mark.parametrize("name", list(endpoint_queries(0, [0], 0)))
+def test_query_uses_index(seeded, name):
+    user_ids, game_ids = seeded
+    query = endpoint_queries(user_ids[41], user_ids[100:103], game_ids[2])[name]
+    sql = str(query.compile(engine, compile_kwargs={"literal_binds": True}))
+    check = problems_postgresql if engine.dialect.name == "postgresql" else problems_sqlite
+    with engine.connect() as conn:
+        assert check(conn, sql) == []
@@ -0,0 +1,144 @@
+"""
+Отложенная запись счётчиков просмотров фильмов
+GET /films/{id} только увеличивает счётчик в памяти; фоновая задача
+периодически применяет накопленные приращения одним пакетом UPDATE
+"""
+
+import asyncio
+import os
+import uuid
+from collections import Counter
+from typing import Dict
+
+from sqlalchemy import update, bindparam, func
+
+from cache import RedisError, get_redis, mark_redis_down
+from database import async_engine
+from models import Film
+
+films = Film.__table__
+
+# views = views + :delta коммутативен, поэтому воркеры могут
+# применять свои приращения независимо, не теряя просмотров
+apply_deltas = (
+    update(films)
+    .where(films.c.id == bindparam("film_id"))
+    .values(views=func.coalesce(films.c.views, 0) + bindparam("delta"))
+)
+
+
+class ViewCounter:
+    """Буфер приращений Film.views с периодическим сбросом в БД"""
+
+    redis_key = "film_views:pending"
+
+    def __init__(self, interval: float = 5.0):
+        self.interval = interval
+        self._pending: Counter = Counter()
+        self._claimed = None  # забранный RENAME хэш, который ещё не прочитан
+        self._task = None
+        self._wakeup = None
+        self._stopping = False
+        self.flushes = 0
+        self.flushed_views = 0
+        self.failures = 0
+
+    @classmethod
+    def from_env(cls) -> "ViewCounter":
+        return cls(interval=float(os.getenv("VIEW_FLUSH_INTERVAL", "5")))
+
+    def increment(self, film_id: int, count: int = 1):
+        self._pending[film_id] += count
+
+    def pending(self, film_id: int) -> int:
+        """Просмотры этого воркера, ещё не записанные в БД"""
+        return self._pending.get(film_id, 0)
+
+    async def _collect(self) -> Dict[int, int]:
+        """Забрать накопленные приращения; с Redis — общие для всех воркеров"""
+        local, self._pending = self._pending, Counter()
+        redis = get_redis()
+        if redis is None:
+            return dict(local)
+
+        try:
+            if local:
+                pipe = redis.pipeline()
+                for film_id, delta in local.items():
+                    pipe.hincrby(self.redis_key, film_id, delta)
+                await pipe.execute()
+            local = Counter()
+            # Хэш, забранный при прошлом сбросе, который упал после RENAME,
+            # дочитывается раньше нового: иначе его приращения потеряются
+            if self._claimed is None:
+                claimed = f"{self.redis_key}:{uuid.uuid4().hex}"
+                # RENAME атомарен: хэш забирает ровно один воркер
+                await redis.rename(self.redis_key, claimed)
+                self._claimed = claimed
+            # Чтение и удаление в одной транзакции: приращения не посчитаются дважды
+            pipe = redis.pipeline()
+            pipe.hgetall(self._claimed)
+            pipe.delete(self._claimed)
+            raw, _ = await pipe.execute()
+            self._claimed = None
+        except RedisError as exc:
+            if "no such key" not in str(exc).lower():
+                mark_redis_down()
+            # Не отправленные в Redis приращения пишутся в БД напрямую
+            return dict(local)
+        return {int(film_id): int(delta) for film_id, delta in raw.items()}
+
+    async def flush(self) -> int:
+        deltas = await self._collect()
+        if not deltas:
+            return 0
+        try:
+            async with async_engine.begin() as conn:
+                await conn.execute(
+                    apply_deltas,
+                    [{"film_id": film_id, "delta": delta} for film_id, delta in deltas.items()]
+                )
+        except Exception:
+            # Вернуть приращения в буфер, чтобы записать их при следующем сбросе
+            self.failures += 1
+            self._pending.update(deltas)
+            raise
+        total = sum(deltas.values())
+        self.flushes += 1
+        self.flushed_views += total
+        return total
+
+    async def _run(self):
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.interval)
+            except asyncio.TimeoutError:
+                pass
+            try:
+                await self.flush()
+            except Exception as exc:
+                print(f"⚠️ Film views flush failed: {exc}")
+
+    def start(self):
+        if self._task is None:
+            self._stopping = False
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        """Остановить фоновую задачу и записать остаток"""
+        if self._task is not None:
+            # Не отменяем задачу: отмена посреди UPDATE потеряла бы приращения
+            self._stopping = True
+            self._wakeup.set()
+            await self._task
+            self._task = None
+        await self.flush()
+
+    def stats(self) -> dict:
+        return {
+            "pending": sum(self._pending.values()),
+            "flushes": self.flushes,
+            "flushed_views": self.flushed_views,
+            "failures": self.failures,
+        }